@@ -0,0 +1,187 @@
+from math import asin
+from math import atan2
+from math import ceil
+from math import cos
+from math import floor
+from math import hypot
+from math import pi
+from math import sin
+
+from polygon_split.canonical import CanonicalPolygon
+
+
+class SharedEdgeHash:
+    """
+    Hash map of polygon edges keyed on their supporting line.
+
+    Edge endpoints are quantised to the tolerance and every edge is registered
+    under (angle bucket, offset bucket) of its line. Edges of another polygon only
+    need to be compared with edges found under the same keys, and a match is
+    confirmed when the shorter edge lies within tolerance of the longer edge's
+    line and the two overlap by more than the tolerance. Touching at a single
+    point is therefore not a shared edge.
+
+    Offsets are measured along the normal of the bucket's central angle, so two
+    collinear edges produce the same offset for any common point regardless of
+    how far from the origin they are. Short edges, whose direction is uncertain
+    up to the tolerance, are registered under every angle bucket they could fall in.
+    """
+
+    ANGLE_BUCKET = 1e-2
+    NUM_ANGLE_BUCKETS = int(ceil(pi/ANGLE_BUCKET))
+
+    def __init__(self, id2Polygon={}, tolerance=1e-5):
+        self.tolerance = tolerance
+        self.key2Edges = {}
+
+        edges = []
+        for polyId, polygon in id2Polygon.items():
+            edges.extend(self._polygon_edges(polyId, polygon))
+
+        maxLength = max([edge[5] for edge in edges] or [0.0])
+        self.offsetBucket = 4*tolerance + maxLength*self.ANGLE_BUCKET
+
+        for edge in edges:
+            for key in self._edge_keys(edge):
+                self.key2Edges.setdefault(key, []).append(edge)
+
+    def shared_lengths(self, polygon, ownerId=None):
+        """
+        Returns a dictionary of {id: shared edge length} for the hashed polygons
+        that share an edge with polygon. Edges owned by ownerId are ignored.
+        """
+
+        id2Length = {}
+        for edge in self._polygon_edges(ownerId, polygon):
+
+            seenEdges = set()
+            for key in self._edge_keys(edge):
+                for otherEdge in self.key2Edges.get(key, ()):
+
+                    if otherEdge[0] == ownerId and ownerId is not None:
+                        continue
+                    if id(otherEdge) in seenEdges:
+                        continue
+                    seenEdges.add(id(otherEdge))
+
+                    overlap = self._overlap(edge, otherEdge)
+                    if overlap > self.tolerance:
+                        id2Length[otherEdge[0]] = id2Length.get(otherEdge[0], 0.0) + overlap
+
+        return id2Length
+
+    def _polygon_edges(self, polyId, polygon):
+        """
+        Returns edges (id, x1, y1, x2, y2, length) of all rings of a polygon.
+        Edges that are not longer than the tolerance can not be shared and are skipped.
+        """
+
+        if isinstance(polygon, CanonicalPolygon):
+            rings = polygon.__geo_interface__['coordinates']
+        else:
+            rings = [list(ring.coords) for ring in [polygon.exterior] + list(polygon.interiors)]
+
+        edges = []
+        for coords in rings:
+            for (x1, y1), (x2, y2) in zip(coords[:-1], coords[1:]):
+                length = hypot(x2 - x1, y2 - y1)
+                if length > self.tolerance:
+                    edges.append((polyId, x1, y1, x2, y2, length))
+
+        return edges
+
+    def _quantise(self, value):
+        return round(value/self.tolerance)*self.tolerance
+
+    def _edge_keys(self, edge):
+        """
+        Generates the hash keys an edge is registered or looked up under.
+        """
+
+        _, x1, y1, x2, y2, length = edge
+        x1, y1, x2, y2 = self._quantise(x1), self._quantise(y1), self._quantise(x2), self._quantise(y2)
+
+        angle = atan2(y2 - y1, x2 - x1) % pi
+        uncertainty = asin(min(1.0, 4*self.tolerance/length))
+
+        firstBucket = int(floor((angle - uncertainty)/self.ANGLE_BUCKET))
+        lastBucket = int(floor((angle + uncertainty)/self.ANGLE_BUCKET))
+        if lastBucket - firstBucket + 1 >= self.NUM_ANGLE_BUCKETS:
+            firstBucket, lastBucket = 0, self.NUM_ANGLE_BUCKETS - 1
+
+        keys = set()
+        for bucket in range(firstBucket, lastBucket + 1):
+            angleKey = bucket % self.NUM_ANGLE_BUCKETS
+            bucketAngle = (angleKey + 0.5)*self.ANGLE_BUCKET
+            normalX, normalY = -sin(bucketAngle), cos(bucketAngle)
+
+            offset1 = normalX*x1 + normalY*y1
+            offset2 = normalX*x2 + normalY*y2
+            firstOffset = int(floor(min(offset1, offset2)/self.offsetBucket)) - 1
+            lastOffset = int(floor(max(offset1, offset2)/self.offsetBucket)) + 1
+
+            for offsetKey in range(firstOffset, lastOffset + 1):
+                keys.add((angleKey, offsetKey))
+
+        return keys
+
+    def _overlap(self, edgeA, edgeB):
+        """
+        Returns the length of the collinear overlap of two edges, 0 if they are not collinear.
+        """
+
+        if edgeA[5] < edgeB[5]:
+            edgeA, edgeB = edgeB, edgeA
+
+        _, x1, y1, x2, y2, length = edgeA
+        dirX, dirY = (x2 - x1)/length, (y2 - y1)/length
+
+        params = []
+        for x, y in ((edgeB[1], edgeB[2]), (edgeB[3], edgeB[4])):
+            if abs(dirX*(y - y1) - dirY*(x - x1)) > self.tolerance:
+                return 0.0
+            params.append(dirX*(x - x1) + dirY*(y - y1))
+
+        return max(0.0, min(length, max(params)) - max(0.0, min(params)))
+
+
+def shared_edge_lengths(polygon, id2Polygon={}, tolerance=1e-5):
+    """
+    Computes the length of the boundary a polygon shares with each of the given polygons.
+
+    Params:
+        polygon: A shapely polygon or CanonicalPolygon.
+        id2Polygon: A dictionary of candidate polygons.
+        tolerance: Distance below which points are considered coincident.
+
+    Returns:
+        A dictionary {id: shared edge length} for candidates sharing an edge with polygon.
+    """
+
+    if not id2Polygon:
+        return {}
+
+    return SharedEdgeHash(id2Polygon, tolerance).shared_lengths(polygon)
+
+
+def compute_shared_edges(id2Polygon={}, tolerance=1e-5):
+    """
+    Computes shared edge lengths for all pairs of polygons with a single hash map.
+
+    Params:
+        id2Polygon: A dictionary of shapely polygons or CanonicalPolygon objects.
+        tolerance: Distance below which points are considered coincident.
+
+    Returns:
+        A dictionary {(idA, idB): shared edge length} with idA < idB.
+    """
+
+    edgeHash = SharedEdgeHash(id2Polygon, tolerance)
+
+    pair2Length = {}
+    for polyId, polygon in id2Polygon.items():
+        for otherId, length in edgeHash.shared_lengths(polygon, ownerId=polyId).items():
+            if polyId < otherId:
+                pair2Length[(polyId, otherId)] = length
+
+    return pair2Length
@@ -0,0 +1,479 @@
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy as np
+from shapely.geometry import Point
+from shapely.geometry import Polygon
+
+
+def position_coords(position):
+    """
+    Returns (x, y) of a robot position given as a shapely Point or a coordinate pair.
+    """
+
+    if hasattr(position, 'coords'):
+        return tuple(position.coords[0][:2])
+
+    return tuple(position[:2])
+
+
+def polygon_rings(polygon):
+    """
+    Returns coordinates of the exterior followed by the interiors as (K, 2) arrays
+    without the closing point.
+    """
+
+    rings = [polygon.exterior] + list(polygon.interiors)
+    return [np.asarray(ring.coords, dtype=np.float64)[:-1, :2] for ring in rings]
+
+
+class DictCellStore:
+    """
+    Default storage of the cells of a decomposition: one dictionary per attribute.
+
+    The dictionaries are exposed directly as id2Polygon, id2Position, id2Cost,
+    id2Adjacent and id2SharedLength.
+    """
+
+    def __init__(self):
+        self.id2Polygon = {}
+        self.id2Position = {}
+        self.id2Cost = {}
+        self.id2Adjacent = {}
+        self.id2SharedLength = {}
+
+    def add_cell(self, polyId, polygon, position, cost):
+        self.id2Polygon[polyId] = polygon
+        self.id2Position[polyId] = position
+        self.id2Cost[polyId] = cost
+        self.id2Adjacent[polyId] = []
+        self.id2SharedLength[polyId] = {}
+
+    def set_polygon(self, polyId, polygon):
+        self.id2Polygon[polyId] = polygon
+
+    def link(self, polyIdA, polyIdB, length):
+        """
+        Record that two cells share an edge of the given length.
+        """
+
+        self.id2Adjacent[polyIdA].append(polyIdB)
+        self.id2Adjacent[polyIdB].append(polyIdA)
+        self.id2SharedLength[polyIdA][polyIdB] = length
+        self.id2SharedLength[polyIdB][polyIdA] = length
+
+    def compact(self):
+        """
+        Nothing to compact, the dictionaries only hold live cells.
+        """
+
+        pass
+
+    def cell_state(self, polyId):
+        """
+        Returns (polygon, position, cost, [(adjacent id, shared length)]) of a cell.
+        """
+
+        sharedLengths = self.id2SharedLength[polyId]
+        return (self.id2Polygon[polyId], self.id2Position[polyId], self.id2Cost[polyId],
+                [(adjPolyId, sharedLengths[adjPolyId]) for adjPolyId in self.id2Adjacent[polyId]])
+
+    def restore_cell(self, polyId, state):
+        """
+        Puts a cell back as returned by cell_state(), or drops it if state is None.
+        Adjacency of the other cells is left as it is.
+        """
+
+        if polyId in self.id2Polygon:
+            for cells in (self.id2Polygon, self.id2Position, self.id2Cost, self.id2Adjacent, self.id2SharedLength):
+                del cells[polyId]
+
+        if state is not None:
+            polygon, position, cost, neighbours = state
+            self.add_cell(polyId, polygon, position, cost)
+            self.id2Adjacent[polyId] = [adjPolyId for adjPolyId, _ in neighbours]
+            self.id2SharedLength[polyId] = dict(neighbours)
+
+    def export_arrays(self):
+        """
+        Returns the cells as flat arrays, see ArrayCellStore.export_arrays().
+        """
+
+        polyIds = sorted(self.id2Polygon.keys())
+
+        rings = [polygon_rings(self.id2Polygon[polyId]) for polyId in polyIds]
+        ringLengths = [len(ring) for cellRings in rings for ring in cellRings]
+        adjacent = [self.id2Adjacent[polyId] for polyId in polyIds]
+
+        return {'ids': np.array(polyIds, dtype=np.int64),
+                'positions': np.array([position_coords(self.id2Position[polyId]) for polyId in polyIds], dtype=np.float64).reshape(-1, 2),
+                'costs': np.array([self.id2Cost[polyId] for polyId in polyIds], dtype=np.float64),
+                'cellRingOffsets': np.concatenate(([0], np.cumsum([len(cellRings) for cellRings in rings]))).astype(np.int64),
+                'ringOffsets': np.concatenate(([0], np.cumsum(ringLengths))).astype(np.int64),
+                'coords': np.concatenate([ring for cellRings in rings for ring in cellRings] or [np.empty((0, 2))]),
+                'adjIndptr': np.concatenate(([0], np.cumsum([len(adjIds) for adjIds in adjacent]))).astype(np.int64),
+                'adjIndices': np.array([adjPolyId for adjIds in adjacent for adjPolyId in adjIds], dtype=np.int64),
+                'adjLengths': np.array([self.id2SharedLength[polyId][adjPolyId] for polyId, adjIds in zip(polyIds, adjacent) for adjPolyId in adjIds], dtype=np.float64)}
+
+    def load_arrays(self, arrays):
+        """
+        Replaces the content of the store with cells given as flat arrays.
+        """
+
+        arrayStore = ArrayCellStore()
+        arrayStore.load_arrays(arrays)
+
+        for cells in (self.id2Polygon, self.id2Position, self.id2Cost, self.id2Adjacent, self.id2SharedLength):
+            cells.clear()
+
+        for polyId in arrayStore.id2Slot:
+            self.id2Polygon[polyId] = arrayStore.polygon(polyId)
+            self.id2Position[polyId] = arrayStore.position(polyId)
+            self.id2Cost[polyId] = arrayStore.cost(polyId)
+            self.id2Adjacent[polyId] = arrayStore.adjacent(polyId)
+            self.id2SharedLength[polyId] = arrayStore.shared_lengths(polyId)
+
+    def remove_cell(self, polyId):
+        for adjPolyId in self.id2Adjacent[polyId]:
+            self.id2Adjacent[adjPolyId].remove(polyId)
+            del self.id2SharedLength[adjPolyId][polyId]
+
+        del self.id2Polygon[polyId]
+        del self.id2Position[polyId]
+        del self.id2Cost[polyId]
+        del self.id2Adjacent[polyId]
+        del self.id2SharedLength[polyId]
+
+
+class _CellView(Mapping):
+    """
+    Read-only dictionary-like view of one attribute of an ArrayCellStore.
+    """
+
+    def __init__(self, store, getter):
+        self._store = store
+        self._getter = getter
+
+    def __getitem__(self, polyId):
+        if polyId not in self._store.id2Slot:
+            raise KeyError(polyId)
+        return self._getter(polyId)
+
+    def __contains__(self, polyId):
+        return polyId in self._store.id2Slot
+
+    def __iter__(self):
+        return iter(self._store.id2Slot)
+
+    def __len__(self):
+        return len(self._store.id2Slot)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class ArrayCellStore:
+    """
+    Struct-of-arrays storage of the cells of a decomposition.
+
+    Coordinates of all rings live in one float64 buffer, rings are delimited by
+    ringOffsets and every cell refers to a run of consecutive rings. Costs and robot
+    positions are float64 arrays indexed by slot, adjacency is kept in CSR form
+    (adjIndptr, adjIndices, adjLengths) plus a small log of links added and removed
+    since the last compaction.
+
+    Shapely geometries are only built when a cell is accessed through the
+    id2Polygon view. Slots and coordinates of removed cells are reclaimed by compact(),
+    which runs automatically once more than half of the storage is garbage or the log
+    holds more links than the CSR arrays.
+    """
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self):
+        self.coords = np.empty((4*self.INITIAL_CAPACITY, 2))
+        self.numCoords = 0
+        self.ringOffsets = np.zeros(self.INITIAL_CAPACITY + 1, dtype=np.int64)
+        self.numRings = 0
+
+        self.slotIds = np.empty(self.INITIAL_CAPACITY, dtype=np.int64)
+        self.cellRings = np.empty((self.INITIAL_CAPACITY, 2), dtype=np.int64)
+        self.costs = np.empty(self.INITIAL_CAPACITY)
+        self.positions = np.empty((self.INITIAL_CAPACITY, 2))
+        self.numSlots = 0
+        self.id2Slot = {}
+
+        self.adjIndptr = np.zeros(1, dtype=np.int64)
+        self.adjIndices = np.empty(0, dtype=np.int64)
+        self.adjLengths = np.empty(0)
+        self.addedAdjacency = {}
+        self.numAddedLinks = 0
+        self.removedAdjacency = {}
+        self.numRemovedLinks = 0
+
+        self.garbageCoords = 0
+
+        self.id2Polygon = _CellView(self, self.polygon)
+        self.id2Position = _CellView(self, self.position)
+        self.id2Cost = _CellView(self, self.cost)
+        self.id2Adjacent = _CellView(self, self.adjacent)
+        self.id2SharedLength = _CellView(self, self.shared_lengths)
+
+    def polygon(self, polyId):
+        """
+        Builds the shapely polygon of a cell from the coordinate buffer.
+        """
+
+        firstRing, numRings = self.cellRings[self.id2Slot[polyId]]
+        rings = [self.coords[self.ringOffsets[ring]:self.ringOffsets[ring + 1]] for ring in range(firstRing, firstRing + numRings)]
+
+        return Polygon(rings[0], rings[1:])
+
+    def position(self, polyId):
+        return Point(self.positions[self.id2Slot[polyId]])
+
+    def cost(self, polyId):
+        return float(self.costs[self.id2Slot[polyId]])
+
+    def adjacent(self, polyId):
+        return [adjPolyId for adjPolyId, _ in self._neighbours(polyId)]
+
+    def shared_lengths(self, polyId):
+        return dict(self._neighbours(polyId))
+
+    def add_cell(self, polyId, polygon, position, cost):
+        slot = self.numSlots
+        if slot == len(self.slotIds):
+            self.slotIds = self._grow(self.slotIds, slot + 1)
+            self.cellRings = self._grow(self.cellRings, slot + 1)
+            self.costs = self._grow(self.costs, slot + 1)
+            self.positions = self._grow(self.positions, slot + 1)
+
+        self.numSlots += 1
+        self.id2Slot[polyId] = slot
+        self.slotIds[slot] = polyId
+        self.costs[slot] = cost
+        self.positions[slot] = position_coords(position)
+        self.cellRings[slot] = self._append_rings(polygon)
+
+    def set_polygon(self, polyId, polygon):
+        slot = self.id2Slot[polyId]
+        self.garbageCoords += self._ring_coords_count(slot)
+        self.cellRings[slot] = self._append_rings(polygon)
+
+        self._maybe_compact()
+
+    def link(self, polyIdA, polyIdB, length):
+        """
+        Record that two cells share an edge of the given length.
+        """
+
+        for polyId, adjPolyId in ((polyIdA, polyIdB), (polyIdB, polyIdA)):
+            self.addedAdjacency.setdefault(polyId, []).append((adjPolyId, length))
+        self.numAddedLinks += 2
+
+        self._maybe_compact()
+
+    def remove_cell(self, polyId):
+        for adjPolyId, _ in self._neighbours(polyId):
+            self._unlink(polyId, adjPolyId)
+            self._unlink(adjPolyId, polyId)
+
+        self._drop_slot(polyId)
+        self._maybe_compact()
+
+    def cell_state(self, polyId):
+        """
+        Returns (polygon, position, cost, [(adjacent id, shared length)]) of a cell.
+        """
+
+        return (self.polygon(polyId), self.position(polyId), self.cost(polyId), self._neighbours(polyId))
+
+    def restore_cell(self, polyId, state):
+        """
+        Puts a cell back as returned by cell_state(), or drops it if state is None.
+        Adjacency of the other cells is left as it is.
+        """
+
+        if polyId in self.id2Slot:
+            self._drop_slot(polyId)
+
+        # A new slot has no CSR row, so the whole adjacency goes to the log.
+        if state is not None:
+            polygon, position, cost, neighbours = state
+            self.add_cell(polyId, polygon, position, cost)
+            self.addedAdjacency[polyId] = list(neighbours)
+            self.numAddedLinks += len(neighbours)
+
+        self._maybe_compact()
+
+    def compact(self):
+        """
+        Rewrites the buffers so they only hold live cells and folds the adjacency log
+        into the CSR arrays. Slots keep their relative order.
+        """
+
+        slots = np.sort(np.array(list(self.id2Slot.values()), dtype=np.int64))
+        polyIds = self.slotIds[slots]
+
+        coords = []
+        ringOffsets = [0]
+        cellRings = np.empty((len(slots), 2), dtype=np.int64)
+        for newSlot, slot in enumerate(slots):
+            firstRing, numRings = self.cellRings[slot]
+            cellRings[newSlot] = (len(ringOffsets) - 1, numRings)
+            for ring in range(firstRing, firstRing + numRings):
+                coords.append(self.coords[self.ringOffsets[ring]:self.ringOffsets[ring + 1]])
+                ringOffsets.append(ringOffsets[-1] + len(coords[-1]))
+
+        neighbours = [self._neighbours(polyId) for polyId in polyIds]
+        adjIndptr = np.zeros(len(slots) + 1, dtype=np.int64)
+        adjIndptr[1:] = np.cumsum([len(adjacent) for adjacent in neighbours])
+
+        self.coords = np.concatenate(coords) if coords else np.empty((0, 2))
+        self.numCoords = len(self.coords)
+        self.ringOffsets = np.array(ringOffsets, dtype=np.int64)
+        self.numRings = len(ringOffsets) - 1
+        self.slotIds = polyIds
+        self.cellRings = cellRings
+        self.costs = self.costs[slots]
+        self.positions = self.positions[slots]
+        self.numSlots = len(slots)
+        self.id2Slot = dict((polyId, slot) for slot, polyId in enumerate(polyIds.tolist()))
+
+        self.adjIndptr = adjIndptr
+        self.adjIndices = np.array([adjPolyId for adjacent in neighbours for adjPolyId, _ in adjacent], dtype=np.int64)
+        self.adjLengths = np.array([length for adjacent in neighbours for _, length in adjacent], dtype=np.float64)
+        self.addedAdjacency = {}
+        self.numAddedLinks = 0
+        self.removedAdjacency = {}
+        self.numRemovedLinks = 0
+        self.garbageCoords = 0
+
+    def export_arrays(self):
+        """
+        Returns the cells as flat arrays, compacting the store first.
+
+        Returns:
+            A dictionary of arrays: ids, positions (N, 2), costs, cellRingOffsets (N + 1,
+            rings of cell i are cellRingOffsets[i]:cellRingOffsets[i + 1]), ringOffsets,
+            coords (C, 2) and the CSR adjacency adjIndptr, adjIndices and adjLengths.
+        """
+
+        self.compact()
+
+        return {'ids': self.slotIds,
+                'positions': self.positions,
+                'costs': self.costs,
+                'cellRingOffsets': np.append(self.cellRings[:, 0], self.numRings).astype(np.int64),
+                'ringOffsets': self.ringOffsets,
+                'coords': self.coords,
+                'adjIndptr': self.adjIndptr,
+                'adjIndices': self.adjIndices,
+                'adjLengths': self.adjLengths}
+
+    def load_arrays(self, arrays):
+        """
+        Replaces the content of the store with cells given as flat arrays, see export_arrays().
+        The arrays are used as they are, so memory mapped arrays are not read until accessed.
+        """
+
+        cellRingOffsets = np.asarray(arrays['cellRingOffsets'])
+
+        self.slotIds = arrays['ids']
+        self.positions = arrays['positions']
+        self.costs = arrays['costs']
+        self.cellRings = np.column_stack((cellRingOffsets[:-1], np.diff(cellRingOffsets))).astype(np.int64)
+        self.numSlots = len(self.slotIds)
+        self.id2Slot = dict((polyId, slot) for slot, polyId in enumerate(np.asarray(self.slotIds).tolist()))
+
+        self.ringOffsets = arrays['ringOffsets']
+        self.numRings = len(self.ringOffsets) - 1
+        self.coords = arrays['coords']
+        self.numCoords = len(self.coords)
+
+        self.adjIndptr = arrays['adjIndptr']
+        self.adjIndices = arrays['adjIndices']
+        self.adjLengths = arrays['adjLengths']
+        self.addedAdjacency = {}
+        self.numAddedLinks = 0
+        self.removedAdjacency = {}
+        self.numRemovedLinks = 0
+        self.garbageCoords = 0
+
+    def _neighbours(self, polyId):
+        """
+        Returns [(adjacent id, shared length)] in the order the links were made.
+        """
+
+        slot = self.id2Slot[polyId]
+
+        neighbours = []
+        removed = self.removedAdjacency.get(polyId, ())
+        if slot < len(self.adjIndptr) - 1:
+            start, end = self.adjIndptr[slot], self.adjIndptr[slot + 1]
+            for adjPolyId, length in zip(self.adjIndices[start:end].tolist(), self.adjLengths[start:end].tolist()):
+                if adjPolyId not in removed:
+                    neighbours.append((adjPolyId, length))
+
+        neighbours.extend(self.addedAdjacency.get(polyId, ()))
+
+        return neighbours
+
+    def _drop_slot(self, polyId):
+        slot = self.id2Slot.pop(polyId)
+        self.garbageCoords += self._ring_coords_count(slot)
+        self.numAddedLinks -= len(self.addedAdjacency.pop(polyId, ()))
+        self.numRemovedLinks -= len(self.removedAdjacency.pop(polyId, ()))
+
+    def _unlink(self, polyId, adjPolyId):
+        added = self.addedAdjacency.get(polyId, [])
+        for idx, (otherId, _) in enumerate(added):
+            if otherId == adjPolyId:
+                del added[idx]
+                self.numAddedLinks -= 1
+                return
+
+        removed = self.removedAdjacency.setdefault(polyId, set())
+        if adjPolyId not in removed:
+            removed.add(adjPolyId)
+            self.numRemovedLinks += 1
+
+    def _append_rings(self, polygon):
+        ringCoords = polygon_rings(polygon)
+        numNewCoords = sum(len(coords) for coords in ringCoords)
+
+        if self.numCoords + numNewCoords > len(self.coords):
+            self.coords = self._grow(self.coords, self.numCoords + numNewCoords)
+        if self.numRings + len(ringCoords) + 1 > len(self.ringOffsets):
+            self.ringOffsets = self._grow(self.ringOffsets, self.numRings + len(ringCoords) + 1)
+
+        firstRing = self.numRings
+        for coords in ringCoords:
+            self.coords[self.numCoords:self.numCoords + len(coords)] = coords
+            self.numCoords += len(coords)
+            self.numRings += 1
+            self.ringOffsets[self.numRings] = self.numCoords
+
+        return firstRing, len(ringCoords)
+
+    def _ring_coords_count(self, slot):
+        firstRing, numRings = self.cellRings[slot]
+        return self.ringOffsets[firstRing + numRings] - self.ringOffsets[firstRing]
+
+    def _maybe_compact(self):
+        numDeadSlots = self.numSlots - len(self.id2Slot)
+        numPendingLinks = self.numRemovedLinks + self.numAddedLinks
+
+        if numDeadSlots > max(self.INITIAL_CAPACITY, len(self.id2Slot)) or \
+           self.garbageCoords > max(4*self.INITIAL_CAPACITY, self.numCoords//2) or \
+           numPendingLinks > max(self.INITIAL_CAPACITY, len(self.adjIndices)):
+            self.compact()
+
+    def _grow(self, array, minSize):
+        newShape = (max(minSize, 2*len(array)),) + array.shape[1:]
+        grown = np.empty(newShape, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
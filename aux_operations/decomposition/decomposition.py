@@ -1,8 +1,27 @@
 import logging
 
-from shapely.geometry import Point
+import numpy as np
 from shapely.geometry import Polygon
-from shapely.ops import nearest_points
+from shapely.ops import unary_union
+
+from adjacency import shared_edge_lengths
+from cell_store import ArrayCellStore
+from cell_store import DictCellStore
+from journal import ADDED
+from journal import LINKED
+from journal import REMOVED
+from journal import RESNAPPED
+from journal import ChangeJournal
+from snapping import deduplicate
+from snapping import ring_parameters
+from snapping import snap_points
+from sorted_costs import SortedCosts
+from spatial_index import SpatialIndex
+from prepared_cache import PreparedCache
+from serialization import read_snapshot
+from snapshot import Snapshot
+from serialization import write_snapshot
+from instrumentation import profiling
 
 # Configure logging properties for this module
 logger = logging.getLogger("global_optimizer")
@@ -18,17 +37,18 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 #fileHandler.setFormatter(formatter)
 streamHandler.setFormatter(formatter)
 
-logger.setLevel(logging.DEBUG)
+logger.setLevel(logging.INFO)
 
 
 class Decomposition:
 
     PROXIMITY_THRESHOLD = 1e-5
+    PREPARED_CACHE_SIZE = 4096
     """
     Decomposition class for efficient representation of a decomposition.
 
     Supports the following operations:
-    1: Add polygon to the decomposition
+    1: Add polygon to the decomposition (or a batch of polygons at once)
     2: Returns a polygon representation associated with an id.
     3: Returns cost for a polygon.
     4. Returns highest cost in the decomposition.
@@ -40,22 +60,106 @@ class Decomposition:
     Behind the scenes, does the following:
     1. Upon addition of polygon, assigns a unique id.
     2. Upon addition of polygon, computes a metric.
-    3. Upon addition of polygon, computes and updates adjacency relations.
+    3. Upon addition of polygon, computes and updates adjacency relations. Polygons are
+        adjacent if they share an edge, the shared edge length is kept in id2SharedLength.
+    4. Keeps a spatial index of cell envelopes so that snapping and adjacency
+        only consider cells within PROXIMITY_THRESHOLD of the new polygon.
+        Proximity tests use prepared geometries of the cells cached in preparedCache.
+    5. Keeps costs in an order-statistics structure (sortedCosts) keyed on (cost, id).
+
+    Storage:
+    Cells are kept in a cell store (see cell_store.py). The default 'dict' backend keeps
+    one dictionary per attribute. The 'array' backend keeps coordinates, costs, positions
+    and adjacency in contiguous numpy arrays and builds shapely geometries on access.
+    Either way id2Polygon, id2Position, id2Cost, id2Adjacent and id2SharedLength can be
+    read like dictionaries, all changes go through the cell store.
+
+    Snapshots:
+    save() writes the cells, adjacency, costs, envelopes and the id counter to a binary
+    file. load() memory maps such a file and restores the decomposition without snapping,
+    computing the metric or adjacency again.
+
+    Speculative changes:
+    snapshot() returns a handle that can later be committed or discarded. Only cells
+    changed while a snapshot is open are copied (see snapshot.py).
+
+    Change journal:
+    Every change of a cell is appended to journal (see journal.py) with an increasing
+    version. journal.changes_since(version) lists what changed since a consumer last
+    looked, apply_changes() replays such changes onto another decomposition, e.g. one
+    restored with load() from a snapshot saved at that version.
 
     Restrictions:
     1. Only valid and simple polygons are allowed
 
     """
 
-    def __init__(self, metric=[]):
+    BACKENDS = {'dict': DictCellStore, 'array': ArrayCellStore}
+
+    def __init__(self, metric=[], backend='dict'):
+        if backend not in self.BACKENDS:
+            raise ValueError("Unknown decomposition backend: %s" % (backend,))
+
         self.metric = metric
         self.idCounter = 0
-        self.id2Polygon = {}
-        self.id2Position = {}
-        self.id2Cost = {}
-        self.id2Adjacent = {}
-        self.sortedCosts = []
+        self.cellStore = self.BACKENDS[backend]()
+        self.id2Polygon = self.cellStore.id2Polygon
+        self.id2Position = self.cellStore.id2Position
+        self.id2Cost = self.cellStore.id2Cost
+        self.id2Adjacent = self.cellStore.id2Adjacent
+        self.id2SharedLength = self.cellStore.id2SharedLength
+        self.sortedCosts = SortedCosts()
+        self.spatialIndex = SpatialIndex()
+        self.snapshots = []
+        self.journal = ChangeJournal()
+        self.preparedCache = PreparedCache(self.PREPARED_CACHE_SIZE)
+
+    def save(self, path):
+        """
+        Write a binary snapshot of the decomposition to path.
+        """
+
+        arrays = self.cellStore.export_arrays()
+        arrays['bounds'] = np.array([self.spatialIndex.id2Bounds[polyId] for polyId in np.asarray(arrays['ids']).tolist()],
+                                    dtype=np.float64).reshape(-1, 4)
+
+        write_snapshot(path, arrays, {'idCounter': self.idCounter,
+                                      'cellSize': self.spatialIndex.cellSize,
+                                      'journalVersion': self.journal.version})
+
+    @classmethod
+    def load(cls, path, metric=[], backend='array'):
+        """
+        Restore a decomposition from a snapshot written by save().
+
+        With the 'array' backend the cells stay in the memory mapped file until they are
+        accessed or modified.
+
+        Params:
+            path: Snapshot file.
+            metric: Metric used for cells added after loading.
+            backend: Cell storage of the restored decomposition.
 
+        Returns:
+            A new Decomposition.
+        """
+
+        arrays, attributes = read_snapshot(path)
+
+        decomposition = cls(metric, backend)
+        decomposition.idCounter = attributes['idCounter']
+        decomposition.journal = ChangeJournal(attributes.get('journalVersion', 0))
+        decomposition.cellStore.load_arrays(arrays)
+
+        polyIds = np.asarray(arrays['ids']).tolist()
+        decomposition.sortedCosts.load(polyIds, np.asarray(arrays['costs']).tolist())
+
+        decomposition.spatialIndex = SpatialIndex(attributes['cellSize'])
+        decomposition.spatialIndex.insert_many(zip(polyIds, np.asarray(arrays['bounds']).tolist()))
+
+        return decomposition
+
+    @profiling.timed('decomposition.add_polygon')
     def add_polygon(self, polygon=[], robotPosition=[]):
         """
         Add polygon to the decomposition
@@ -70,66 +174,382 @@ class Decomposition:
         polygonId = self.idCounter
         self.idCounter += 1
 
-        # Add the polygon to the dictionary
-        self.id2Polygon[polygonId] = snappedPolygon
-        self.id2Position[polygonId] = robotPosition
-
-        # Compute and record the metric of the polygon
-        self.id2Cost[polygonId] = self.metric.compute(polygon=snappedPolygon, initialPosition=robotPosition)
+        # Compute the metric of the polygon and record the cell
+        cost = self.metric.compute(polygon=snappedPolygon, initialPosition=robotPosition)
+        self._add_cell(polygonId, snappedPolygon, robotPosition, cost)
 
         # Update adjacency dictionary
-        self.id2Adjacent[polygonId] = []
         self._update_adjacency(polygonId)
 
         # Insert the cost into the sort list
         self._insert_cost(polygonId)
 
-        logger.debug("Decomp. dictionary is: {}".format(self.id2Polygon))
-        logger.debug("Adjacency dictionary is: {}".format(self.id2Adjacent))
+        logger.debug("Added cell %d adjacent to %s.", polygonId, self.id2Adjacent[polygonId])
 
         return polygonId
 
+    @profiling.timed('decomposition.add_polygons')
+    def add_polygons(self, polygons=[]):
+        """
+        Add a batch of polygons to the decomposition.
+
+        Equivalent to calling add_polygon for every (polygon, robotPosition) pair in order,
+        but builds the adjacency relations for the whole batch in a single sweep over the
+        spatial index once all polygons were snapped, and does not log the whole decomposition
+        per polygon.
+
+        Params:
+            polygons: A list of (polygon, robotPosition) pairs.
+
+        Returns:
+            A list of ids assigned to the polygons, -1 for polygons that were rejected.
+        """
+
+        newPolyIds = []
+        for polygon, robotPosition in polygons:
+
+            if not polygon.is_valid or not polygon.is_simple:
+                newPolyIds.append(-1)
+                continue
+
+            snappedPolygon = self._snap_to_environment(polygon)
+
+            polygonId = self.idCounter
+            self.idCounter += 1
+
+            cost = self.metric.compute(polygon=snappedPolygon, initialPosition=robotPosition)
+            self._add_cell(polygonId, snappedPolygon, robotPosition, cost)
+
+            newPolyIds.append(polygonId)
+
+        # Single sweep over the new polygons. Each pair is only checked once.
+        addedPolyIds = set(newPolyIds)
+        addedPolyIds.discard(-1)
+
+        newLinks = []
+        for polygonId in sorted(addedPolyIds):
+            polygonDef = self.id2Polygon[polygonId]
+
+            candidateIds = [polyId for polyId in self._nearby_ids(polygonDef)
+                            if polyId != polygonId and (polyId not in addedPolyIds or polyId > polygonId)]
+
+            for polyId, length in self._shared_edges(polygonDef, candidateIds).items():
+                newLinks.append((max(polyId, polygonId), min(polyId, polygonId), length))
+
+        # Link in the order sequential insertion would, so adjacency lists come out the same.
+        for newerPolyId, olderPolyId, length in sorted(newLinks):
+            self._link(newerPolyId, olderPolyId, length)
+
+        for polygonId in sorted(addedPolyIds):
+            self._insert_cost(polygonId)
+
+        # Fold the links of the batch into the compact adjacency at once.
+        self.cellStore.compact()
+
+        logger.debug("Added %d polygons to decomp. in bulk.", len(addedPolyIds))
+
+        return newPolyIds
+
     def remove_polygon(self, polygonId):
         """
         Remove polygon from the decomposition
         Returns True if remove was succseful
         """
 
-        if polygonId not in self.id2Polygon.keys():
+        if polygonId not in self.id2Polygon:
             return False
 
-        del self.id2Polygon[polygonId]
-        del self.id2Position[polygonId]
-        del self.id2Cost[polygonId]
+        self._touch(polygonId)
+        for adjPolyId in self.id2Adjacent[polygonId]:
+            self._touch(adjPolyId)
+        self.preparedCache.invalidate(polygonId)
+
+        # Drops the cell together with its adjacency relations
+        self.cellStore.remove_cell(polygonId)
+        self.journal.record(REMOVED, polygonId)
+        self.spatialIndex.remove(polygonId)
 
-        # Remove the polygonId from the sorted list. Should only have unique values in here.
+        # Remove the polygonId from the sorted costs. Should only have unique values in here.
         self.sortedCosts.remove(polygonId)
 
-        adjacentPolygonIds = self.id2Adjacent[polygonId]
-        for adjPolyId in adjacentPolygonIds:
-            self.id2Adjacent[adjPolyId].remove(polygonId)
+        return True
 
-        del self.id2Adjacent[polygonId]
+    @profiling.timed('decomposition.replace_cells')
+    def replace_cells(self, oldIds=[], newCells=[]):
+        """
+        Replace a set of cells with a new set of cells covering the same region.
 
-        return True
+        Used after re-cutting adjacent cells: the union of the cells does not change, so
+        the rest of the decomposition does not need to be snapped again. The new polygons
+        are only snapped to the boundary of the old cells, and adjacency is only computed
+        against the neighbours of the old cells and among the new cells.
 
-    def _insert_cost(self, newPolyId):
+        The replacement is all-or-nothing. Everything is validated and computed before the
+        decomposition is touched, so a rejected replacement leaves it unchanged.
+
+        Params:
+            oldIds: Ids of the cells to be replaced.
+            newCells: A list of (polygon, robotPosition) pairs covering the old cells.
+
+        Returns:
+            A list of ids of the new cells, None if the replacement was rejected.
+        """
+
+        oldIds = list(oldIds)
+        if not oldIds or len(set(oldIds)) != len(oldIds):
+            return None
+        if any(polyId not in self.id2Polygon for polyId in oldIds):
+            return None
+        if any(not polygon.is_valid or not polygon.is_simple for polygon, _ in newCells):
+            return None
+
+        # New cells must cover the same region, up to a band of PROXIMITY_THRESHOLD along the boundary.
+        # Matching areas are checked first, they reject most bad replacements cheaply. Cells that
+        # overlap each other or leave a gap of the same area are caught by comparing the regions.
+        oldPolygons = [self.id2Polygon[polyId] for polyId in oldIds]
+        newPolygons = [polygon for polygon, _ in newCells]
+        oldArea = sum(polygon.area for polygon in oldPolygons)
+        areaTolerance = self.PROXIMITY_THRESHOLD*sum(polygon.length for polygon in oldPolygons)
+        if abs(sum(polygon.area for polygon in newPolygons) - oldArea) > areaTolerance:
+            return None
+        if unary_union(newPolygons).symmetric_difference(unary_union(oldPolygons)).area > areaTolerance:
+            return None
+
+        neighbourIds = set()
+        for polyId in oldIds:
+            neighbourIds.update(self.id2Adjacent[polyId])
+        neighbourIds.difference_update(oldIds)
+
+        # Compute everything the new cells need without modifying the decomposition.
+        newPolyIds = range(self.idCounter, self.idCounter + len(newCells))
+        id2NewPolygon = {}
+        id2NewCost = {}
+        newLinks = []
+        for polygonId, (polygon, robotPosition) in zip(newPolyIds, newCells):
+            snappedPolygon = self._snap_to_cells(polygon, oldIds)
+
+            id2NewPolygon[polygonId] = snappedPolygon
+            id2NewCost[polygonId] = self.metric.compute(polygon=snappedPolygon, initialPosition=robotPosition)
+
+            candidates = dict((polyId, self.preparedCache.get(polyId, self.id2Polygon)[0]) for polyId in neighbourIds)
+            candidates.update((polyId, id2NewPolygon[polyId]) for polyId in newPolyIds if polyId < polygonId)
+
+            sharedEdges = shared_edge_lengths(snappedPolygon, candidates, self.PROXIMITY_THRESHOLD)
+            for polyId in sorted(sharedEdges.keys()):
+                newLinks.append((polygonId, polyId, sharedEdges[polyId]))
+
+        # Apply the replacement.
+        for polyId in oldIds:
+            self.remove_polygon(polyId)
+
+        for polygonId, (_, robotPosition) in zip(newPolyIds, newCells):
+            self._add_cell(polygonId, id2NewPolygon[polygonId], robotPosition, id2NewCost[polygonId])
+            self._insert_cost(polygonId)
+        self.idCounter += len(newCells)
+
+        for polygonId, polyId, length in newLinks:
+            self._link(polygonId, polyId, length)
+
+        logger.debug("Replaced cells %s with %s.", oldIds, newPolyIds)
+
+        return newPolyIds
+
+    def apply_changes(self, changes=[]):
         """
-        Function for inserting in a sorted manner cost into the sorted array of costs.
+        Replay journal events, e.g. journal.changes_since(version) of another decomposition.
+
+        The recorded polygons, costs and adjacency relations are applied as they are,
+        nothing is snapped or recomputed. The id counter is advanced past every added id.
+
+        Params:
+            changes: An iterable of ChangeEvent.
+        """
+
+        for event in changes:
+            payload = event.payload
+
+            if event.kind == ADDED:
+                self._add_cell(event.polyId, payload['polygon'], payload['position'], payload['cost'])
+                self._insert_cost(event.polyId)
+                self.idCounter = max(self.idCounter, event.polyId + 1)
+            elif event.kind == REMOVED:
+                self.remove_polygon(event.polyId)
+            elif event.kind == RESNAPPED:
+                self._set_polygon(event.polyId, payload['polygon'])
+            elif event.kind == LINKED:
+                self._link(event.polyId, payload['adjacentId'], payload['length'])
+            else:
+                raise ValueError("Unknown change event: %s" % (event.kind,))
+
+    def snapshot(self):
+        """
+        Returns a Snapshot handle of the current state. Taking a snapshot is O(1), changes
+        made afterwards can be kept with snapshot.commit() or reverted with snapshot.discard().
+        """
+
+        snapshot = Snapshot(self)
+        self.snapshots.append(snapshot)
 
-        Assumption that cells are stored in this array in the increasing order of the cost.
+        return snapshot
+
+    def get_highest_cost(self):
+        """
+        Returns highest cost in the decomposition. None if decomposition is empty.
+        """
+
+        return self.sortedCosts.max_cost()
+
+    def get_lowest_cost(self):
+        """
+        Returns lowest cost in the decomposition. None if decomposition is empty.
+        """
+
+        return self.sortedCosts.min_cost()
+
+    def get_highest_cost_id(self):
+        """
+        Returns id of the polygon with the highest cost. None if decomposition is empty.
+        """
+
+        return self.sortedCosts.max_id()
+
+    def get_lowest_cost_id(self):
+        """
+        Returns id of the polygon with the lowest cost. None if decomposition is empty.
+        """
+
+        return self.sortedCosts.min_id()
+
+    def get_cost_percentile(self, percent):
+        """
+        Returns the cost at the given percentile (0-100) without copying the costs.
         """
 
-        if not self.sortedCosts:
-            self.sortedCosts.append(newPolyId)
+        return self.sortedCosts.percentile(percent)
+
+    def _close_snapshot(self, snapshot, keepChanges=True):
+        """
+        Commits or discards a snapshot together with all snapshots opened after it.
+        """
+
+        if not snapshot.isOpen or snapshot.decomposition is not self:
+            raise ValueError("Snapshot is not open on this decomposition.")
+
+        while True:
+            lastSnapshot = self.snapshots.pop()
+            lastSnapshot.isOpen = False
+
+            if keepChanges:
+                # The enclosing snapshot has to be able to revert the changes as well.
+                if self.snapshots:
+                    for polyId, state in lastSnapshot.id2State.items():
+                        self.snapshots[-1].id2State.setdefault(polyId, state)
+            else:
+                self._revert(lastSnapshot)
+
+            if lastSnapshot is snapshot:
+                break
+
+        logger.debug("%s snapshot with %d touched cells.", "Committed" if keepChanges else "Discarded", len(snapshot.id2State))
+
+    def _revert(self, snapshot):
+        """
+        Restores the cells recorded by a snapshot and journals the compensating events:
+        the touched cells are removed, added back in their recorded state and linked again.
+        """
+
+        touchedIds = sorted(snapshot.id2State.keys())
+
+        for polyId in touchedIds:
+            if polyId in self.id2Polygon:
+                self.journal.record(REMOVED, polyId)
+
+        for polyId in touchedIds:
+            self._restore_cell(polyId, snapshot.id2State[polyId])
+
+        for polyId in touchedIds:
+            if polyId in self.id2Polygon:
+                self.journal.record(ADDED, polyId, polygon=self.id2Polygon[polyId],
+                                    position=self.id2Position[polyId], cost=self.id2Cost[polyId])
+
+        linkedPairs = set()
+        for polyId in touchedIds:
+            if polyId not in self.id2Polygon:
+                continue
+
+            for adjPolyId in self.id2Adjacent[polyId]:
+                pair = (min(polyId, adjPolyId), max(polyId, adjPolyId))
+                if pair not in linkedPairs:
+                    linkedPairs.add(pair)
+                    self.journal.record(LINKED, polyId, adjacentId=adjPolyId, length=self.id2SharedLength[polyId][adjPolyId])
+
+        self.idCounter = snapshot.idCounter
+
+    def _touch(self, polyId):
+        """
+        Called before a cell is changed. Records its state in the most recent open snapshot.
+        """
+
+        if self.snapshots:
+            self.snapshots[-1].record(polyId)
+
+    def _cell_state(self, polyId):
+        """
+        Returns the full state of a cell, None if there is no such cell.
+        """
+
+        if polyId not in self.id2Polygon:
+            return None
+
+        return self.cellStore.cell_state(polyId), self.spatialIndex.id2Bounds[polyId]
+
+    def _restore_cell(self, polyId, state):
+        """
+        Puts a cell back into the state returned by _cell_state().
+        """
+
+        self.spatialIndex.remove(polyId)
+        self.sortedCosts.remove(polyId)
+        self.preparedCache.invalidate(polyId)
+
+        if state is None:
+            self.cellStore.restore_cell(polyId, None)
             return
 
-        for idx in range(len(self.sortedCosts)):
-            if self.id2Cost[newPolyId] < self.id2Cost[self.sortedCosts[idx]]:
-                self.sortedCosts.insert(idx, newPolyId)
-                return
+        storeState, bounds = state
+        self.cellStore.restore_cell(polyId, storeState)
+        self.spatialIndex.insert(polyId, bounds)
+        self.sortedCosts.add(polyId, self.id2Cost[polyId])
+
+    def _add_cell(self, polyId, polygon, robotPosition, cost):
+        self._touch(polyId)
+        self.preparedCache.invalidate(polyId)
+        self.cellStore.add_cell(polyId, polygon, robotPosition, cost)
+        self.spatialIndex.insert(polyId, polygon.bounds)
+        self.journal.record(ADDED, polyId, polygon=polygon, position=robotPosition, cost=cost)
+
+    def _set_polygon(self, polyId, polygon):
+        self._touch(polyId)
+        self.preparedCache.invalidate(polyId)
+        self.cellStore.set_polygon(polyId, polygon)
+        self.spatialIndex.update(polyId, polygon.bounds)
+        self.journal.record(RESNAPPED, polyId, polygon=polygon)
+
+    def _link(self, polyIdA, polyIdB, length):
+        self._touch(polyIdA)
+        self._touch(polyIdB)
+        self.cellStore.link(polyIdA, polyIdB, length)
+        self.journal.record(LINKED, polyIdA, adjacentId=polyIdB, length=length)
+
+    def _insert_cost(self, newPolyId):
+        """
+        Function for inserting cost of a new polygon into the sorted costs.
+
+        Cells are ordered in the increasing order of the cost. Ties are broken by id,
+        so a newer cell is placed after older cells with the same cost.
+        """
 
-        self.sortedCosts.append(newPolyId)
+        self.sortedCosts.add(newPolyId, self.id2Cost[newPolyId])
 
     def _update_adjacency(self, newPolyId):
         """
@@ -137,17 +557,54 @@ class Decomposition:
         """
 
         newPolyDef = self.id2Polygon[newPolyId]
-        adjacentPolyIds = [polyId for polyId in self.id2Polygon.keys() if polyId != newPolyId]
-        
-        for polyId in adjacentPolyIds:
+        candidateIds = [polyId for polyId in self._nearby_ids(newPolyDef) if polyId != newPolyId]
+
+        sharedEdges = self._shared_edges(newPolyDef, candidateIds)
+        for polyId in candidateIds:
+
+            if polyId in sharedEdges:
+                self._link(newPolyId, polyId, sharedEdges[polyId])
+
+    @profiling.timed('decomposition.adjacency')
+    def _shared_edges(self, polygon, candidateIds):
+        """
+        Returns {id: shared edge length} for the candidate cells that share an edge with polygon.
+        Touching at a single point does not make polygons adjacent.
+        """
+
+        candidates = dict((polyId, self.preparedCache.get(polyId, self.id2Polygon)[0]) for polyId in candidateIds)
+        profiling.count('decomposition.adjacency_candidates', len(candidates))
+
+        return shared_edge_lengths(polygon, candidates, self.PROXIMITY_THRESHOLD)
 
-            polygonDef = self.id2Polygon[polyId]
-            union = newPolyDef.union(polygonDef)
+    def _nearby_ids(self, polygon):
+        """
+        Returns ids of cells whose envelopes are within PROXIMITY_THRESHOLD of the polygon.
+        """
 
-            if isinstance(union, Polygon) and union.is_valid and union.is_simple:
-                self.id2Adjacent[newPolyId].append(polyId)
-                self.id2Adjacent[polyId].append(newPolyId)
+        return self.spatialIndex.query(polygon.bounds, self.PROXIMITY_THRESHOLD)
 
+    def _nearby_cell(self, polyId, polygon):
+        """
+        Returns the polygon of cell polyId if it is within PROXIMITY_THRESHOLD of polygon, None otherwise.
+
+        The cached envelope rejects far cells and the prepared geometry accepts intersecting
+        and touching cells, a distance is only computed for cells that are close but apart.
+        """
+
+        cellPolygon, preparedCell, cellBounds = self.preparedCache.get(polyId, self.id2Polygon)
+
+        minX, minY, maxX, maxY = polygon.bounds
+        envelopeGap = max(cellBounds[0] - maxX, minX - cellBounds[2], cellBounds[1] - maxY, minY - cellBounds[3])
+        if envelopeGap > self.PROXIMITY_THRESHOLD:
+            return None
+
+        if preparedCell.intersects(polygon) or cellPolygon.distance(polygon) <= self.PROXIMITY_THRESHOLD:
+            return cellPolygon
+
+        return None
+
+    @profiling.timed('decomposition.snapping')
     def _snap_to_environment(self, newPolygon):
         """
         Due to computational geometry intricacies, the new polygon may be adjacent to other polygons but
@@ -163,61 +620,63 @@ class Decomposition:
                 points to the new polygon and snap.
             5) If the nearest points are verticies of the new polygon only, add these points to the
                 polygon from the decomposition and snap.
-        """
 
-        originalPolyExterior = newPolygon.exterior.coords[:-1]
+        The vertex work is done on coordinate arrays (see snapping.py): nearest points are found
+        with a vectorised point-to-segment search, duplicates are removed through a spatial hash
+        and the snapped vertices are ordered by their vectorised projection on the exterior.
+        """
 
         # Step 1: Snap the verticies of the new polygon to the existing environment
-        newCoordinates = []
-        for id_, otherPolygon in self.id2Polygon.items():
-            
-            # Avoid doing needless computations for non adjacent polygons
-            if otherPolygon.distance(newPolygon) <= self.PROXIMITY_THRESHOLD:
-
-                for point in originalPolyExterior:  # for each vertex in the first polygon
-                    p1, p2 = nearest_points(Point(point), otherPolygon)  # find the nearest point on the second polygon
-                    if p1.distance(p2) <= self.PROXIMITY_THRESHOLD and \
-                        not p1.equals(p2):
-                        # it's within the snapping tolerance but 
-                        # need to avoid adding duplciates to existing veritcies.
-                        if not [True for point_ in newCoordinates if Point(point_).equals(p2)]:
-                            newCoordinates.append(p2.coords[0])
-                    else:
-                        # it's too far, use the original vertex
-                        if not [True for point_ in newCoordinates if Point(point_).equals(Point(point))]:
-                            newCoordinates.append(point)
-        else:
-            if not newCoordinates:
-                processedPolygon = newPolygon
-            else:
-
-                # The coordinates added to the newCoordinates need to be sorted according to their location on the exterior.
-                newCoordinates.sort(key=lambda point: newPolygon.exterior.project(Point(point)))
-                logger.debug("Snapped veritices: {}".format(newCoordinates))
-                # Form a new polygon
-                processedPolygon = Polygon(newCoordinates, newPolygon.interiors)
+        processedPolygon = self._snap_to_cells(newPolygon, self._nearby_ids(newPolygon))
 
         # Step 2: Snap the verticies of the existing environments to the edges of the new polygon
-        newCoordinates = []
-        for otherPolygonId, otherPolygon in self.id2Polygon.items():
-            
+        for otherPolygonId in self._nearby_ids(processedPolygon):
+            otherPolygon = self._nearby_cell(otherPolygonId, processedPolygon)
+
             # Avoid doing needless computations for non adjacent polygons
-            if otherPolygon.distance(processedPolygon) <= self.PROXIMITY_THRESHOLD:
-
-                for point in otherPolygon.exterior.coords[:-1]:  # for each vertex in the other polygon
-                    p1, p2 = nearest_points(Point(point), processedPolygon)  # find the nearest point on the second polygon
-                    if p1.distance(p2) <= self.PROXIMITY_THRESHOLD and \
-                       not p1.equals(p2):
-                        # it's within the snapping tolerance, use the snapped vertex
-                        if not [True for point_ in newCoordinates if Point(point_).equals(p2)]:
-                            newCoordinates.append(p2.coords[0])
-                    else:
-                        # it's too far, use the original vertex
-                        if not [True for point_ in newCoordinates if Point(point_).equals(Point(point))]:
-                            newCoordinates.append(point)
+            if otherPolygon is not None:
 
+                otherExterior = np.asarray(otherPolygon.exterior.coords, dtype=np.float64)[:-1, :2]
+                newCoordinates = snap_points(otherExterior, processedPolygon, self.PROXIMITY_THRESHOLD)
+                newCoordinates = newCoordinates[deduplicate(newCoordinates)]
+
+                # Leave the cell (and its cached prepared geometry) alone if no vertex moved.
+                if newCoordinates.shape == otherExterior.shape and (newCoordinates == otherExterior).all():
+                    continue
+
+                newCoordinates = [tuple(point) for point in newCoordinates]
                 processedOtherPolygon = Polygon(newCoordinates, otherPolygon.interiors)
-                self.id2Polygon[otherPolygonId] = processedOtherPolygon
-                newCoordinates = []
+                self._set_polygon(otherPolygonId, processedOtherPolygon)
 
         return processedPolygon
+
+    def _snap_to_cells(self, newPolygon, cellIds):
+        """
+        Snaps the exterior verticies of the new polygon to the given cells of the decomposition.
+        Returns the new polygon unchanged if none of the cells is within PROXIMITY_THRESHOLD.
+        """
+
+        originalPolyExterior = np.asarray(newPolygon.exterior.coords, dtype=np.float64)[:-1, :2]
+
+        snappedCoordinates = []
+        for id_ in cellIds:
+            otherPolygon = self._nearby_cell(id_, newPolygon)
+
+            # Avoid doing needless computations for non adjacent polygons
+            if otherPolygon is not None:
+                snappedCoordinates.append(snap_points(originalPolyExterior, otherPolygon, self.PROXIMITY_THRESHOLD))
+
+        if not snappedCoordinates:
+            return newPolygon
+
+        # Avoid adding duplicates of vertices that were already snapped.
+        newCoordinates = np.concatenate(snappedCoordinates)
+        newCoordinates = newCoordinates[deduplicate(newCoordinates)]
+
+        # The coordinates need to be sorted according to their location on the exterior.
+        order = np.argsort(ring_parameters(newCoordinates, newPolygon.exterior, self.PROXIMITY_THRESHOLD), kind='mergesort')
+        newCoordinates = [tuple(point) for point in newCoordinates[order]]
+        logger.debug("Snapped veritices: %s", newCoordinates)
+
+        # Form a new polygon
+        return Polygon(newCoordinates, newPolygon.interiors)
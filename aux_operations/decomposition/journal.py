@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+
+# A single change of a decomposition. payload depends on the kind of the event:
+#   added:      {'polygon', 'position', 'cost'}
+#   removed:    {}
+#   resnapped:  {'polygon'}
+#   linked:     {'adjacentId', 'length'}
+ChangeEvent = namedtuple('ChangeEvent', ['version', 'kind', 'polyId', 'payload'])
+
+ADDED = 'added'
+REMOVED = 'removed'
+RESNAPPED = 'resnapped'
+LINKED = 'linked'
+
+
+class ChangeJournal:
+    """
+    Append-only log of changes made to a decomposition.
+
+    Every change gets a version one higher than the previous one. Consumers remember the
+    last version they have seen and ask for changes_since(version) instead of scanning all
+    cells. Removing a cell implicitly removes its adjacency relations, so there is no
+    separate event for unlinking.
+
+    truncate() drops events that all consumers have seen. Asking for changes older than the
+    oldest kept event raises ValueError.
+    """
+
+    def __init__(self, version=0):
+        self.version = version
+        self.firstVersion = version + 1
+        self.events = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def record(self, kind, polyId, **payload):
+        """
+        Append an event and return its version.
+        """
+
+        self.version += 1
+        self.events.append(ChangeEvent(self.version, kind, polyId, payload))
+
+        return self.version
+
+    def changes_since(self, version=0):
+        """
+        Iterates over the events with a version higher than the given one, in order.
+        Only events recorded before the call are returned.
+        """
+
+        if version + 1 < self.firstVersion:
+            raise ValueError("Changes since version %d were truncated, oldest kept version is %d." % (version, self.firstVersion))
+
+        start = version + 1 - self.firstVersion
+        end = len(self.events)
+        for idx in range(start, end):
+            yield self.events[idx]
+
+    def truncate(self, version):
+        """
+        Drop all events up to and including version.
+        """
+
+        numDropped = min(max(version + 1 - self.firstVersion, 0), len(self.events))
+        del self.events[:numDropped]
+        self.firstVersion += numDropped
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+from shapely.prepared import prep
+
+from instrumentation import profiling
+
+
+class PreparedCache:
+    """
+    Cache of prepared geometries of the cells in a decomposition.
+
+    Every entry holds (polygon, prepared polygon, envelope) of a cell and is built on first
+    use. The entry of a cell has to be invalidated whenever its coordinates change, e.g.
+    when snapping rewrites a neighbour. With maxSize set, the least recently used entries
+    are evicted.
+
+    Hits and misses are counted on the cache and reported through instrumentation as
+    decomposition.prepared_hits and decomposition.prepared_misses.
+    """
+
+    def __init__(self, maxSize=None):
+        self.maxSize = maxSize
+        self.id2Entry = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.id2Entry)
+
+    def __contains__(self, polyId):
+        return polyId in self.id2Entry
+
+    def get(self, polyId, id2Polygon):
+        """
+        Returns (polygon, prepared polygon, bounds) of a cell, building it from id2Polygon if needed.
+        """
+
+        entry = self.id2Entry.pop(polyId, None)
+
+        if entry is None:
+            self.misses += 1
+            profiling.count('decomposition.prepared_misses')
+
+            polygon = id2Polygon[polyId]
+            entry = (polygon, prep(polygon), polygon.bounds)
+
+            if self.maxSize is not None and len(self.id2Entry) >= self.maxSize:
+                self.id2Entry.popitem(last=False)
+        else:
+            self.hits += 1
+            profiling.count('decomposition.prepared_hits')
+
+        self.id2Entry[polyId] = entry
+
+        return entry
+
+    def invalidate(self, polyId):
+        """
+        Drop the entry of a cell. Returns True if there was one.
+        """
+
+        return self.id2Entry.pop(polyId, None) is not None
+
+    def clear(self):
+        self.id2Entry.clear()
@@ -0,0 +1,91 @@
+import json
+import struct
+
+import numpy as np
+
+
+# File starts with MAGIC followed by the length of the JSON header as a little endian uint64.
+MAGIC = b'DECOMP01'
+ALIGNMENT = 64
+
+# Arrays every snapshot contains, with their dtypes.
+SNAPSHOT_ARRAYS = [('ids', '<i8'),
+                   ('positions', '<f8'),
+                   ('costs', '<f8'),
+                   ('bounds', '<f8'),
+                   ('cellRingOffsets', '<i8'),
+                   ('ringOffsets', '<i8'),
+                   ('coords', '<f8'),
+                   ('adjIndptr', '<i8'),
+                   ('adjIndices', '<i8'),
+                   ('adjLengths', '<f8')]
+
+
+def write_snapshot(path, arrays={}, attributes={}):
+    """
+    Writes arrays and scalar attributes to a binary snapshot file.
+
+    Layout: MAGIC, header length, JSON header with the attributes and the dtype, shape
+    and byte offset of every array, followed by the raw arrays aligned to ALIGNMENT bytes.
+
+    Params:
+        path: File to write.
+        arrays: A dictionary with an array for every name in SNAPSHOT_ARRAYS.
+        attributes: A dictionary of JSON serialisable values.
+    """
+
+    prepared = [(name, np.ascontiguousarray(arrays[name], dtype=dtype)) for name, dtype in SNAPSHOT_ARRAYS]
+
+    # Offsets depend on the header size, so place the arrays after a generously sized header.
+    def header_for(dataStart):
+        layout = {}
+        offset = dataStart
+        for name, array in prepared:
+            layout[name] = [array.dtype.str, list(array.shape), offset]
+            offset += -(-array.nbytes//ALIGNMENT)*ALIGNMENT
+        return json.dumps({'attributes': attributes, 'arrays': layout}, sort_keys=True).encode('ascii')
+
+    dataStart = ALIGNMENT
+    header = header_for(dataStart)
+    while len(MAGIC) + 8 + len(header) > dataStart:
+        dataStart = -(-(len(MAGIC) + 8 + len(header))//ALIGNMENT)*ALIGNMENT
+        header = header_for(dataStart)
+
+    with open(path, 'wb') as snapshotFile:
+        snapshotFile.write(MAGIC)
+        snapshotFile.write(struct.pack('<Q', len(header)))
+        snapshotFile.write(header)
+
+        layout = json.loads(header.decode('ascii'))['arrays']
+        for name, array in prepared:
+            snapshotFile.write(b'\0'*(layout[name][2] - snapshotFile.tell()))
+            snapshotFile.write(array.tobytes())
+
+
+def read_snapshot(path):
+    """
+    Opens a binary snapshot file without reading the arrays into memory.
+
+    Arrays are returned as copy-on-write numpy.memmap objects: pages are read from the file
+    on first access and modifications stay in memory.
+
+    Returns:
+        (arrays, attributes) dictionaries.
+    """
+
+    with open(path, 'rb') as snapshotFile:
+        if snapshotFile.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a decomposition snapshot: %s" % (path,))
+
+        headerLength, = struct.unpack('<Q', snapshotFile.read(8))
+        header = json.loads(snapshotFile.read(headerLength).decode('ascii'))
+
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        if np.prod(shape) == 0:
+            # numpy.memmap can not map empty arrays
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='c', offset=offset, shape=tuple(shape))
+
+    return arrays, header['attributes']
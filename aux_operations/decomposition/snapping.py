@@ -0,0 +1,214 @@
+from math import floor
+
+import numpy as np
+
+
+# Points closer than this are considered to be the same vertex.
+DUPLICATE_THRESHOLD = 1e-9
+
+
+def polygon_segments(polygon):
+    """
+    Returns start and end points of the edges of all rings of a polygon as (S, 2) arrays.
+    """
+
+    starts = []
+    ends = []
+    for ring in [polygon.exterior] + list(polygon.interiors):
+        coords = np.asarray(ring.coords, dtype=np.float64)[:, :2]
+        starts.append(coords[:-1])
+        ends.append(coords[1:])
+
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def nearest_on_segments(points, starts, ends, searchRadius=np.inf):
+    """
+    Vectorised nearest point search of points against a set of segments.
+
+    Only (point, segment) pairs whose segment envelope is within searchRadius of the
+    point are evaluated. Pairs are generated with a sweep over the points sorted by x.
+
+    Params:
+        points: (P, 2) array of points.
+        starts: (S, 2) array of segment start points.
+        ends: (S, 2) array of segment end points.
+        searchRadius: Pairs further apart than this are not considered.
+
+    Returns:
+        (segmentIdx, param, distance) arrays of length P. segmentIdx is the first segment
+        with the minimal distance, param is the position along that segment in [0, 1].
+        Points without a segment within searchRadius get index -1 and infinite distance.
+    """
+
+    numPoints = len(points)
+    segmentIdx = np.full(numPoints, -1, dtype=np.int64)
+    param = np.zeros(numPoints)
+    distance = np.full(numPoints, np.inf)
+
+    if not numPoints or not len(starts):
+        return segmentIdx, param, distance
+
+    if np.isinf(searchRadius):
+        pointIdx = np.repeat(np.arange(numPoints), len(starts))
+        pairSegIdx = np.tile(np.arange(len(starts)), numPoints)
+    else:
+        order = np.argsort(points[:, 0], kind='mergesort')
+        sortedX = points[order, 0]
+
+        minX = np.minimum(starts[:, 0], ends[:, 0]) - searchRadius
+        maxX = np.maximum(starts[:, 0], ends[:, 0]) + searchRadius
+        lo = np.searchsorted(sortedX, minX, side='left')
+        hi = np.searchsorted(sortedX, maxX, side='right')
+        counts = hi - lo
+
+        pairSegIdx = np.repeat(np.arange(len(starts)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pointIdx = order[np.repeat(lo, counts) + offsets]
+
+        minY = np.minimum(starts[pairSegIdx, 1], ends[pairSegIdx, 1]) - searchRadius
+        maxY = np.maximum(starts[pairSegIdx, 1], ends[pairSegIdx, 1]) + searchRadius
+        pointY = points[pointIdx, 1]
+        keep = (pointY >= minY) & (pointY <= maxY)
+        pointIdx, pairSegIdx = pointIdx[keep], pairSegIdx[keep]
+
+    if not len(pointIdx):
+        return segmentIdx, param, distance
+
+    segStart = starts[pairSegIdx]
+    segVector = ends[pairSegIdx] - segStart
+    segLengthSq = (segVector**2).sum(axis=1)
+    relative = points[pointIdx] - segStart
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pairParam = np.where(segLengthSq > 0, (relative*segVector).sum(axis=1)/segLengthSq, 0.0)
+    pairParam = np.clip(pairParam, 0.0, 1.0)
+
+    pairDistance = np.hypot(*(relative - pairParam[:, None]*segVector).T)
+
+    # Pick the closest segment per point, ties are resolved by the lowest segment index.
+    order = np.lexsort((pairSegIdx, pairDistance, pointIdx))
+    firstPairs = order[np.unique(pointIdx[order], return_index=True)[1]]
+
+    closestPoints = pointIdx[firstPairs]
+    segmentIdx[closestPoints] = pairSegIdx[firstPairs]
+    param[closestPoints] = pairParam[firstPairs]
+    distance[closestPoints] = pairDistance[firstPairs]
+
+    return segmentIdx, param, distance
+
+
+def points_in_polygon(points, starts, ends):
+    """
+    Vectorised even-odd test of points against the rings given as segments.
+    Points on the boundary may be reported either way.
+    """
+
+    if not len(points):
+        return np.zeros(0, dtype=bool)
+
+    x = points[:, 0][:, None]
+    y = points[:, 1][:, None]
+    x1, y1 = starts[:, 0][None, :], starts[:, 1][None, :]
+    x2, y2 = ends[:, 0][None, :], ends[:, 1][None, :]
+
+    # Only straddling segments are intersected, the others (horizontal edges among them)
+    # get a unit denominator so no NaN reaches the comparison.
+    straddles = (y1 > y) != (y2 > y)
+    rise = np.where(straddles, y2 - y1, 1.0)
+    crossingX = x1 + (y - y1)*(x2 - x1)/rise
+    crossings = straddles & (x < crossingX)
+
+    return (crossings.sum(axis=1) % 2) == 1
+
+
+def snap_points(points, polygon, tolerance):
+    """
+    Snaps points to the nearest point of a polygon if they are within tolerance of it.
+
+    Mirrors nearest_points semantics: points inside the polygon or already on its
+    boundary are at distance 0 and are kept as they are.
+
+    Params:
+        points: (P, 2) array of points.
+        polygon: A shapely polygon to snap to.
+        tolerance: Snapping distance.
+
+    Returns:
+        (P, 2) array of snapped points.
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    starts, ends = polygon_segments(polygon)
+
+    segmentIdx, param, distance = nearest_on_segments(points, starts, ends, tolerance)
+
+    candidates = np.nonzero((distance <= tolerance) & (distance > DUPLICATE_THRESHOLD))[0]
+    if len(candidates):
+        inside = points_in_polygon(points[candidates], starts, ends)
+        candidates = candidates[~inside]
+
+    snapped = points.copy()
+    if len(candidates):
+        segments = segmentIdx[candidates]
+        snapped[candidates] = starts[segments] + param[candidates][:, None]*(ends[segments] - starts[segments])
+
+    return snapped
+
+
+def ring_parameters(points, ring, tolerance):
+    """
+    Vectorised equivalent of ring.project(Point(point)) for points close to the ring.
+
+    Params:
+        points: (P, 2) array of points.
+        ring: A shapely LinearRing.
+        tolerance: Distance within which most points are expected to be from the ring.
+
+    Returns:
+        Array of distances along the ring to the nearest point of each point.
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    coords = np.asarray(ring.coords, dtype=np.float64)[:, :2]
+    starts, ends = coords[:-1], coords[1:]
+
+    segmentIdx, param, _ = nearest_on_segments(points, starts, ends, 2*tolerance)
+
+    missing = np.nonzero(segmentIdx < 0)[0]
+    if len(missing):
+        missingIdx, missingParam, _ = nearest_on_segments(points[missing], starts, ends)
+        segmentIdx[missing] = missingIdx
+        param[missing] = missingParam
+
+    segLengths = np.hypot(*(ends - starts).T)
+    cumulative = np.concatenate(([0.0], np.cumsum(segLengths)))
+
+    return cumulative[segmentIdx] + param*segLengths[segmentIdx]
+
+
+def deduplicate(points, tolerance=DUPLICATE_THRESHOLD):
+    """
+    Removes points within tolerance of an earlier point using a spatial hash.
+
+    Returns:
+        Indices of the points that were kept, in their original order.
+    """
+
+    cell2Points = {}
+    kept = []
+    for idx, (x, y) in enumerate(np.asarray(points, dtype=np.float64)):
+        cellX, cellY = int(floor(x/tolerance)), int(floor(y/tolerance))
+
+        duplicate = False
+        for i in (cellX - 1, cellX, cellX + 1):
+            for j in (cellY - 1, cellY, cellY + 1):
+                for otherX, otherY in cell2Points.get((i, j), ()):
+                    if (otherX - x)**2 + (otherY - y)**2 <= tolerance**2:
+                        duplicate = True
+
+        if not duplicate:
+            cell2Points.setdefault((cellX, cellY), []).append((x, y))
+            kept.append(idx)
+
+    return kept
@@ -0,0 +1,58 @@
+class Snapshot:
+    """
+    Handle to the state of a decomposition at the time Decomposition.snapshot() was called.
+
+    Taking a snapshot does not copy anything. The first time a cell is changed afterwards
+    its previous state (polygon, position, cost, adjacency and envelope) is recorded, so
+    the cost of a snapshot is proportional to the number of cells touched while it is open.
+
+    commit() keeps the changes, discard() puts the touched cells back and restores the id
+    counter. Snapshots nest: only the most recent open snapshot records changes, committing
+    it hands its records to the enclosing snapshot. Committing or discarding a snapshot
+    commits or discards the snapshots opened after it as well.
+    """
+
+    def __init__(self, decomposition):
+        self.decomposition = decomposition
+        self.idCounter = decomposition.idCounter
+        self.id2State = {}
+        self.isOpen = True
+
+    def record(self, polyId):
+        """
+        Record the state of a cell unless it was already recorded by this snapshot.
+        """
+
+        if polyId not in self.id2State:
+            self.id2State[polyId] = self.decomposition._cell_state(polyId)
+
+    def commit(self):
+        """
+        Keep all changes made since the snapshot was taken.
+        """
+
+        self.decomposition._close_snapshot(self, keepChanges=True)
+
+    def discard(self):
+        """
+        Revert all changes made since the snapshot was taken.
+        """
+
+        self.decomposition._close_snapshot(self, keepChanges=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        """
+        Used as a context manager, the snapshot is committed unless an exception was raised
+        and it was not closed explicitly.
+        """
+
+        if self.isOpen:
+            if excType is None:
+                self.commit()
+            else:
+                self.discard()
+
+        return False
@@ -0,0 +1,253 @@
+from math import ceil
+from math import floor
+from math import log
+from random import Random
+
+
+class _Node:
+    """
+    Skip list node holding a single (cost, id) key.
+    """
+
+    __slots__ = ('key', 'polyId', 'next', 'width')
+
+    def __init__(self, key, polyId, numLevels):
+        self.key = key
+        self.polyId = polyId
+        self.next = [None]*numLevels
+        self.width = [1]*numLevels
+
+
+class SortedCosts:
+    """
+    Order-statistics structure for the costs of the cells in a decomposition.
+
+    Implemented as an indexable skip list keyed on (cost, id), so equal costs are
+    ordered by id. Behaves like the sorted list of ids it replaces: supports
+    len(), iteration in increasing order of the cost and indexing by rank.
+
+    Supports the following operations:
+    1. Insert and remove an id in O(log N).
+    2. Returns id and cost of the lowest and highest cost cell in O(1).
+    3. Returns id at a rank, rank of an id, top k ids and cost percentiles in O(log N + k).
+    """
+
+    MAX_LEVELS = 24
+
+    def __init__(self):
+        self.id2Key = {}
+        self._head = _Node(None, None, self.MAX_LEVELS)
+        self._last = None
+        self._random = Random(0)
+
+    def __len__(self):
+        return len(self.id2Key)
+
+    def __contains__(self, polyId):
+        return polyId in self.id2Key
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.polyId
+            node = node.next[0]
+
+    def __getitem__(self, rank):
+        return self._node_at(rank).polyId
+
+    def __repr__(self):
+        return "SortedCosts(%s)" % (list(self),)
+
+    def add(self, polyId, cost):
+        """
+        Insert polyId with the given cost.
+        """
+
+        if polyId in self.id2Key:
+            self.remove(polyId)
+
+        key = (cost, polyId)
+        self.id2Key[polyId] = key
+
+        chain = [None]*self.MAX_LEVELS
+        stepsAtLevel = [0]*self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key <= key:
+                stepsAtLevel[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        numLevels = min(self.MAX_LEVELS, 1 - int(log(1.0 - self._random.random(), 2.0)))
+        newNode = _Node(key, polyId, numLevels)
+
+        steps = 0
+        for level in range(numLevels):
+            prevNode = chain[level]
+            newNode.next[level] = prevNode.next[level]
+            prevNode.next[level] = newNode
+            newNode.width[level] = prevNode.width[level] - steps
+            prevNode.width[level] = steps + 1
+            steps += stepsAtLevel[level]
+
+        for level in range(numLevels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+
+        if newNode.next[0] is None:
+            self._last = newNode
+
+    def load(self, polyIds, costs):
+        """
+        Replace the content with the given ids and costs. The skip list is linked in a
+        single pass over the sorted keys instead of inserting the ids one by one.
+        """
+
+        keys = sorted(zip(costs, polyIds))
+
+        self.id2Key = dict((key[1], key) for key in keys)
+        self._head = _Node(None, None, self.MAX_LEVELS)
+        self._last = None
+
+        lastNodes = [self._head]*self.MAX_LEVELS
+        lastRanks = [0]*self.MAX_LEVELS
+        for rank, key in enumerate(keys, 1):
+            numLevels = min(self.MAX_LEVELS, 1 - int(log(1.0 - self._random.random(), 2.0)))
+            node = _Node(key, key[1], numLevels)
+
+            for level in range(numLevels):
+                lastNodes[level].next[level] = node
+                lastNodes[level].width[level] = rank - lastRanks[level]
+                lastNodes[level] = node
+                lastRanks[level] = rank
+
+            self._last = node
+
+        # The last node of every level points past the end of the list.
+        for level in range(self.MAX_LEVELS):
+            lastNodes[level].width[level] = len(keys) + 1 - lastRanks[level]
+
+    def remove(self, polyId):
+        """
+        Remove polyId from the structure.
+        Returns True if remove was succseful
+        """
+
+        if polyId not in self.id2Key:
+            return False
+
+        key = self.id2Key.pop(polyId)
+
+        chain = [None]*self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        for level in range(len(target.next)):
+            prevNode = chain[level]
+            prevNode.width[level] += target.width[level] - 1
+            prevNode.next[level] = target.next[level]
+
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+        if target is self._last:
+            self._last = chain[0] if chain[0] is not self._head else None
+
+        return True
+
+    def cost(self, polyId):
+        return self.id2Key[polyId][0]
+
+    def min_id(self):
+        """
+        Returns id of the cell with the lowest cost, None if empty.
+        """
+
+        node = self._head.next[0]
+        return node.polyId if node is not None else None
+
+    def max_id(self):
+        """
+        Returns id of the cell with the highest cost, None if empty.
+        """
+
+        return self._last.polyId if self._last is not None else None
+
+    def min_cost(self):
+        node = self._head.next[0]
+        return node.key[0] if node is not None else None
+
+    def max_cost(self):
+        return self._last.key[0] if self._last is not None else None
+
+    def rank(self, polyId):
+        """
+        Returns the number of cells ordered before polyId.
+        """
+
+        key = self.id2Key[polyId]
+
+        rank = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                rank += node.width[level]
+                node = node.next[level]
+
+        return rank
+
+    def top_k(self, k):
+        """
+        Returns ids of the k highest cost cells, highest cost first.
+        """
+
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+
+        result = []
+        node = self._node_at(len(self) - k)
+        while node is not None:
+            result.append(node.polyId)
+            node = node.next[0]
+
+        result.reverse()
+        return result
+
+    def percentile(self, percent):
+        """
+        Returns the cost at the given percentile (0-100), linearly interpolated
+        between neighbouring ranks. None if empty.
+        """
+
+        if not self.id2Key:
+            return None
+
+        position = (len(self) - 1)*min(max(percent, 0.0), 100.0)/100.0
+        lowerNode = self._node_at(int(floor(position)))
+        upperNode = self._node_at(int(ceil(position)))
+        fraction = position - floor(position)
+
+        return lowerNode.key[0] + (upperNode.key[0] - lowerNode.key[0])*fraction
+
+    def _node_at(self, rank):
+        """
+        Returns the node at a rank. Negative ranks count from the end.
+        """
+
+        if rank < 0:
+            rank += len(self)
+        if rank < 0 or rank >= len(self):
+            raise IndexError("SortedCosts index out of range")
+
+        rank += 1
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.width[level] <= rank:
+                rank -= node.width[level]
+                node = node.next[level]
+
+        return node
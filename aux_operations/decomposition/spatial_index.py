@@ -0,0 +1,211 @@
+from math import exp
+from math import floor
+from math import log
+
+
+class SpatialIndex:
+    """
+    Uniform grid index over the envelopes of the cells in a decomposition.
+
+    Every cell is registered in each grid bucket its envelope overlaps. A query
+    only inspects the buckets overlapped by the (expanded) query envelope and
+    returns ids of cells whose envelopes are within the requested margin.
+
+    Supports the following operations:
+    1. Insert an envelope for an id.
+    2. Update the envelope of an id (e.g. after the cell was snapped).
+    3. Remove an id.
+    4. Query ids whose envelope is within a margin of a given envelope.
+
+    The grid resolution follows the geometric mean of the envelope sizes, so a
+    few very large or very small cells do not move it much. It is taken from the
+    first inserted envelope unless specified explicitly, and the grid is rebuilt
+    whenever the mean drifts more than MAX_DRIFT away from it. Envelopes that would
+    overlap more than MAX_BUCKETS buckets are kept in a separate list that every
+    query checks.
+    """
+
+    MAX_BUCKETS = 64
+    MAX_DRIFT = 4.0
+
+    def __init__(self, cellSize=None):
+        self.cellSize = cellSize
+        self.id2Bounds = {}
+        self.bucket2Ids = {}
+        self.oversizedIds = set()
+
+        # Running sums of the log sizes of the envelopes that have an extent
+        self.numSized = 0
+        self.sumLogSizes = 0.0
+
+    def __len__(self):
+        return len(self.id2Bounds)
+
+    def __contains__(self, polyId):
+        return polyId in self.id2Bounds
+
+    def insert(self, polyId, bounds):
+        """
+        Register envelope (minx, miny, maxx, maxy) of a cell under polyId.
+        """
+
+        self._add(polyId, bounds)
+        self._check_drift()
+
+    def insert_many(self, items=[]):
+        """
+        Register many (polyId, bounds) pairs. The grid is rebuilt at most once, at the end.
+        """
+
+        for polyId, bounds in items:
+            self._add(polyId, bounds)
+
+        self._check_drift()
+
+    def remove(self, polyId):
+        """
+        Remove a cell from the index.
+        Returns True if remove was succseful
+        """
+
+        if polyId not in self.id2Bounds:
+            return False
+
+        bounds = self.id2Bounds.pop(polyId)
+        self._unregister(polyId, bounds)
+
+        logSize = _log_size(bounds)
+        if logSize is not None:
+            self.numSized -= 1
+            self.sumLogSizes -= logSize
+
+        # Start over with the next envelope once the index is empty
+        if not self.id2Bounds:
+            self.cellSize = None
+            self.numSized = 0
+            self.sumLogSizes = 0.0
+
+        return True
+
+    def update(self, polyId, bounds):
+        """
+        Replace the envelope of an already registered cell.
+        """
+
+        if self.id2Bounds.get(polyId) == tuple(bounds):
+            return
+
+        self.insert(polyId, bounds)
+
+    def query(self, bounds, margin=0.0):
+        """
+        Returns a sorted list of ids whose envelopes are within margin of bounds.
+        """
+
+        if not self.id2Bounds:
+            return []
+
+        minX, minY, maxX, maxY = bounds
+        minX, minY, maxX, maxY = minX - margin, minY - margin, maxX + margin, maxY + margin
+
+        candidateIds = set(self.oversizedIds)
+        firstI, lastI, firstJ, lastJ = self._bucket_range((minX, minY, maxX, maxY))
+        if (lastI - firstI + 1)*(lastJ - firstJ + 1) <= len(self.bucket2Ids):
+            for i in xrange(firstI, lastI + 1):
+                for j in xrange(firstJ, lastJ + 1):
+                    candidateIds.update(self.bucket2Ids.get((i, j), ()))
+        else:
+            # Large queries only look at the buckets that are in use
+            for (i, j), ids in self.bucket2Ids.items():
+                if firstI <= i <= lastI and firstJ <= j <= lastJ:
+                    candidateIds.update(ids)
+
+        result = []
+        for polyId in candidateIds:
+            otherMinX, otherMinY, otherMaxX, otherMaxY = self.id2Bounds[polyId]
+            if otherMinX <= maxX and otherMaxX >= minX and otherMinY <= maxY and otherMaxY >= minY:
+                result.append(polyId)
+
+        result.sort()
+        return result
+
+    def _add(self, polyId, bounds):
+        if polyId in self.id2Bounds:
+            self.remove(polyId)
+
+        bounds = tuple(bounds)
+        logSize = _log_size(bounds)
+        if logSize is not None:
+            self.numSized += 1
+            self.sumLogSizes += logSize
+
+        if self.cellSize is None:
+            self.cellSize = self._mean_size()
+
+        self.id2Bounds[polyId] = bounds
+        self._register(polyId, bounds)
+
+    def _mean_size(self):
+        if not self.numSized:
+            return 1.0
+
+        return exp(self.sumLogSizes/self.numSized)
+
+    def _check_drift(self):
+        """
+        Rebuilds the grid with the mean envelope size if the cell size drifted too far from it.
+        """
+
+        meanSize = self._mean_size()
+        if meanSize <= self.MAX_DRIFT*self.cellSize and self.cellSize <= self.MAX_DRIFT*meanSize:
+            return
+
+        self.cellSize = meanSize
+        self.bucket2Ids = {}
+        self.oversizedIds = set()
+        for polyId, bounds in self.id2Bounds.items():
+            self._register(polyId, bounds)
+
+    def _register(self, polyId, bounds):
+        firstI, lastI, firstJ, lastJ = self._bucket_range(bounds)
+        if (lastI - firstI + 1)*(lastJ - firstJ + 1) > self.MAX_BUCKETS:
+            self.oversizedIds.add(polyId)
+            return
+
+        for i in xrange(firstI, lastI + 1):
+            for j in xrange(firstJ, lastJ + 1):
+                self.bucket2Ids.setdefault((i, j), set()).add(polyId)
+
+    def _unregister(self, polyId, bounds):
+        if polyId in self.oversizedIds:
+            self.oversizedIds.discard(polyId)
+            return
+
+        firstI, lastI, firstJ, lastJ = self._bucket_range(bounds)
+        for i in xrange(firstI, lastI + 1):
+            for j in xrange(firstJ, lastJ + 1):
+                ids = self.bucket2Ids[(i, j)]
+                ids.discard(polyId)
+                if not ids:
+                    del self.bucket2Ids[(i, j)]
+
+    def _bucket_range(self, bounds):
+        """
+        Returns (firstI, lastI, firstJ, lastJ), the grid buckets overlapped by an envelope.
+        """
+
+        minX, minY, maxX, maxY = bounds
+
+        return (int(floor(minX/self.cellSize)), int(floor(maxX/self.cellSize)),
+                int(floor(minY/self.cellSize)), int(floor(maxY/self.cellSize)))
+
+
+def _log_size(bounds):
+    """
+    Log of the larger side of an envelope, None for envelopes without an extent.
+    """
+
+    minX, minY, maxX, maxY = bounds
+    size = max(maxX - minX, maxY - minY)
+
+    return log(size) if size > 0 else None
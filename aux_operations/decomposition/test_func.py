@@ -1,5 +1,9 @@
+import os
+import tempfile
 import unittest
 
+import numpy as np
+
 from shapely.geometry import Point
 from shapely.geometry import Polygon
 from shapely.geometry import LineString
@@ -8,6 +12,15 @@ from matplotlib import pyplot
 from descartes.patch import PolygonPatch
 
 from decomposition import Decomposition
+from cell_store import ArrayCellStore
+from spatial_index import SpatialIndex
+from journal import ChangeJournal
+from sorted_costs import SortedCosts
+from adjacency import compute_shared_edges
+from snapping import deduplicate
+from snapping import points_in_polygon
+from snapping import ring_parameters
+from snapping import snap_points
 from metrics.chi import ChiMetric
 
 def plot_coords(ax, ob):
@@ -113,6 +126,8 @@ class decompositionTest(unittest.TestCase):
         self.assertEqual(len(decomp.id2Adjacent.keys()), 2)
         self.assertEqual(decomp.id2Adjacent[polyId1], [polyId2])
         self.assertEqual(decomp.id2Adjacent[polyId2], [polyId1])
+        self.assertAlmostEqual(decomp.id2SharedLength[polyId1][polyId2], 1.0)
+        self.assertAlmostEqual(decomp.id2SharedLength[polyId2][polyId1], 1.0)
 
         self.assertEqual(len(decomp.sortedCosts), 2)
         self.assertEqual(decomp.sortedCosts[0], polyId1)
@@ -244,6 +259,12 @@ class decompositionTest(unittest.TestCase):
         self.assertEqual(decomp.sortedCosts[1], polyId3)
         self.assertEqual(decomp.sortedCosts[2], polyId2)
 
+        self.assertEqual(decomp.get_lowest_cost_id(), polyId1)
+        self.assertEqual(decomp.get_highest_cost_id(), polyId2)
+        self.assertEqual(decomp.get_highest_cost(), decomp.id2Cost[polyId2])
+        self.assertEqual(decomp.get_lowest_cost(), decomp.id2Cost[polyId1])
+        self.assertEqual(decomp.get_cost_percentile(50), decomp.id2Cost[polyId3])
+
     def test_removeFromThree(self):
         decomp = Decomposition(self.chi)
 
@@ -295,6 +316,7 @@ class decompositionTest(unittest.TestCase):
         polyId3 = decomp.add_polygon(polygon=polygon3, robotPosition=robotPosition3)
 
         decomp.remove_polygon(polyId1)
+        self.assertNotIn(polyId1, decomp.id2SharedLength[polyId3])
 
         polygon1 = Polygon([(0,0),(1,0),(1,1),(0,1)])
         robotPosition1 = Point((0,0))
@@ -404,6 +426,606 @@ class decompositionTest(unittest.TestCase):
         self.assertEqual(decomp.id2Adjacent[polyId1], [polyId2])
         self.assertEqual(decomp.id2Adjacent[polyId2], [polyId1])
 
+        self.assertEqual(decomp.spatialIndex.id2Bounds[polyId1], decomp.id2Polygon[polyId1].bounds)
+        self.assertEqual(decomp.spatialIndex.id2Bounds[polyId2], decomp.id2Polygon[polyId2].bounds)
+
+    def test_preparedCacheInvalidation(self):
+        decomp = Decomposition(self.chi)
+
+        polygon1 = Polygon([(0,0),(0.99999,0),(0.99999,1)])
+        polyId1 = decomp.add_polygon(polygon=polygon1, robotPosition=Point((0,0)))
+        self.assertEqual(decomp.preparedCache.misses, 0)
+
+        # Snapping the second polygon rewrites the first one
+        polygon2 = Polygon([(1,0.5),(2,0.5),(2,1.5),(1,1.5)])
+        polyId2 = decomp.add_polygon(polygon=polygon2, robotPosition=Point((20,0)))
+
+        self.assertNotEqual(decomp.id2Polygon[polyId1], polygon1)
+        for polyId, (polygon, prepared, bounds) in decomp.preparedCache.id2Entry.items():
+            self.assertEqual(polygon, decomp.id2Polygon[polyId])
+            self.assertEqual(bounds, decomp.id2Polygon[polyId].bounds)
+
+        misses = decomp.preparedCache.misses
+        polygon3 = Polygon([(2,0.5),(3,0.5),(3,1.5),(2,1.5)])
+        polyId3 = decomp.add_polygon(polygon=polygon3, robotPosition=Point((3,0)))
+        self.assertEqual(decomp.id2Adjacent[polyId3], [polyId2])
+        self.assertGreater(decomp.preparedCache.hits, 0)
+        self.assertEqual(decomp.preparedCache.misses, misses + 1)
+
+        self.assertTrue(decomp.remove_polygon(polyId2))
+        self.assertNotIn(polyId2, decomp.preparedCache)
+
+    def test_addPolygonsMatchesSequential(self):
+        polygons = [(Polygon([(0,0),(1,0),(1,1)]), Point((0,0))),
+                    (Polygon([(1,1),(0.5,1),(0.5,0.500000001)]), Point((20,0))),
+                    (Polygon([(0,1),(0,0),(0.5,0.499999999),(0.5,1)]), Point((20,0))),
+                    (Polygon([(0,0),(1,0),(1,-1),(1,1),(0,1)]), Point((0,0))),
+                    (Polygon([(1,0.5),(2,0.5),(2,1.5),(1,1.5)]), Point((2,0))),
+                    (Polygon([(5,0),(6,0),(6,1),(5,1)]), Point((5,0)))]
+
+        sequential = Decomposition(self.chi)
+        sequentialIds = [sequential.add_polygon(polygon=polygon, robotPosition=robotPosition) for polygon, robotPosition in polygons]
+
+        bulk = Decomposition(self.chi)
+        bulkIds = bulk.add_polygons(polygons)
+
+        self.assertEqual(bulkIds, sequentialIds)
+        self.assertEqual(bulkIds[3], -1)
+        self.assertEqual(sorted(bulk.id2Polygon.keys()), sorted(sequential.id2Polygon.keys()))
+        for polyId in sequential.id2Polygon.keys():
+            self.assertTrue(bulk.id2Polygon[polyId].equals(sequential.id2Polygon[polyId]))
+            self.assertEqual(bulk.id2Cost[polyId], sequential.id2Cost[polyId])
+            self.assertEqual(bulk.id2Adjacent[polyId], sequential.id2Adjacent[polyId])
+        self.assertEqual(list(bulk.sortedCosts), list(sequential.sortedCosts))
+        self.assertEqual(bulk.idCounter, sequential.idCounter)
+
+    def test_addPolygonsToExisting(self):
+        decomp = Decomposition(self.chi)
+        polyId1 = decomp.add_polygon(polygon=Polygon([(0,0),(1,0),(1,1),(0,1)]), robotPosition=Point((0,0)))
+
+        polyId2, polyId3 = decomp.add_polygons([(Polygon([(1,0),(2,0),(2,1),(1,1)]), Point((1,0))),
+                                                (Polygon([(0,1),(1,1),(1,2),(0,2)]), Point((0,1)))])
+
+        self.assertEqual(decomp.id2Adjacent[polyId1], [polyId2, polyId3])
+        self.assertEqual(decomp.id2Adjacent[polyId2], [polyId1])
+        self.assertEqual(decomp.id2Adjacent[polyId3], [polyId1])
+
+    def test_spatialIndexAfterRemove(self):
+        decomp = Decomposition(self.chi)
+
+        polygon1 = Polygon([(0,0),(1,0),(1,1),(0,1)])
+        polyId1 = decomp.add_polygon(polygon=polygon1, robotPosition=Point((0,0)))
+
+        polygon2 = Polygon([(1,0),(2,0),(2,1),(1,1)])
+        polyId2 = decomp.add_polygon(polygon=polygon2, robotPosition=Point((1,0)))
+
+        polygon3 = Polygon([(5,0),(6,0),(6,1),(5,1)])
+        polyId3 = decomp.add_polygon(polygon=polygon3, robotPosition=Point((5,0)))
+
+        self.assertEqual(decomp.spatialIndex.query(polygon1.bounds, decomp.PROXIMITY_THRESHOLD), [polyId1, polyId2])
+
+        self.assertTrue(decomp.remove_polygon(polyId2))
+
+        self.assertEqual(len(decomp.spatialIndex), 2)
+        self.assertEqual(decomp.spatialIndex.query(polygon2.bounds, decomp.PROXIMITY_THRESHOLD), [polyId1])
+        self.assertEqual(decomp.spatialIndex.query(polygon3.bounds), [polyId3])
+
+        polyId4 = decomp.add_polygon(polygon=polygon2, robotPosition=Point((1,0)))
+        self.assertEqual(decomp.id2Adjacent[polyId1], [polyId4])
+        self.assertEqual(decomp.id2Adjacent[polyId3], [])
+
+    def test_spatialIndexMixedSizes(self):
+        index = SpatialIndex()
+        index.insert(0, (0.0, 0.0, 0.01, 0.01))
+        index.insert(1, (0.0, 0.0, 10.0, 10.0))
+
+        # The large envelope is not spread over a million buckets of the first one's size
+        self.assertLessEqual(sum(len(ids) for ids in index.bucket2Ids.values()), SpatialIndex.MAX_BUCKETS + 1)
+        self.assertEqual(index.oversizedIds, set([1]))
+        self.assertEqual(index.query((5.0, 5.0, 6.0, 6.0)), [1])
+        self.assertEqual(index.query((-1.0, -1.0, 0.0, 0.0)), [0, 1])
+
+        # Cell size follows the envelopes, an emptied index starts over
+        for polyId in range(2, 50):
+            index.insert(polyId, (polyId, 20.0, polyId + 1.0, 21.0))
+        self.assertGreater(index.cellSize, 0.25)
+        self.assertEqual(index.query((4.5, 20.5, 5.5, 30.0)), [4, 5])
+
+        for polyId in range(50):
+            index.remove(polyId)
+        self.assertEqual(index.bucket2Ids, {})
+        index.insert(0, (0.0, 0.0, 2.0, 2.0))
+        self.assertEqual(index.cellSize, 2.0)
+
+    def test_replaceCells(self):
+        decomp = Decomposition(self.chi)
+        polyId1 = decomp.add_polygon(polygon=Polygon([(0,0),(1,0),(1,1),(0,1)]), robotPosition=Point((0,0)))
+        polyId2 = decomp.add_polygon(polygon=Polygon([(1,0),(2,0),(2,1),(1,1)]), robotPosition=Point((2,0)))
+        polyId3 = decomp.add_polygon(polygon=Polygon([(2,0),(3,0),(3,1),(2,1)]), robotPosition=Point((3,0)))
+        polyId4 = decomp.add_polygon(polygon=Polygon([(0,1),(2,1),(2,2),(0,2)]), robotPosition=Point((0,2)))
+
+        newPolygon1 = Polygon([(0,0),(1.5,0),(1.5,1),(0,1)])
+        newPolygon2 = Polygon([(1.5,0),(2,0),(2,1),(1.5,1)])
+        newPolyIds = decomp.replace_cells([polyId1, polyId2], [(newPolygon1, Point((0,0))), (newPolygon2, Point((2,0)))])
+
+        reference = Decomposition(self.chi)
+        for polygonId in [polyId3, polyId4]:
+            reference.add_polygon(polygon=decomp.id2Polygon[polygonId], robotPosition=decomp.id2Position[polygonId])
+        refPolyId1 = reference.add_polygon(polygon=newPolygon1, robotPosition=Point((0,0)))
+        refPolyId2 = reference.add_polygon(polygon=newPolygon2, robotPosition=Point((2,0)))
+
+        self.assertEqual(newPolyIds, [4, 5])
+        self.assertEqual(decomp.idCounter, 6)
+        self.assertNotIn(polyId1, decomp.id2Polygon)
+        self.assertNotIn(polyId2, decomp.id2Polygon)
+        self.assertEqual(decomp.id2Adjacent[4], [polyId4, 5])
+        self.assertEqual(decomp.id2Adjacent[5], [polyId3, polyId4, 4])
+        self.assertEqual(decomp.id2Adjacent[polyId3], [5])
+        self.assertEqual(decomp.id2Adjacent[polyId4], [4, 5])
+        self.assertAlmostEqual(decomp.id2SharedLength[polyId4][4], 1.5)
+        self.assertEqual(decomp.id2Cost[4], reference.id2Cost[refPolyId1])
+        self.assertEqual(decomp.id2Cost[5], reference.id2Cost[refPolyId2])
+        self.assertEqual(decomp.spatialIndex.query(newPolygon2.bounds), [polyId3, polyId4, 4, 5])
+        self.assertEqual(list(decomp.sortedCosts), sorted([polyId3, polyId4, 4, 5], key=lambda polyId: (decomp.id2Cost[polyId], polyId)))
+
+    def test_replaceCellsRejected(self):
+        decomp = Decomposition(self.chi)
+        polyId1 = decomp.add_polygon(polygon=Polygon([(0,0),(1,0),(1,1),(0,1)]), robotPosition=Point((0,0)))
+        polyId2 = decomp.add_polygon(polygon=Polygon([(1,0),(2,0),(2,1),(1,1)]), robotPosition=Point((2,0)))
+
+        invalidPolygon = Polygon([(0,0),(1,0),(1,-1),(1,1),(0,1)])
+        newPolygon = Polygon([(1,0),(2,0),(2,1),(1,1)])
+        smallPolygon = Polygon([(0,0),(0.5,0),(0.5,1),(0,1)])
+        overlappingPolygon = Polygon([(0.5,0),(1.5,0),(1.5,1),(0.5,1)])
+        shiftedPolygon = Polygon([(1,0.5),(2,0.5),(2,1.5),(1,1.5)])
+
+        self.assertEqual(decomp.replace_cells([polyId1, polyId2], [(invalidPolygon, Point((0,0))), (newPolygon, Point((2,0)))]), None)
+        self.assertEqual(decomp.replace_cells([polyId1, 7], [(newPolygon, Point((2,0)))]), None)
+        self.assertEqual(decomp.replace_cells([polyId1, polyId2], [(smallPolygon, Point((0,0))), (newPolygon, Point((2,0)))]), None)
+
+        # Same total area, but the cells overlap and leave a gap, or cover a different region
+        self.assertEqual(decomp.replace_cells([polyId1, polyId2], [(overlappingPolygon, Point((0,0))), (newPolygon, Point((2,0)))]), None)
+        self.assertEqual(decomp.replace_cells([polyId1, polyId2], [(Polygon([(0,0),(1,0),(1,1),(0,1)]), Point((0,0))), (shiftedPolygon, Point((2,0)))]), None)
+
+        self.assertEqual(sorted(decomp.id2Polygon.keys()), [polyId1, polyId2])
+        self.assertEqual(decomp.id2Adjacent[polyId1], [polyId2])
+        self.assertEqual(len(decomp.sortedCosts), 2)
+        self.assertEqual(decomp.idCounter, 2)
+
+
+# Test suite for the array backed cell storage
+class cellStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+
+    def assertSameCells(self, decomp, reference):
+        self.assertEqual(sorted(decomp.id2Polygon.keys()), sorted(reference.id2Polygon.keys()))
+        for polyId in reference.id2Polygon.keys():
+            self.assertEqual(decomp.id2Polygon[polyId], reference.id2Polygon[polyId])
+            self.assertEqual(decomp.id2Position[polyId], reference.id2Position[polyId])
+            self.assertEqual(decomp.id2Cost[polyId], reference.id2Cost[polyId])
+            self.assertEqual(decomp.id2Adjacent[polyId], reference.id2Adjacent[polyId])
+            self.assertEqual(decomp.id2SharedLength[polyId], reference.id2SharedLength[polyId])
+        self.assertEqual(list(decomp.sortedCosts), list(reference.sortedCosts))
+
+    def test_matchesDictBackend(self):
+        decomp = Decomposition(self.chi, backend='array')
+        reference = Decomposition(self.chi)
+
+        polygons = [Polygon([(0,0),(1,0),(1,1),(0,1)]),
+                    Polygon([(1,0),(2,0),(2,1),(1,1)]),
+                    Polygon([(0,1),(1,1),(1,2),(0,2)]),
+                    Polygon([(1,1),(2,1),(2,2),(1,2)], [[(1.2,1.2),(1.4,1.2),(1.4,1.4)]]),
+                    Polygon([(1,0.5),(1.5,0.5),(1.5,1.5),(1,1.5)])]
+
+        for idx, polygon in enumerate(polygons):
+            decomp.add_polygon(polygon=polygon, robotPosition=Point((idx,0)))
+            reference.add_polygon(polygon=polygon, robotPosition=Point((idx,0)))
+        self.assertSameCells(decomp, reference)
+
+        for polyId in [1, 3]:
+            self.assertTrue(decomp.remove_polygon(polyId))
+            self.assertTrue(reference.remove_polygon(polyId))
+        self.assertFalse(decomp.remove_polygon(1))
+        self.assertSameCells(decomp, reference)
+
+        decomp.add_polygons([(polygons[1], Point((1,0))), (polygons[3], Point((3,0)))])
+        reference.add_polygons([(polygons[1], Point((1,0))), (polygons[3], Point((3,0)))])
+        self.assertSameCells(decomp, reference)
+
+        decomp.cellStore.compact()
+        self.assertSameCells(decomp, reference)
+        self.assertEqual(len(decomp.cellStore.costs), len(reference.id2Polygon))
+
+    def test_compactKeepsAdjacency(self):
+        store = ArrayCellStore()
+        for polyId in range(300):
+            store.add_cell(polyId, Polygon([(polyId,0),(polyId+1,0),(polyId+1,1),(polyId,1)]), Point((polyId,0)), float(polyId))
+            if polyId:
+                store.link(polyId, polyId - 1, 1.0)
+
+        # Removals trigger compaction once most slots are garbage
+        for polyId in range(0, 300, 3) + range(1, 300, 3):
+            store.remove_cell(polyId)
+
+        self.assertEqual(len(store.id2Polygon), 100)
+        self.assertLess(store.numSlots, 300)
+        self.assertEqual(store.id2Adjacent[2], [])
+        self.assertEqual(store.id2Polygon[2], Polygon([(2,0),(3,0),(3,1),(2,1)]))
+        self.assertEqual(store.id2Cost[299], 299.0)
+
+        store.link(5, 2, 0.5)
+        self.assertEqual(store.id2SharedLength[2], {5: 0.5})
+        store.compact()
+        self.assertEqual(store.id2Adjacent[5], [2])
+        self.assertEqual(list(store.adjIndices), [5, 2])
+
+    def test_removedLinksDroppedWithCell(self):
+        store = ArrayCellStore()
+        for polyId in range(4):
+            store.add_cell(polyId, Polygon([(polyId,0),(polyId+1,0),(polyId+1,1),(polyId,1)]), Point((polyId,0)), float(polyId))
+            if polyId:
+                store.link(polyId, polyId - 1, 1.0)
+        store.compact()
+
+        # Unlinking compacted links goes to the per-cell removal log
+        store.remove_cell(1)
+        self.assertEqual(store.removedAdjacency, {0: set([1]), 2: set([1])})
+        self.assertEqual(store.numRemovedLinks, 2)
+
+        store.remove_cell(2)
+        self.assertEqual(store.removedAdjacency, {0: set([1]), 3: set([2])})
+        self.assertEqual(store.numRemovedLinks, 2)
+        self.assertEqual(store.id2Adjacent[3], [])
+
+    def test_bulkLoadBuildsCSR(self):
+        decomp = Decomposition(self.chi, backend='array')
+        decomp.add_polygons([(Polygon([(x,y),(x+1,y),(x+1,y+1),(x,y+1)]), Point((x,y))) for x in range(10) for y in range(10)])
+
+        store = decomp.cellStore
+        self.assertEqual(store.addedAdjacency, {})
+        self.assertEqual(store.numAddedLinks, 0)
+        self.assertEqual(len(store.adjIndices), 2*180)
+
+        # Links made one by one are folded in once they outnumber the compact ones
+        for polyId in range(300):
+            store.add_cell(1000 + polyId, Polygon([(polyId,20),(polyId+1,20),(polyId+1,21),(polyId,21)]), Point((polyId,20)), 0.0)
+            if polyId:
+                store.link(1000 + polyId, 999 + polyId, 1.0)
+        self.assertLess(store.numAddedLinks, len(store.adjIndices))
+        self.assertEqual(store.numAddedLinks, sum(len(added) for added in store.addedAdjacency.values()))
+        self.assertEqual(store.id2Adjacent[1001], [1000, 1002])
+
+    def test_snapshotRoundTrip(self):
+        polygons = [Polygon([(0,0),(1,0),(1,1),(0,1)]),
+                    Polygon([(1,0),(2,0),(2,1),(1,1)], [[(1.2,0.2),(1.4,0.2),(1.4,0.4)]]),
+                    Polygon([(0,1),(2,1),(2,2),(0,2)]),
+                    Polygon([(2,0),(3,0),(3,2),(2,2)])]
+
+        snapshotFile, path = tempfile.mkstemp(suffix='.decomp')
+        os.close(snapshotFile)
+        try:
+            for backend in ['dict', 'array']:
+                decomp = Decomposition(self.chi, backend=backend)
+                decomp.add_polygons([(polygon, Point((idx,0))) for idx, polygon in enumerate(polygons)])
+                decomp.remove_polygon(0)
+                decomp.save(path)
+
+                for loadBackend in ['dict', 'array']:
+                    loaded = Decomposition.load(path, self.chi, backend=loadBackend)
+
+                    self.assertSameCells(loaded, decomp)
+                    self.assertEqual(loaded.idCounter, decomp.idCounter)
+                    self.assertEqual(loaded.spatialIndex.id2Bounds, decomp.spatialIndex.id2Bounds)
+                    self.assertEqual(loaded.spatialIndex.cellSize, decomp.spatialIndex.cellSize)
+                    self.assertEqual(loaded.get_highest_cost_id(), decomp.get_highest_cost_id())
+
+                    # Loaded decompositions can be modified like any other
+                    polyId = loaded.add_polygon(polygon=polygons[0], robotPosition=Point((0,0)))
+                    self.assertEqual(polyId, 4)
+                    self.assertEqual(sorted(loaded.id2Adjacent[polyId]), [1, 2])
+                    self.assertTrue(loaded.remove_polygon(1))
+                    self.assertEqual(loaded.id2Adjacent[2], [3, polyId])
+        finally:
+            os.remove(path)
+
+    def test_unknownBackend(self):
+        self.assertRaises(ValueError, Decomposition, self.chi, 'list')
+
+
+# Test suite for copy-on-write snapshots
+class snapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+
+    def state(self, decomp):
+        cells = dict((polyId, (decomp.id2Polygon[polyId].wkt, tuple(decomp.id2Position[polyId].coords),
+                               decomp.id2Cost[polyId], list(decomp.id2Adjacent[polyId]), dict(decomp.id2SharedLength[polyId])))
+                     for polyId in decomp.id2Polygon.keys())
+        return cells, list(decomp.sortedCosts), dict(decomp.spatialIndex.id2Bounds), decomp.idCounter
+
+    def build(self, backend):
+        decomp = Decomposition(self.chi, backend=backend)
+        decomp.add_polygons([(Polygon([(i,0),(i+1,0),(i+1,1),(i,1)]), Point((i,0))) for i in range(4)])
+        return decomp
+
+    def change(self, decomp):
+        decomp.remove_polygon(1)
+        decomp.add_polygon(polygon=Polygon([(1,0),(2,0),(2,0.5),(1,0.5)]), robotPosition=Point((1,0)))
+        decomp.add_polygon(polygon=Polygon([(1,0.5),(2,0.5),(2,1),(1.5,1.000001),(1,1)]), robotPosition=Point((1,1)))
+        decomp.replace_cells([2, 3], [(Polygon([(2,0),(3.5,0),(3.5,1),(2,1)]), Point((2,0))),
+                                      (Polygon([(3.5,0),(4,0),(4,1),(3.5,1)]), Point((4,0)))])
+
+    def test_discardRestores(self):
+        for backend in ['dict', 'array']:
+            decomp = self.build(backend)
+            original = self.state(decomp)
+
+            snapshot = decomp.snapshot()
+            self.change(decomp)
+            changed = self.state(decomp)
+            self.assertNotEqual(changed, original)
+
+            snapshot.discard()
+            self.assertEqual(self.state(decomp), original)
+            self.assertFalse(snapshot.isOpen)
+            self.assertEqual(decomp.snapshots, [])
+
+            # Repeating the same changes after a discard gives the same result
+            with decomp.snapshot():
+                self.change(decomp)
+            self.assertEqual(self.state(decomp), changed)
+
+    def test_nestedSnapshots(self):
+        decomp = self.build('array')
+        original = self.state(decomp)
+
+        outer = decomp.snapshot()
+        decomp.remove_polygon(0)
+        afterOuter = self.state(decomp)
+
+        inner = decomp.snapshot()
+        self.change(decomp)
+        inner.discard()
+        self.assertEqual(self.state(decomp), afterOuter)
+
+        inner = decomp.snapshot()
+        self.change(decomp)
+        inner.commit()
+        self.assertEqual(sorted(outer.id2State.keys()), range(8))
+
+        outer.discard()
+        self.assertEqual(self.state(decomp), original)
+
+        # Closing an outer snapshot closes the ones opened after it
+        outer = decomp.snapshot()
+        inner = decomp.snapshot()
+        self.change(decomp)
+        outer.discard()
+        self.assertFalse(inner.isOpen)
+        self.assertEqual(self.state(decomp), original)
+        self.assertRaises(ValueError, inner.commit)
+
+    def test_contextManagerDiscardsOnError(self):
+        decomp = self.build('dict')
+        original = self.state(decomp)
+
+        try:
+            with decomp.snapshot():
+                self.change(decomp)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        self.assertEqual(self.state(decomp), original)
+
+
+# Test suite for the change journal
+class journalTest(unittest.TestCase):
+    def setUp(self):
+        self.chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+
+    def state(self, decomp):
+        return dict((polyId, (decomp.id2Polygon[polyId].wkt, tuple(decomp.id2Position[polyId].coords), decomp.id2Cost[polyId],
+                              sorted(decomp.id2SharedLength[polyId].items())))
+                    for polyId in decomp.id2Polygon.keys())
+
+    def test_replayOntoSnapshot(self):
+        snapshotFile, path = tempfile.mkstemp(suffix='.decomp')
+        os.close(snapshotFile)
+        try:
+            for backend in ['dict', 'array']:
+                decomp = Decomposition(self.chi, backend=backend)
+                decomp.add_polygons([(Polygon([(i,0),(i+1,0),(i+1,1),(i,1)]), Point((i,0))) for i in range(4)])
+                decomp.save(path)
+                baseVersion = decomp.journal.version
+
+                # The second polygon re-snaps the first one
+                decomp.add_polygon(polygon=Polygon([(10,0),(10.99999,0),(10.99999,1)]), robotPosition=Point((10,0)))
+                decomp.add_polygon(polygon=Polygon([(11,0.5),(12,0.5),(12,1.5),(11,1.5)]), robotPosition=Point((11,0)))
+
+                decomp.remove_polygon(1)
+                decomp.add_polygon(polygon=Polygon([(1,0),(2,0),(2,0.5),(1,0.5)]), robotPosition=Point((1,0)))
+                decomp.add_polygon(polygon=Polygon([(1,0.5),(2,0.5),(2,1),(1.5,1.000001),(1,1)]), robotPosition=Point((1,1)))
+
+                snapshot = decomp.snapshot()
+                decomp.replace_cells([2, 3], [(Polygon([(2,0),(3.5,0),(3.5,1),(2,1)]), Point((2,0))),
+                                              (Polygon([(3.5,0),(4,0),(4,1),(3.5,1)]), Point((4,0)))])
+                snapshot.discard()
+
+                self.assertNotEqual(decomp.replace_cells([0, 6], [(Polygon([(0,0),(1.5,0),(1.5,0.5),(1,0.5),(1,1),(0,1)]), Point((0,0))),
+                                                                  (Polygon([(1.5,0),(2,0),(2,0.5),(1.5,0.5)]), Point((2,0)))]), None)
+
+                changes = list(decomp.journal.changes_since(baseVersion))
+                self.assertEqual([event.version for event in changes], range(baseVersion + 1, decomp.journal.version + 1))
+                self.assertEqual(set(event.kind for event in changes), set(['added', 'removed', 'resnapped', 'linked']))
+
+                for loadBackend in ['dict', 'array']:
+                    replica = Decomposition.load(path, self.chi, backend=loadBackend)
+                    self.assertEqual(replica.journal.version, baseVersion)
+
+                    replica.apply_changes(decomp.journal.changes_since(replica.journal.version))
+                    self.assertEqual(self.state(replica), self.state(decomp))
+                    self.assertEqual(list(replica.sortedCosts), list(decomp.sortedCosts))
+                    self.assertEqual(replica.spatialIndex.id2Bounds, decomp.spatialIndex.id2Bounds)
+        finally:
+            os.remove(path)
+
+    def test_changesSinceAndTruncate(self):
+        journal = ChangeJournal()
+        for polyId in range(5):
+            journal.record('removed', polyId)
+
+        self.assertEqual([event.polyId for event in journal.changes_since(2)], [2, 3, 4])
+        self.assertEqual(list(journal.changes_since(5)), [])
+
+        journal.truncate(3)
+        self.assertEqual(len(journal), 2)
+        self.assertEqual([event.version for event in journal.changes_since(3)], [4, 5])
+        self.assertRaises(ValueError, list, journal.changes_since(2))
+
+
+# Test suite for shared edge hashing
+class sharedEdgeTest(unittest.TestCase):
+
+    def test_sharedEdge(self):
+        polygons = {0: Polygon([(0,0),(1,0),(1,1),(0,1)]),
+                    1: Polygon([(1,0.5),(2,0.5),(2,1.5),(1,1.5)]),
+                    2: Polygon([(1,1.5),(2,1.5),(2,2.5),(1,2.5)]),
+                    3: Polygon([(0,1),(1,1),(0.5,2)])}
+
+        sharedEdges = compute_shared_edges(polygons, 1e-5)
+
+        self.assertEqual(sorted(sharedEdges.keys()), [(0, 1), (0, 3), (1, 2)])
+        self.assertAlmostEqual(sharedEdges[(0, 1)], 0.5)
+        self.assertAlmostEqual(sharedEdges[(0, 3)], 1.0)
+        self.assertAlmostEqual(sharedEdges[(1, 2)], 1.0)
+
+    def test_touchingAtPoint(self):
+        polygons = {0: Polygon([(0,0),(1,0),(1,1),(0,1)]),
+                    1: Polygon([(1,1),(2,1),(2,2),(1,2)]),
+                    2: Polygon([(1,0),(2,0),(2,-1)])}
+
+        self.assertEqual(compute_shared_edges(polygons, 1e-5), {})
+
+    def test_slantedEdgeFarFromOrigin(self):
+        polygons = {0: Polygon([(1000,1000),(1003,1001),(1000,1001)]),
+                    1: Polygon([(1000,1000),(1006,1000),(1006,1002)]),
+                    2: Polygon([(1003,1001),(1006,1002),(1004,1003)])}
+
+        sharedEdges = compute_shared_edges(polygons, 1e-5)
+
+        self.assertEqual(sorted(sharedEdges.keys()), [(0, 1), (1, 2)])
+        self.assertAlmostEqual(sharedEdges[(0, 1)], 10**0.5)
+        self.assertAlmostEqual(sharedEdges[(1, 2)], 10**0.5)
+
+
+# Test suite for the vectorised snapping kernel
+class snappingTest(unittest.TestCase):
+
+    def test_snapPoints(self):
+        polygon = Polygon([(0,0),(1,0),(1,1),(0,1)])
+        points = [(1.000001, 0.5), (0.5, 0.999999), (2, 2), (0.5, 0.5), (1, 1), (-0.000001, -0.000001)]
+
+        snapped = snap_points(points, polygon, 1e-5)
+
+        self.assertEqual([tuple(point) for point in snapped],
+                         [(1.0, 0.5), (0.5, 0.999999), (2.0, 2.0), (0.5, 0.5), (1.0, 1.0), (0.0, 0.0)])
+
+    def test_pointsInPolygonHorizontalEdges(self):
+        corners = np.array([(0,0),(1,0),(1,1),(0,1)], dtype=np.float64)
+        points = np.array([(0.5,0.5), (2,0.5), (0.5,0), (0.5,2)], dtype=np.float64)
+
+        # Horizontal edges never straddle a point, they must not produce NaN on the way.
+        with np.errstate(all='raise'):
+            inside = points_in_polygon(points, corners, np.roll(corners, -1, axis=0))
+
+        self.assertEqual(inside[[0, 1, 3]].tolist(), [True, False, False])
+
+    def test_ringParameters(self):
+        polygon = Polygon([(0,0),(2,0),(2,1),(0,1)])
+        points = [(0,0), (1,0), (2,0.5), (1.5,1), (0,0.25), (2.000001, 0.75)]
+
+        parameters = ring_parameters(points, polygon.exterior, 1e-5)
+
+        for point, parameter in zip(points, parameters):
+            self.assertAlmostEqual(parameter, polygon.exterior.project(Point(point)))
+
+    def test_deduplicate(self):
+        points = [(0,0), (1,0), (1e-12,0), (1,0), (0.5,0.5), (0,1e-12)]
+
+        self.assertEqual(deduplicate(points), [0, 1, 4])
+
+
+# Test suite for the order-statistics cost structure
+class sortedCostsTest(unittest.TestCase):
+
+    def test_matchesSortedList(self):
+        import random
+        rng = random.Random(1)
+
+        sortedCosts = SortedCosts()
+        reference = {}
+        for polyId in range(200):
+            cost = float(rng.randint(0, 20))
+            sortedCosts.add(polyId, cost)
+            reference[polyId] = cost
+
+            if rng.random() < 0.3:
+                removeId = rng.choice(list(reference.keys()))
+                self.assertTrue(sortedCosts.remove(removeId))
+                del reference[removeId]
+
+        expected = sorted(reference.keys(), key=lambda polyId: (reference[polyId], polyId))
+
+        self.assertEqual(len(sortedCosts), len(expected))
+        self.assertEqual(list(sortedCosts), expected)
+        self.assertEqual([sortedCosts[i] for i in range(len(expected))], expected)
+        self.assertEqual(sortedCosts[-1], expected[-1])
+        self.assertEqual(sortedCosts.max_id(), expected[-1])
+        self.assertEqual(sortedCosts.min_id(), expected[0])
+        self.assertEqual(sortedCosts.top_k(5), expected[::-1][:5])
+        for rank, polyId in enumerate(expected):
+            self.assertEqual(sortedCosts.rank(polyId), rank)
+
+    def test_percentile(self):
+        sortedCosts = SortedCosts()
+        for polyId, cost in enumerate([4.0, 1.0, 3.0, 2.0, 5.0]):
+            sortedCosts.add(polyId, cost)
+
+        self.assertEqual(sortedCosts.percentile(0), 1.0)
+        self.assertEqual(sortedCosts.percentile(50), 3.0)
+        self.assertEqual(sortedCosts.percentile(100), 5.0)
+        self.assertEqual(sortedCosts.percentile(12.5), 1.5)
+
+    def test_load(self):
+        costs = [3.0, 1.0, 2.0, 1.0, 5.0, 2.0]*20
+
+        sortedCosts = SortedCosts()
+        sortedCosts.load(range(len(costs)), costs)
+        sortedCosts.add(1000, 2.0)
+        sortedCosts.remove(4)
+
+        expected = sorted([polyId for polyId in range(len(costs)) if polyId != 4] + [1000],
+                          key=lambda polyId: (2.0 if polyId == 1000 else costs[polyId], polyId))
+        self.assertEqual(list(sortedCosts), expected)
+        self.assertEqual([sortedCosts[i] for i in range(len(expected))], expected)
+        self.assertEqual(sortedCosts.max_id(), expected[-1])
+        self.assertEqual(sortedCosts.rank(1000), expected.index(1000))
+
+    def test_empty(self):
+        sortedCosts = SortedCosts()
+
+        self.assertEqual(sortedCosts.max_id(), None)
+        self.assertEqual(sortedCosts.min_cost(), None)
+        self.assertEqual(sortedCosts.percentile(50), None)
+        self.assertFalse(sortedCosts.remove(0))
+
+        sortedCosts.add(0, 1.0)
+        sortedCosts.remove(0)
+        self.assertEqual(sortedCosts.max_id(), None)
+        self.assertEqual(len(sortedCosts), 0)
+
 
 def suite():
     """
@@ -411,6 +1033,12 @@ def suite():
     """
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(decompositionTest))
+    test_suite.addTest(unittest.makeSuite(cellStoreTest))
+    test_suite.addTest(unittest.makeSuite(snapshotTest))
+    test_suite.addTest(unittest.makeSuite(journalTest))
+    test_suite.addTest(unittest.makeSuite(sharedEdgeTest))
+    test_suite.addTest(unittest.makeSuite(snappingTest))
+    test_suite.addTest(unittest.makeSuite(sortedCostsTest))
     return test_suite
 
 mySuit = suite()
@@ -1,20 +1,58 @@
+import numpy as np
+
 from shapely.geometry import Polygon
 from shapely.geometry import LineString
 from shapely.geometry import Point
 
+from decomposition.adjacency import compute_shared_edges
+from polygon_split.canonical import CanonicalPolygon
+from polygon_split.polygon_split import convert_to_canonical
+
+
+SNAP_TOLLERANCE = 1e-06
+
 
-def collinear_correction(decomp):
+def collinear_correction(decomp=[]):
+	"""
+	Removes the vertices that lie on the line through their two neighbours.
+
+	Params:
+		decomp: A list of shapely polygons or CanonicalPolygon objects.
 
+	Returns:
+		A list of CanonicalPolygon objects without the vertices that are within
+		SNAP_TOLLERANCE of the line through their neighbours.
+	"""
+
+	corrected = []
 	for poly in decomp:
-		boundary = poly[0]
-		i = 0
-		while i < len(boundary):
-			p1 = boundary[i]
-			p2 = boundary[(i+1)%len(boundary)]
-			p3 = boundary[(i+2)%len(boundary)]
-			if cuts.collinear(p1, p2, p3):
-				del boundary[(i+1)%len(boundary)]
-			i += 1
+		poly = convert_to_canonical(poly)
+		if not isinstance(poly, CanonicalPolygon):
+			return []
+
+		corrected.append(CanonicalPolygon(poly.exterior[_non_collinear(poly.exterior)],
+										  [hole[_non_collinear(hole)] for hole in poly.holes]))
+
+	return corrected
+
+
+def _non_collinear(ring):
+	"""
+	Mask of the vertices of a ring that are further than SNAP_TOLLERANCE from the line
+	through their neighbours.
+	"""
+
+	if len(ring) < 4:
+		return np.ones(len(ring), dtype=bool)
+
+	previous = np.roll(ring, 1, axis=0)
+	spans = np.roll(ring, -1, axis=0) - previous
+	offsets = ring - previous
+	spanLengths = np.sqrt((spans*spans).sum(axis=1))
+
+	distances = np.abs(spans[:, 0]*offsets[:, 1] - spans[:, 1]*offsets[:, 0])
+
+	return distances > SNAP_TOLLERANCE*np.maximum(spanLengths, SNAP_TOLLERANCE)
 
 def compute_adjacency(decomposition=[]):
 	"""
@@ -25,38 +63,28 @@ def compute_adjacency(decomposition=[]):
 	Assumption:
 		The polygons are considered adjacent if their boundaries intersect at an
 		edge. If they only touch at a point, then will not be considered
-		adjacent.
+		adjacent. Shared edges are found by hashing collinear edges of all
+		polygons at once, no overlay operations are performed.
 
 	Params:
-		decomposition: A list of polygons in the canonical form.
+		decomposition: A list of shapely polygons or CanonicalPolygon objects.
 
 	Returns:
 		A 2D list representing adjacency relation between polygons.
 	"""
 
+	for polygon in decomposition:
+		if not isinstance(polygon, (Polygon, CanonicalPolygon)):
+			print("Computing adjacency but decomposition contains invalid polygons")
+			return []
+
 	# Initialize the 2D matric with None values.
 	adjMatrix = [[False for i in range(len(decomposition))] for i in range(len(decomposition))]
 
-	for polyAIdx in range(len(decomposition)):
-		for polyBIdx in range(polyAIdx + 1, len(decomposition)):
-
-			try:
-				polyAShapely = decomposition[polyAIdx]
-				polyBShapely = decomposition[polyBIdx]
-			except:
-				print("Computing adjacency but decomposition contains invalid polygons")
-				return []
-
-			if not polyAShapely.touches(polyBShapely):
-				continue
-
-			intersection = polyAShapely.intersection(polyBShapely)
-
-			if type(intersection) is Point:
-				continue
-			else:
-				adjMatrix[polyAIdx][polyBIdx] = True
-				adjMatrix[polyBIdx][polyAIdx] = True
+	sharedEdges = compute_shared_edges(dict(enumerate(decomposition)), SNAP_TOLLERANCE)
+	for polyAIdx, polyBIdx in sharedEdges.keys():
+		adjMatrix[polyAIdx][polyBIdx] = True
+		adjMatrix[polyBIdx][polyAIdx] = True
 
 	return adjMatrix
 
@@ -74,10 +102,10 @@ if __name__ == '__main__':
 			   [[(1, 0), (2, 0), (2, 1), (1, 1)], []],
 			   [[(1, 1), (2, 1), (2, 2), (1, 2)], []],
 			   [[(0, 1), (1, 1), (1, 2), (0, 2)], []]]
-	print(compute_adjacency(polySet))
+	print(compute_adjacency([CanonicalPolygon(*poly) for poly in polySet]))
 
 	polySet = [[[(0, 0), (1, 0), (1, 1), (0.5, 0.5), (0, 1)], []],
 			   [[(1, 0), (2, 0), (2, 1), (1, 1)], []],
 			   [[(1, 1), (2, 1), (2, 2), (1, 2)], []],
 			   [[(0, 1), (0.5, 0.5), (1, 1), (1, 2), (0, 2)], []]]
-	print(compute_adjacency(polySet))
\ No newline at end of file
+	print(compute_adjacency([CanonicalPolygon(*poly) for poly in polySet]))
\ No newline at end of file
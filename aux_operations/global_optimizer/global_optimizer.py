@@ -2,6 +2,7 @@ import logging
 
 from decomposition.decomposition import Decomposition
 from metrics.chi import ChiMetric
+from instrumentation import profiling
 from recursive_step import dft_recursion
 
 # Configure logging properties for this module
@@ -23,23 +24,34 @@ logger.setLevel(logging.INFO)
 
 def global_optimize(decomposition = [],
 				    numIterations = 10,
-				    metric=[]):
+				    metric=[],
+				    candidateCache=None):
 	"""
 	Performs pairwise reoptimizations on the cells in the decomposition.
 
+	If instrumentation is enabled (instrumentation.profiling.enable()), a summary of
+	timers and counters is logged at the end of the run.
+
 	Args:
 		decomposition: A Decomposition object representing decomposition of the polygon.
 		numIterations: The number of iterations or reoptimization cuts to make
 		metric: An instance of metric class for computing cut cost.
+		candidateCache: Optional MetricCache for cut candidates, see compute_pairwise_optimal().
 	Returns:
 		decomposition: New decomposition after the original one was optimized.
 	"""
 	
-	for i in range(numIterations):
-		logger.debug("Iteration: %3d/%3d"%(i, numIterations))
+	with profiling.timer('global_optimize'):
+		for i in range(numIterations):
+			logger.debug("Iteration: %3d/%3d", i, numIterations)
+
+			with profiling.timer('global_optimize.iteration'):
+				if not dft_recursion(decomposition, decomposition.get_highest_cost_id(), metric, candidateCache):
+					profiling.count('global_optimize.iterations_without_cut')
+					logger.debug("Iteration: %3d/%3d: No cut was made!", i, numIterations)
 
-		if not dft_recursion(decomposition, decomposition.sortedCosts[-1], metric):
-			logger.debug("Iteration: %3d/%3d: No cut was made!"%(i, numIterations))
+	if profiling.is_enabled():
+		logger.info("Profiling summary:\n%s", profiling.report())
 	
 	return decomposition
 
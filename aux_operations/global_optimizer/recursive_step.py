@@ -9,6 +9,7 @@ from shapely.geometry import LineString
 from metrics.chi import ChiMetric
 from pairwise_optimizer.pairwise_reopt import compute_pairwise_optimal
 from decomposition.decomposition import Decomposition
+from instrumentation import profiling
 
 # Configure logging properties for this module
 logger = logging.getLogger("recursive_step")
@@ -30,7 +31,8 @@ logger.setLevel(logging.DEBUG)
 # Need to move these to the main calling function
 def dft_recursion(decomposition=[],
 				  maxCostPolygonId=0,
-				  metric=[]):
+				  metric=[],
+				  candidateCache=None):
 	"""
 	This is a recursive function that explores all pairs of cells starting with
 	one with the highest cost. The purpose is to re-optimize cuts of adjacent
@@ -40,21 +42,24 @@ def dft_recursion(decomposition=[],
 		decomposition: A Decomposition object representing decompoisiton of the polygon.
 		maxCostPolygonId: Index of a cell in the decomposition with the maximum cost.
 		metric: An instance of a metric class for computing the cost of a cut.
+		candidateCache: Optional MetricCache shared by all pairwise reoptimizations.
 
 	Returns:
 		True if a succseful reoptimization was performed. False otherwise.
 	"""
 
+	profiling.count('recursive_step.calls')
+
 	maxPolygonCost = decomposition.id2Cost[maxCostPolygonId]
-	logger.debug("Cell %d has maximum cost of : %f"%(maxCostPolygonId, maxPolygonCost))
+	logger.debug("Cell %d has maximum cost of : %f", maxCostPolygonId, maxPolygonCost)
 
 	surroundingCellIdxs = decomposition.id2Adjacent[maxCostPolygonId]
-	logger.debug("Surrounding Cell Idxs: %s"%(surroundingCellIdxs,))
+	logger.debug("Surrounding Cell Idxs: %s", surroundingCellIdxs)
 
 	surroundingChiCosts = [(polygonId, decomposition.id2Cost[polygonId]) for polygonId in surroundingCellIdxs]
 
 	sortedSurroundingChiCosts = sorted(surroundingChiCosts, key=lambda v:v[1], reverse=False)
-	logger.debug("Neghbours and chi: %s"%sortedSurroundingChiCosts)
+	logger.debug("Neghbours and chi: %s", sortedSurroundingChiCosts)
 
 	# Idea: For a given cell with maximum cost, search all the neighbors
 	#		and sort them based on their chi cost.
@@ -80,44 +85,48 @@ def dft_recursion(decomposition=[],
 	for cellIdx, cellChiCost in sortedSurroundingChiCosts:
 
 		if cellChiCost < maxPolygonCost:
-			logger.debug("Attempting reopt %d and %d."%(maxCostPolygonId, cellIdx))
+			logger.debug("Attempting reopt %d and %d.", maxCostPolygonId, cellIdx)
 
 			result = compute_pairwise_optimal(polygonA=decomposition.id2Polygon[maxCostPolygonId],
 											  polygonB=decomposition.id2Polygon[cellIdx],
 											  robotAInitPos=decomposition.id2Position[maxCostPolygonId],
 											  robotBInitPos=decomposition.id2Position[cellIdx],
 											  nrOfSamples=50,
-											  metric=metric)
+											  metric=metric,
+											  candidateCache=candidateCache)
 
 			if result:
 				# Resolve cell-robot assignments here.
 				# This is to avoid the issue of cell assignments that
 				# don't make any sense after polygon cut.
-				chiA0 = metric.compute(polygon=result[0], initialPosition=decomposition.id2Position[maxCostPolygonId])
-				chiA1 = metric.compute(polygon=result[1], initialPosition=decomposition.id2Position[maxCostPolygonId])
-				chiB0 = metric.compute(polygon=result[0], initialPosition=decomposition.id2Position[cellIdx])
-				chiB1 = metric.compute(polygon=result[1], initialPosition=decomposition.id2Position[cellIdx])
+				costs = metric.compute_assignments(polygons=result,
+												   positions=[decomposition.id2Position[maxCostPolygonId],
+															  decomposition.id2Position[cellIdx]])
+				(chiA0, chiB0), (chiA1, chiB1) = costs
 
 				maxCostPoint = Point(decomposition.id2Position[maxCostPolygonId])
 				cellIdxPoint = Point(decomposition.id2Position[cellIdx])
 
-				decomposition.remove_polygon(maxCostPolygonId)
-				decomposition.remove_polygon(cellIdx)
-
 				if max(chiA0, chiB1) <= max(chiA1, chiB0):
-					decomposition.add_polygon(polygon=result[0], robotPosition=maxCostPoint)
-					decomposition.add_polygon(polygon=result[1], robotPosition=cellIdxPoint)
+					newCells = [(result[0], maxCostPoint), (result[1], cellIdxPoint)]
 				else:
-					decomposition.add_polygon(polygon=result[0], robotPosition=cellIdxPoint)
-					decomposition.add_polygon(polygon=result[1], robotPosition=maxCostPoint)
+					newCells = [(result[0], cellIdxPoint), (result[1], maxCostPoint)]
+
+				# The new cells cover the same region, so the pair is swapped in one step.
+				if decomposition.replace_cells([maxCostPolygonId, cellIdx], newCells) is None:
+					profiling.count('recursive_step.replace_rejected')
+					logger.debug("Cells %d and %d could not be replaced.", maxCostPolygonId, cellIdx)
+					continue
 
-				logger.debug("Cells %d and %d reopted."%(maxCostPolygonId, cellIdx))
+				profiling.count('recursive_step.reoptimizations')
+				logger.debug("Cells %d and %d reopted.", maxCostPolygonId, cellIdx)
 
 				return True
 			else:
 				if dft_recursion(decomposition=decomposition,
 								 maxCostPolygonId=cellIdx,
-								 metric=metric):
+								 metric=metric,
+								 candidateCache=candidateCache):
 					return True
 	return False
 
@@ -0,0 +1,148 @@
+import logging
+import time
+from itertools import product
+from multiprocessing import Pool
+from multiprocessing import cpu_count
+
+from decomposition.decomposition import Decomposition
+from metrics.chi import ChiMetric
+from metrics.metric_cache import MetricCache
+from global_optimizer import global_optimize
+
+# Configure logging properties for this module
+logger = logging.getLogger("sweep")
+#fileHandler = logging.FileHandler("logs/sweep.log")
+
+streamHandler = logging.StreamHandler()
+
+#logger.addHandler(fileHandler)
+logger.addHandler(streamHandler)
+
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+#fileHandler.setFormatter(formatter)
+streamHandler.setFormatter(formatter)
+
+logger.setLevel(logging.INFO)
+
+
+def parameter_grid(radii=[], linearPenalties=[], angularPenalties=[], contourLevelStep=1):
+	"""
+	Builds the configurations for every combination of the given ChiMetric parameters.
+
+	Returns:
+		A list of dictionaries of ChiMetric arguments.
+	"""
+
+	return [{'radius': radius,
+			 'linearPenalty': linearPenalty,
+			 'angularPenalty': angularPenalty,
+			 'contourLevelStep': contourLevelStep}
+			for radius, linearPenalty, angularPenalty in product(radii, linearPenalties, angularPenalties)]
+
+
+def run_sweep(decomposition=[], configurations=[], numIterations=10, numProcesses=None, cacheSize=100000):
+	"""
+	Runs global_optimize on a copy of the decomposition for every ChiMetric configuration.
+
+	Cut candidates do not depend on the metric and F2 and F3 only depend on the radius.
+	Configurations with the same radius are run in the same process and share caches of
+	candidates and terms. All runs start from the same cells, so the first cuts and their
+	terms are computed once per process. Configurations are split over numProcesses
+	workers, keeping configurations with the same radius together where there are enough
+	of them to go around.
+
+	Params:
+		decomposition: A Decomposition object, it is not modified.
+		configurations: A list of dictionaries of ChiMetric arguments, see parameter_grid().
+		numIterations: Iterations of global_optimize for every configuration.
+		numProcesses: Number of worker processes, None for one per cpu, 1 to run in this process.
+		cacheSize: Maximum number of cached terms and candidate sets per worker.
+	Returns:
+		A list of result rows in the order of configurations. Every row holds the
+		configuration and maxCost, numCells and seconds of its run.
+	"""
+
+	cells = [(decomposition.id2Polygon[polyId], decomposition.id2Position[polyId])
+			 for polyId in sorted(decomposition.id2Polygon.keys())]
+
+	# Group configurations that can share terms
+	terms2Indices = {}
+	for idx, configuration in enumerate(configurations):
+		termsKey = (configuration['radius'], configuration.get('contourLevelStep', 1))
+		terms2Indices.setdefault(termsKey, []).append(idx)
+
+	if numProcesses is None:
+		numProcesses = cpu_count()
+
+	chunkSize = max(1, -(-len(configurations)//numProcesses))
+	tasks = []
+	for termsKey in sorted(terms2Indices):
+		indices = terms2Indices[termsKey]
+		for start in range(0, len(indices), chunkSize):
+			chunk = indices[start:start + chunkSize]
+			tasks.append((cells, [(idx, configurations[idx]) for idx in chunk], numIterations, cacheSize))
+
+	logger.info("Sweeping %d configurations in %d tasks.", len(configurations), len(tasks))
+
+	if numProcesses == 1:
+		results = [_run_configurations(task) for task in tasks]
+	else:
+		pool = Pool(numProcesses)
+		try:
+			results = pool.map(_run_configurations, tasks)
+		finally:
+			pool.close()
+			pool.join()
+
+	rows = [None]*len(configurations)
+	for taskRows in results:
+		for idx, row in taskRows:
+			rows[idx] = row
+
+	return rows
+
+
+def format_sweep(rows=[]):
+	"""
+	Returns a human readable table of sweep results, best configuration first.
+	"""
+
+	lines = ["%10s %14s %14s %12s %8s %10s" % ("Radius", "Lin. penalty", "Ang. penalty", "Max cost", "Cells", "Time [s]")]
+	for row in sorted(rows, key=lambda row: row['maxCost']):
+		lines.append("%10g %14g %14g %12.4f %8d %10.2f" % (row['radius'], row['linearPenalty'], row['angularPenalty'],
+														   row['maxCost'], row['numCells'], row['seconds']))
+
+	return "\n".join(lines)
+
+
+def _run_configurations(task):
+	"""
+	Runs a list of configurations one after the other with shared caches.
+	"""
+
+	cells, configurations, numIterations, cacheSize = task
+	termsCache = MetricCache(maxSize=cacheSize)
+	candidateCache = MetricCache(maxSize=cacheSize)
+
+	rows = []
+	for idx, configuration in configurations:
+		startTime = time.time()
+
+		metric = ChiMetric(**configuration)
+		metric.enable_terms_cache(cache=termsCache)
+
+		decomposition = Decomposition(metric)
+		decomposition.add_polygons(cells)
+		global_optimize(decomposition=decomposition, numIterations=numIterations, metric=metric,
+						candidateCache=candidateCache)
+
+		row = dict(configuration)
+		row['maxCost'] = decomposition.get_highest_cost()
+		row['numCells'] = len(decomposition.id2Polygon)
+		row['seconds'] = time.time() - startTime
+		rows.append((idx, row))
+
+	logger.debug("Terms cache: %s, candidate cache: %s", termsCache.stats(), candidateCache.stats())
+
+	return rows
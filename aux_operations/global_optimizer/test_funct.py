@@ -10,7 +10,13 @@ from descartes.patch import PolygonPatch
 from decomposition.decomposition import Decomposition
 from global_optimizer import global_optimize
 from recursive_step import dft_recursion
+from sweep import format_sweep
+from sweep import parameter_grid
+from sweep import run_sweep
 from metrics.chi import ChiMetric
+from decomposition_processing import collinear_correction
+from decomposition_processing import compute_adjacency
+from polygon_split.canonical import CanonicalPolygon
 
 def plot_coords(ax, ob):
     x, y = ob.xy
@@ -78,6 +84,65 @@ class recursiveStepTest(unittest.TestCase):
 
         dft_recursion(decomp, 3, self.chi)
 
+# Test suite for parameter sweeps
+class sweepTest(unittest.TestCase):
+    def setUp(self):
+        self.chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+
+        self.decomp = Decomposition(self.chi)
+        self.decomp.add_polygon(polygon=Polygon([(0.0,0.0),(1.0,0.0),(1.0,1.0),(0.0,1.0)],[]), robotPosition=Point((-10,0)))
+        self.decomp.add_polygon(polygon=Polygon([(1.0,0.0),(2.0,0.0),(2.0,1.0),(1.0,1.0)],[]), robotPosition=Point((2,1)))
+
+    def test_parameterGrid(self):
+        grid = parameter_grid(radii=[0.1, 0.2], linearPenalties=[1.0], angularPenalties=[0.1, 0.2, 0.3])
+        self.assertEqual(len(grid), 6)
+        self.assertEqual(grid[1], {'radius': 0.1, 'linearPenalty': 1.0, 'angularPenalty': 0.2, 'contourLevelStep': 1})
+
+    def test_sweep(self):
+        grid = parameter_grid(radii=[0.1, 0.2], linearPenalties=[1.0], angularPenalties=[10*1.0/360, 20*1.0/360])
+        rows = run_sweep(decomposition=self.decomp, configurations=grid, numIterations=1, numProcesses=1)
+
+        self.assertEqual(len(self.decomp.id2Polygon), 2)
+        self.assertEqual([row['angularPenalty'] for row in rows], [configuration['angularPenalty'] for configuration in grid])
+
+        # Every row matches an independent run
+        for configuration, row in zip(grid, rows):
+            metric = ChiMetric(**configuration)
+            decomp = Decomposition(metric)
+            decomp.add_polygons([(self.decomp.id2Polygon[polyId], self.decomp.id2Position[polyId]) for polyId in [0, 1]])
+            global_optimize(decomposition=decomp, metric=metric, numIterations=1)
+            self.assertEqual(row['maxCost'], decomp.get_highest_cost())
+
+        self.assertIn("Max cost", format_sweep(rows))
+
+    # The suite runs when this module is imported. Under Python 2 a pool forked while an
+    # import holds the import lock never returns, so the workers only run from the script.
+    @unittest.skipUnless(__name__ == '__main__', "forks worker processes, run test_funct.py as a script")
+    def test_sweepPool(self):
+        grid = parameter_grid(radii=[0.1, 0.2], linearPenalties=[1.0], angularPenalties=[10*1.0/360, 20*1.0/360])
+        rows = run_sweep(decomposition=self.decomp, configurations=grid, numIterations=1, numProcesses=2)
+
+        self.assertEqual(rows, [dict(row, seconds=pooledRow['seconds']) for row, pooledRow in
+                                zip(run_sweep(decomposition=self.decomp, configurations=grid, numIterations=1, numProcesses=1), rows)])
+
+
+class decompositionProcessingTest(unittest.TestCase):
+    def test_computeAdjacency(self):
+        decomp = [CanonicalPolygon([(0, 0), (1, 0), (1, 1), (0, 1)]),
+                  Polygon([(1, 0), (2, 0), (2, 1), (1, 1)]),
+                  CanonicalPolygon([(1, 1), (2, 1), (2, 2), (1, 2)])]
+        self.assertEqual(compute_adjacency(decomp), [[False, True, False], [True, False, True], [False, True, False]])
+        self.assertEqual(compute_adjacency([[[(0, 0), (1, 0), (1, 1)], []]]), [])
+
+    def test_collinearCorrection(self):
+        decomp = [Polygon([(0, 0), (1, 0), (2, 0), (2, 2), (0, 2), (0, 1)], [[(0.5, 0.5), (0.5, 1.5), (1.0, 1.5), (1.5, 1.5), (1.5, 0.5)]]),
+                  CanonicalPolygon([(2, 0), (3, 0), (3, 1), (2, 1)])]
+        corrected = collinear_correction(decomp)
+
+        self.assertEqual(corrected[0][0].tolist(), [[0, 0], [2, 0], [2, 2], [0, 2]])
+        self.assertEqual(corrected[0][1][0].tolist(), [[0.5, 0.5], [0.5, 1.5], [1.5, 1.5], [1.5, 0.5]])
+        self.assertEqual(corrected[1][0].tolist(), decomp[1][0].tolist())
+
 
 def suite():
     """
@@ -86,6 +151,8 @@ def suite():
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(globalOptimizerTest))
     test_suite.addTest(unittest.makeSuite(recursiveStepTest))
+    test_suite.addTest(unittest.makeSuite(sweepTest))
+    test_suite.addTest(unittest.makeSuite(decompositionProcessingTest))
     return test_suite
 
 mySuit = suite()
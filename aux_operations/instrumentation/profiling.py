@@ -0,0 +1,178 @@
+"""
+Named timers and counters for the optimisation pipeline.
+
+Instrumentation is off by default. While off, timer() returns a shared no-op context
+manager, count() returns right away and functions wrapped with timed() are called
+directly, so the hooks can stay in hot paths.
+
+Usage:
+	profiling.enable()
+	global_optimize(...)
+	print(profiling.report())
+
+Timers are inclusive: a timed function that calls another timed function contributes
+to both timers.
+"""
+
+from functools import wraps
+from timeit import default_timer
+
+
+_enabled = False
+
+# name -> [number of calls, total seconds, longest call in seconds]
+timers = {}
+
+# name -> accumulated value
+counters = {}
+
+
+def enable():
+	global _enabled
+	_enabled = True
+
+
+def disable():
+	global _enabled
+	_enabled = False
+
+
+def is_enabled():
+	return _enabled
+
+
+def reset():
+	"""
+	Clears all timers and counters. Does not change whether instrumentation is enabled.
+	"""
+
+	timers.clear()
+	counters.clear()
+
+
+def count(name, value=1):
+	"""
+	Adds value to the counter with the given name.
+	"""
+
+	if not _enabled:
+		return
+
+	counters[name] = counters.get(name, 0) + value
+
+
+def add_time(name, seconds):
+	"""
+	Records a single call of the given duration on the timer with the given name.
+	"""
+
+	if not _enabled:
+		return
+
+	timer = timers.get(name)
+	if timer is None:
+		timers[name] = [1, seconds, seconds]
+	else:
+		timer[0] += 1
+		timer[1] += seconds
+		timer[2] = max(timer[2], seconds)
+
+
+class _Timer:
+	"""
+	Context manager recording the time spent in its block on a named timer.
+	"""
+
+	__slots__ = ('name', 'start')
+
+	def __init__(self, name):
+		self.name = name
+		self.start = 0.0
+
+	def __enter__(self):
+		self.start = default_timer()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		add_time(self.name, default_timer() - self.start)
+		return False
+
+
+class _NullTimer:
+	"""
+	Context manager used while instrumentation is off.
+	"""
+
+	__slots__ = ()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+	"""
+	Returns a context manager timing its block under the given name.
+	"""
+
+	if not _enabled:
+		return _NULL_TIMER
+
+	return _Timer(name)
+
+
+def timed(name):
+	"""
+	Decorator timing every call of a function under the given name.
+	"""
+
+	def decorator(function):
+
+		@wraps(function)
+		def wrapper(*args, **kwargs):
+			if not _enabled:
+				return function(*args, **kwargs)
+
+			start = default_timer()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				add_time(name, default_timer() - start)
+
+		return wrapper
+
+	return decorator
+
+
+def summary():
+	"""
+	Returns a copy of the recorded data.
+
+	Returns:
+		A dictionary {'timers': {name: (calls, total, max)}, 'counters': {name: value}}.
+	"""
+
+	return {'timers': dict((name, tuple(timer)) for name, timer in timers.items()),
+			'counters': dict(counters)}
+
+
+def report():
+	"""
+	Returns a human readable summary of all timers, slowest first, followed by all counters.
+	"""
+
+	lines = ["%-45s %10s %12s %12s %12s" % ("Timer", "Calls", "Total [s]", "Mean [ms]", "Max [ms]")]
+	for name, (calls, total, longest) in sorted(timers.items(), key=lambda item: -item[1][1]):
+		lines.append("%-45s %10d %12.4f %12.4f %12.4f" % (name, calls, total, 1e3*total/calls, 1e3*longest))
+
+	lines.append("")
+	lines.append("%-45s %10s" % ("Counter", "Value"))
+	for name, value in sorted(counters.items()):
+		lines.append("%-45s %10s" % (name, value))
+
+	return "\n".join(lines)
@@ -0,0 +1,82 @@
+import unittest
+
+from shapely.geometry import Point
+from shapely.geometry import Polygon
+
+from instrumentation import profiling
+from metrics.chi import ChiMetric
+
+
+# Test suite for timers and counters
+class profilingTest(unittest.TestCase):
+
+	def setUp(self):
+		profiling.reset()
+
+	def tearDown(self):
+		profiling.disable()
+		profiling.reset()
+
+	def test_disabledRecordsNothing(self):
+		profiling.count('counter')
+		with profiling.timer('timer'):
+			pass
+
+		self.assertFalse(profiling.is_enabled())
+		self.assertEqual(profiling.summary(), {'timers': {}, 'counters': {}})
+
+	def test_countersAndTimers(self):
+		profiling.enable()
+
+		profiling.count('counter')
+		profiling.count('counter', 4)
+		for i in range(3):
+			with profiling.timer('timer'):
+				pass
+
+		summary = profiling.summary()
+		self.assertEqual(summary['counters'], {'counter': 5})
+		self.assertEqual(summary['timers']['timer'][0], 3)
+		self.assertGreaterEqual(summary['timers']['timer'][1], summary['timers']['timer'][2])
+
+		report = profiling.report()
+		self.assertIn('counter', report)
+		self.assertIn('timer', report)
+
+		profiling.reset()
+		self.assertEqual(profiling.summary(), {'timers': {}, 'counters': {}})
+
+	def test_timedKeepsResultAndExceptions(self):
+		@profiling.timed('divide')
+		def divide(a, b):
+			return a/b
+
+		self.assertEqual(divide(4, 2), 2)
+
+		profiling.enable()
+		self.assertEqual(divide(4, 2), 2)
+		self.assertRaises(ZeroDivisionError, divide, 1, 0)
+		self.assertEqual(profiling.summary()['timers']['divide'][0], 2)
+
+	def test_metricHooks(self):
+		profiling.enable()
+
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0)
+		chi.compute(polygon=Polygon([(0,0),(1,0),(1,1),(0,1)]), initialPosition=Point((0,0)))
+
+		summary = profiling.summary()
+		self.assertEqual(summary['timers']['metric.compute'][0], 1)
+		self.assertEqual(summary['counters']['chi.buffer_iterations'], 5)
+
+
+def suite():
+	"""
+		Gather all the tests from this module in a test suite.
+	"""
+	test_suite = unittest.TestSuite()
+	test_suite.addTest(unittest.makeSuite(profilingTest))
+	return test_suite
+
+mySuit = suite()
+runner = unittest.TextTestRunner()
+runner.run(mySuit)
@@ -1,9 +1,23 @@
 import logging
 from math import sqrt
 
-from shapely.geometry import Polygon
 from shapely.geometry import MultiPolygon
 
+import numpy as np
+
+from instrumentation import profiling
+from geometry_arrays import polygon_areas
+from geometry_arrays import polygon_distances
+from geometry_arrays import polygon_perimeters
+from geometry_arrays import polygon_reflex_angles
+from geometry_arrays import ring_arrays
+from metric_cache import MetricCache
+from raster import count_contours
+from raster import rasterise
+
+
+# Relative shortfall of the erosion distance still accepted for a part of a level
+SLIVER_TOLERANCE = 0.01
 
 # Configure logging properties for this module
 logger = logging.getLogger("chi")
@@ -28,21 +42,241 @@ class BaseMetric:
 	Should not be used by itself.
 
 	Contains compute method which references _compute_metric method of child class.
+	compute_many() scores a batch of polygons at once through _compute_metric_many(),
+	which child classes can override with a vectorised implementation.
+
+	Caching is opt-in: after enable_cache(), compute() returns stored values for
+	geometries it has seen before. Child classes list the parameters their values depend
+	on in _cache_parameters().
+
+	compute_assignments() evaluates every polygon from every robot position. Child classes
+	whose metric has a part that does not depend on the position return it from
+	_shape_terms() and combine it with the rest in _assignment_cost(), so that part is
+	computed once per polygon.
 	"""
 
-	def compute(self, **kwargs):
-		return self._compute_metric(**kwargs)
+	cache = None
+
+	@profiling.timed('metric.compute')
+	def compute(self, polygon=[], initialPosition=[]):
+		return float(self.compute_many(polygons=[polygon], positions=[initialPosition])[0])
+
+	@profiling.timed('metric.compute_many')
+	def compute_many(self, polygons=[], positions=[]):
+		"""
+		Computes the cost of covering every polygon from the position at the same index.
+
+		Params:
+			polygons: A list of shapely polygons.
+			positions: A list of shapely points representing robot positions.
+		Returns:
+			A numpy array of costs.
+		"""
+
+		if len(polygons) != len(positions):
+			raise ValueError("Got %d polygons but %d positions." % (len(polygons), len(positions)))
+
+		costs = np.zeros(len(polygons))
+
+		keys = []
+		missing = range(len(polygons))
+		if self.cache is not None:
+			keys = [self.cache.key(self._cache_parameters(), polygon=polygon, initialPosition=position)
+					for polygon, position in zip(polygons, positions)]
+
+			missing = []
+			for idx, key in enumerate(keys):
+				value = self.cache.lookup(key)
+				if value is None:
+					missing.append(idx)
+				else:
+					costs[idx] = value
+
+		if missing:
+			costs[missing] = self._compute_metric_many([polygons[idx] for idx in missing],
+													   [positions[idx] for idx in missing])
+
+		for idx in missing if keys else []:
+			self.cache.put(keys[idx], float(costs[idx]))
+
+		return costs
+
+	@profiling.timed('metric.compute_assignments')
+	def compute_assignments(self, polygons=[], positions=[]):
+		"""
+		Computes the cost of covering every polygon from every position.
+
+		Params:
+			polygons: A list of shapely polygons.
+			positions: A list of shapely points representing robot positions.
+		Returns:
+			A list of rows, costs[i][j] is the cost of polygons[i] covered from positions[j].
+		"""
+
+		costs = []
+		for polygon in polygons:
+			# Shape terms are only computed if a cost is not in the cache
+			shapeTerms = []
+
+			def compute_cost(position, polygon=polygon, shapeTerms=shapeTerms):
+				if not shapeTerms:
+					shapeTerms.append(self._shape_terms(polygon))
+				return self._assignment_cost(polygon, position, shapeTerms[0])
+
+			row = []
+			for position in positions:
+				if self.cache is None:
+					row.append(compute_cost(position))
+				else:
+					key = self.cache.key(self._cache_parameters(), polygon=polygon, initialPosition=position)
+					row.append(self.cache.get(key, lambda: compute_cost(position)))
+			costs.append(row)
+
+		return costs
+
+	@profiling.timed('metric.compute_lower_bounds')
+	def compute_lower_bounds(self, polygons=[], positions=[]):
+		"""
+		Computes lower bounds on the cost of covering every polygon from every position.
+		They are much cheaper than the costs, so that candidates can be discarded without
+		computing their cost.
+
+		Params:
+			polygons: A list of shapely polygons.
+			positions: A list of shapely points representing robot positions.
+		Returns:
+			A numpy array, bounds[i, j] is at most the cost of polygons[i] covered from positions[j].
+		"""
+
+		return self._lower_bounds(polygons, positions)
+
+	@profiling.timed('metric.compute_measure_bounds')
+	def compute_measure_bounds(self, areas=[], perimeters=[], reflexAngles=[], numRings=[], boxes=[], positions=[]):
+		"""
+		Computes lower bounds on the cost of covering polygons that are only known by bounds
+		on their measures, e.g. the sides of a cut before they are built.
+
+		Params:
+			areas: Lower bounds on the areas of n polygons.
+			perimeters: Upper bounds on the total lengths of their rings.
+			reflexAngles: Upper bounds on the sum of (interior angle - pi) over their reflex vertices.
+			numRings: Lower bounds on their numbers of rings.
+			boxes: An (n, 4) array of (minX, minY, maxX, maxY) boxes containing the polygons.
+			positions: A list of shapely points representing robot positions.
+		Returns:
+			A numpy array, bounds[i, j] is at most the cost of polygon i covered from positions[j].
+		"""
+
+		return self._measure_bounds(np.asarray(areas, dtype=np.float64), np.asarray(perimeters, dtype=np.float64),
+									np.asarray(reflexAngles, dtype=np.float64), np.asarray(numRings, dtype=np.float64),
+									np.asarray(boxes, dtype=np.float64).reshape(-1, 4), positions)
+
+	def enable_cache(self, maxSize=10000, cache=None):
+		"""
+		Memoise compute() in a bounded LRU cache.
+
+		Params:
+			maxSize: Maximum number of stored values, None for unbounded.
+			cache: A MetricCache to use instead of a new one, e.g. to share it between metrics.
+		Returns:
+			The cache in use.
+		"""
+
+		if cache is None:
+			cache = MetricCache(maxSize=maxSize)
+
+		self.cache = cache
+		return cache
+
+	def disable_cache(self):
+		self.cache = None
+
+	def _cache_parameters(self):
+		return (self.__class__.__name__,)
+
+	def _compute_metric_many(self, polygons, positions):
+		return np.array([self._compute_metric(polygon=polygon, initialPosition=position)
+						 for polygon, position in zip(polygons, positions)], dtype=np.float64)
+
+	def _lower_bounds(self, polygons, positions):
+		return np.full((len(polygons), len(positions)), -np.inf)
+
+	def _measure_bounds(self, areas, perimeters, reflexAngles, numRings, boxes, positions):
+		return np.full((len(areas), len(positions)), -np.inf)
+
+	def _shape_terms(self, polygon):
+		return None
+
+	def _assignment_cost(self, polygon, initialPosition, shapeTerms):
+		return self._compute_metric(polygon=polygon, initialPosition=initialPosition)
 
 
 class ChiMetric(BaseMetric):
 	"""
 	Class for chi metric.
+
+	The number of contours is counted exactly by default. With contourLevelStep > 1 it is
+	approximated by only eroding the polygon at every contourLevelStep-th level, see
+	_compute_num_contours().
+
+	enable_terms_cache() memoises the terms that do not depend on the penalties, so they
+	can be shared between metrics that only differ in the penalties.
 	"""
 	
-	def __init__(self, radius, linearPenalty, angularPenalty):
+	termsCache = None
+
+	def __init__(self, radius, linearPenalty, angularPenalty, contourLevelStep=1):
 		self.radius = radius
 		self.linearPenalty = linearPenalty
 		self.angularPenalty = angularPenalty
+		self.contourLevelStep = contourLevelStep
+
+	def _cache_parameters(self):
+		return (self.__class__.__name__, self.radius, self.linearPenalty, self.angularPenalty, self.contourLevelStep)
+
+	def enable_terms_cache(self, maxSize=10000, cache=None):
+		"""
+		Memoise F2 and F3, which do not depend on the penalties, in a bounded LRU cache.
+
+		Metrics with the same radius that share the cache reuse each others terms, e.g. in
+		a sweep over the penalties. F1 is not cached, the distance is cheaper to compute
+		than the fingerprint of the polygon.
+
+		Params:
+			maxSize: Maximum number of stored terms, None for unbounded.
+			cache: A MetricCache to use instead of a new one.
+		Returns:
+			The cache in use.
+		"""
+
+		if cache is None:
+			cache = MetricCache(maxSize=maxSize)
+
+		self.termsCache = cache
+		return cache
+
+	def disable_terms_cache(self):
+		self.termsCache = None
+
+	def _terms_parameters(self):
+		return (self.__class__.__name__, self.radius, self.contourLevelStep)
+
+	def shape_cost(self, polygon):
+		"""
+		Part of chi that only depends on the polygon: linearPenalty*F2 + angularPenalty*F3.
+		"""
+
+		F2, F3 = self._shape_terms(polygon)
+
+		return self.linearPenalty*F2 + self.angularPenalty*F3
+
+	def position_cost(self, polygon, initialPosition):
+		"""
+		Part of chi that depends on the robot position: linearPenalty*F1.
+		Up to rounding, chi is shape_cost() + position_cost().
+		"""
+
+		return self.linearPenalty*self._position_term(polygon, initialPosition)
 
 	def _compute_metric(self, polygon, initialPosition):
 		"""
@@ -60,15 +294,165 @@ class ChiMetric(BaseMetric):
 			chi: Cost chi of coverage of the polygon
 		"""
 
+		return self._assignment_cost(polygon, initialPosition, self._shape_terms(polygon))
+
+	def _compute_metric_many(self, polygons, positions):
+		"""
+		Computes chi for a batch of polygons. Areas and distances are computed on arrays
+		of all vertices in the batch, the contours are counted per polygon.
+		"""
+
 		K1 = 2.0
+
+		rings = ring_arrays(polygons)
+
+		F1 = K1*polygon_distances(polygons, positions, rings)
+		F2, F3 = self._shape_terms_many(polygons, rings)
+
+		return self.linearPenalty*(F1 + F2) + self.angularPenalty*F3
+
+	def _shape_terms_many(self, polygons, rings):
+		"""
+		Returns arrays of F2 and F3 for a batch of polygons.
+		"""
+
+		if self.termsCache is None:
+			return self._compute_shape_terms_many(polygons, rings)
+
+		F2 = np.zeros(len(polygons))
+		F3 = np.zeros(len(polygons))
+
+		keys = [self.termsCache.key(self._terms_parameters(), polygon=polygon) for polygon in polygons]
+		missing = []
+		for idx, key in enumerate(keys):
+			shapeTerms = self.termsCache.lookup(key)
+			if shapeTerms is None:
+				missing.append(idx)
+			else:
+				F2[idx], F3[idx] = shapeTerms
+
+		if missing:
+			F2[missing], F3[missing] = self._compute_shape_terms_many([polygons[idx] for idx in missing], None)
+
+		for idx in missing:
+			self.termsCache.put(keys[idx], (float(F2[idx]), float(F3[idx])))
+
+		return F2, F3
+
+	def _compute_shape_terms_many(self, polygons, rings):
+		K2 = 1.0/self.radius
+		K3 = 360.0
+
+		F2 = K2*polygon_areas(polygons, rings)
+		F3 = K3*np.array([self._compute_num_contours(polygon=polygon, radius=self.radius) for polygon in polygons],
+						 dtype=np.float64)
+
+		return F2, F3
+
+	def _lower_bounds(self, polygons, positions):
+		"""
+		F1 and F2 are exact, F3 is bounded by the number of levels that can not be empty,
+		see _bounds_from_measures().
+		"""
+
+		rings = ring_arrays(polygons)
+		areas = polygon_areas(polygons, rings)
+		perimeters = polygon_perimeters(polygons, rings)
+		reflexAngles = polygon_reflex_angles(polygons, rings)
+		numRings = np.bincount(rings[2], minlength=len(polygons))
+
+		distances = [polygon_distances(polygons, [position]*len(polygons), rings) for position in positions]
+
+		return self._bounds_from_measures(areas, perimeters, reflexAngles, numRings, distances)
+
+	def _measure_bounds(self, areas, perimeters, reflexAngles, numRings, boxes, positions):
+		"""
+		As _lower_bounds(), with the distance to the box in place of the distance to the polygon.
+		"""
+
+		distances = []
+		for position in positions:
+			x, y = position.coords[0][:2]
+			dx = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0.0)
+			dy = np.maximum(np.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0.0)
+			distances.append(np.sqrt(dx*dx + dy*dy))
+
+		return self._bounds_from_measures(np.maximum(areas, 0.0), perimeters, reflexAngles, numRings, distances)
+
+	def _bounds_from_measures(self, areas, perimeters, reflexAngles, numRings, distances):
+		"""
+		Lower bounds on chi from a lower bound on the area, upper bounds on the perimeter and
+		reflex angles, a lower bound on the number of rings and lower bounds on the distance
+		from every position.
+
+		Points of a polygon closer than d to its boundary lie in rectangles of width d along
+		the edges or in sectors of radius d at reflex vertices. The polygon eroded by d
+		therefore keeps an area of at least A - P*d - S*d*d/2, with P the perimeter and S the
+		sum of (interior angle - pi) over reflex vertices. Level 0 has one contour per ring,
+		every other level that is not empty at least one. This also holds for the
+		approximate contour count.
+		"""
+
+		K1 = 2.0
+		K2 = 1.0/self.radius
+		K3 = 360.0
+
+		def eroded_area_bound(distances):
+			return areas - perimeters*distances - reflexAngles*distances*distances/2
+
+		# Largest distance for which the bound on the eroded area is positive
+		with np.errstate(divide='ignore', invalid='ignore'):
+			maxDistances = np.nan_to_num(2*areas/(perimeters + np.sqrt(perimeters*perimeters + 2*reflexAngles*areas)))
+
+		# Guard against rounding: only count levels whose bound is clearly positive
+		margin = 1e-9*areas
+		numLevels = np.floor(maxDistances/self.radius)
+		for _ in range(2):
+			numLevels = np.where(eroded_area_bound(numLevels*self.radius) > margin, numLevels, np.maximum(numLevels - 1, 0))
+		numLevels = np.where(eroded_area_bound(numLevels*self.radius) > margin, numLevels, 0)
+
+		F2 = K2*areas
+		F3 = K3*(numRings + numLevels)
+
+		bounds = np.empty((len(areas), len(distances)))
+		for col, positionDistances in enumerate(distances):
+			F1 = K1*positionDistances
+			bounds[:, col] = self.linearPenalty*(F1 + F2) + self.angularPenalty*F3
+
+		# Rounding must never lift a bound above the cost
+		return bounds - 1e-9*np.abs(bounds)
+
+	def _shape_terms(self, polygon):
+		"""
+		Returns (F2, F3), the expensive position independent terms of chi.
+		"""
+
+		if self.termsCache is None:
+			return self._compute_shape_terms(polygon)
+
+		key = self.termsCache.key(self._terms_parameters(), polygon=polygon)
+
+		return self.termsCache.get(key, lambda: self._compute_shape_terms(polygon))
+
+	def _compute_shape_terms(self, polygon):
 		K2 = 1.0/self.radius
 		K3 = 360.0
 
-		F1 = K1*polygon.distance(initialPosition)
 		F2 = K2*polygon.area
 		F3 = K3*self._compute_num_contours(polygon=polygon, radius=self.radius)
 
-		logger.debug("F1: %6.2f F2: %6.2f F3: %6.2f"%(F1, F2, F3))
+		return F2, F3
+
+	def _position_term(self, polygon, initialPosition):
+		K1 = 2.0
+
+		return K1*polygon.distance(initialPosition)
+
+	def _assignment_cost(self, polygon, initialPosition, shapeTerms):
+		F1 = self._position_term(polygon, initialPosition)
+		F2, F3 = shapeTerms
+
+		logger.debug("F1: %6.2f F2: %6.2f F3: %6.2f", F1, F2, F3)
 
 		return self.linearPenalty*(F1 + F2) + self.angularPenalty*F3
 
@@ -79,6 +463,19 @@ class ChiMetric(BaseMetric):
 		by turns? For now, count it. Potentially could
 		use the area as a check for inclusion.
 
+		Contour k is the boundary of P eroded by k*radius. Every level is eroded from the
+		closest level below it that was already computed, so each level lies inside the
+		levels below it. Eroding by several radii at once is not the same in GEOS, it can
+		leave slivers that repeated erosion removes. Parts of such levels that are closer
+		to the boundary of the lower level than the erosion distance are dropped.
+
+		With contourLevelStep > 1 only every contourLevelStep-th level is eroded. Where the
+		counts at the ends of such an interval differ, the interval is bisected until the
+		level of the change is found, otherwise the count is assumed constant. The result
+		is exact unless a component or hole appears and disappears again between two
+		sampled levels; each such miss is off by less than contourLevelStep contours.
+		With contourLevelStep = 1 every level is eroded from the previous one.
+
 		Params:
 			polygon: A shapely object representing the polygon
 			radius: Radius of the coverage implement.
@@ -86,28 +483,130 @@ class ChiMetric(BaseMetric):
 			Number of contours
 		"""
 
+		level2Region = {0: polygon}
+		level2Contours = {}
+
+		def contours_at(level):
+			if level not in level2Contours:
+				if level not in level2Region:
+					lowerLevel = max(computed for computed in level2Region if computed < level)
+					distance = (level - lowerLevel)*radius
+					# TODO: Analyze the effects of join_styles
+					region = level2Region[lowerLevel].buffer(-distance)
+					if level - lowerLevel > 1:
+						region = self._drop_slivers(region, level2Region[lowerLevel], distance)
+					level2Region[level] = region
+				level2Contours[level] = self._count_rings(level2Region[level])
+			return level2Contours[level]
+
+		def sum_levels(first, last):
+			# Sum of contours on levels first..last-1
+			if contours_at(first) == contours_at(last):
+				return contours_at(first)*(last - first)
+			if last - first == 1:
+				return contours_at(first)
+
+			middle = (first + last)//2
+			return sum_levels(first, middle) + sum_levels(middle, last)
+
 		numContours = 0
+		level = 0
+		while contours_at(level):
+			numContours += sum_levels(level, level + self.contourLevelStep)
+			level += self.contourLevelStep
 
-		# Create a deep copy since we don't want to modify original polygon
-		testPolygon = Polygon(polygon.exterior, polygon.interiors)
-		while not testPolygon.is_empty:
+		# Level 0 is the polygon itself
+		profiling.count('chi.buffer_iterations', len(level2Contours) - 1)
+		logger.debug("Number of contours: %d", numContours)
 
-			if isinstance(testPolygon, Polygon):
-				numHoles = len(testPolygon.interiors)
-				numContours += 1 + numHoles
+		return numContours
 
-			elif isinstance(testPolygon, MultiPolygon):
-				numContours += len(testPolygon)
+	def _drop_slivers(self, region, lowerRegion, distance):
+		"""
+		Removes the parts of region eroded from lowerRegion by distance that are not that
+		far from its boundary.
+		"""
 
-				for poly in testPolygon:
-					numContours += len(poly.interiors)
+		if region.is_empty:
+			return region
 
-			# TODO: Analyze the effects of join_styles
-			testPolygon = testPolygon.buffer(-radius)
-			
-		logger.debug("Number of contours: %d"%numContours)
+		parts = list(region.geoms) if isinstance(region, MultiPolygon) else [region]
+		boundary = lowerRegion.boundary
+		keptParts = [part for part in parts
+					 if boundary.distance(part.representative_point()) >= (1.0 - SLIVER_TOLERANCE)*distance]
 
-		return numContours
+		if len(keptParts) == len(parts):
+			return region
+
+		profiling.count('chi.slivers_dropped', len(parts) - len(keptParts))
+
+		return MultiPolygon(keptParts)
+
+	def _count_rings(self, polygon):
+		"""
+		Number of boundary rings of a polygon or multipolygon.
+		"""
+
+		if polygon.is_empty:
+			return 0
+
+		if isinstance(polygon, MultiPolygon):
+			parts = polygon.geoms
+		else:
+			parts = [polygon]
+
+		return sum(1 + len(part.interiors) for part in parts)
+
+
+class RasterChiMetric(ChiMetric):
+	"""
+	Approximation of the chi metric on a raster, for screening many candidates.
+
+	A polygon is sampled on square pixels with a side of radius/pixelsPerRadius. F2 is
+	computed from the number of pixels inside the polygon, F3 from the components and holes
+	of the pixels further than k*radius from the boundary, see metrics.raster. F1 is exact.
+
+	Features narrower than a pixel are lost or split, so costs may differ from ChiMetric
+	by a few contours. Rasterising is cheaper than buffering for polygons with many
+	vertices, for small simple polygons it is not.
+	"""
+
+	def __init__(self, radius, linearPenalty, angularPenalty, pixelsPerRadius=2):
+		ChiMetric.__init__(self, radius, linearPenalty, angularPenalty)
+		self.pixelsPerRadius = pixelsPerRadius
+
+	def _cache_parameters(self):
+		return ChiMetric._cache_parameters(self) + (self.pixelsPerRadius,)
+
+	def _terms_parameters(self):
+		return ChiMetric._terms_parameters(self) + (self.pixelsPerRadius,)
+
+	def _lower_bounds(self, polygons, positions):
+		# Pixel counts are not bounded by the exact terms
+		return BaseMetric._lower_bounds(self, polygons, positions)
+
+	def _measure_bounds(self, areas, perimeters, reflexAngles, numRings, boxes, positions):
+		return BaseMetric._measure_bounds(self, areas, perimeters, reflexAngles, numRings, boxes, positions)
+
+	def _compute_shape_terms(self, polygon):
+		K2 = 1.0/self.radius
+		K3 = 360.0
+
+		pixelSize = float(self.radius)/self.pixelsPerRadius
+		inside, distance = rasterise(polygon, pixelSize)
+
+		F2 = K2*inside.sum()*pixelSize*pixelSize
+		F3 = K3*count_contours(inside, distance, self.radius)
+
+		return F2, F3
+
+	def _shape_terms_many(self, polygons, rings):
+		shapeTerms = [self._shape_terms(polygon) for polygon in polygons]
+
+		F2 = np.array([terms[0] for terms in shapeTerms], dtype=np.float64)
+		F3 = np.array([terms[1] for terms in shapeTerms], dtype=np.float64)
+
+		return F2, F3
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+import hashlib
+import inspect
+import pickle
+import sqlite3
+
+from instrumentation import profiling
+from metric_cache import MetricCache
+from metric_cache import QUANTUM
+from metric_cache import fingerprint
+
+
+def source_version(modules=[]):
+	"""
+	Computes a version stamp from the source code of the given modules, so that a cache
+	is emptied whenever the code computing its values changes.
+
+	Params:
+		modules: A list of modules.
+	Returns:
+		A hex digest.
+	"""
+
+	digest = hashlib.sha1()
+	for module in modules:
+		digest.update(inspect.getsource(module).encode('utf-8'))
+
+	return digest.hexdigest()
+
+
+def metric_version():
+	"""
+	Version stamp of the metric code, the default version of a DiskCache.
+	"""
+
+	import chi
+	import geometry_arrays
+	import metric_cache
+	import raster
+
+	return source_version([chi, geometry_arrays, metric_cache, raster])
+
+
+class DiskCache(MetricCache):
+	"""
+	Bounded LRU cache of metric values in an SQLite file, persistent across runs.
+
+	It can be used wherever a MetricCache is accepted, e.g. metric.enable_cache(cache=...)
+	or as the candidateCache of global_optimize(). Keys are built by MetricCache.key() from
+	the metric parameters and geometry fingerprints, values are pickled.
+
+	The file stores the version it was written with. Opening it with a different version
+	drops all entries. The default version is computed from the source of the metric
+	modules. Caches of values computed by other code, e.g. cut candidates, should pass
+	source_version() of that code instead.
+
+	Writes are committed every commitInterval puts and by flush() and close(). Entries
+	are stamped when they are read or written, flush() evicts the least recently used
+	entries beyond maxSize.
+	"""
+
+	def __init__(self, path, maxSize=100000, version=None, quantum=QUANTUM, commitInterval=1000):
+		MetricCache.__init__(self, maxSize=maxSize, quantum=quantum)
+
+		if version is None:
+			version = metric_version()
+
+		self.path = path
+		self.version = version
+		self.commitInterval = commitInterval
+		self.numPending = 0
+		self.key2Stamp = {}
+
+		self.connection = sqlite3.connect(path)
+		self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+		self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, stamp INTEGER)")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS entries_stamp ON entries (stamp)")
+
+		storedVersion = self._meta('version')
+		if storedVersion != version:
+			self.connection.execute("DELETE FROM entries")
+			self._set_meta('version', version)
+			self._set_meta('clock', '0')
+		self.connection.commit()
+
+		self.clock = int(self._meta('clock') or 0)
+
+	def __len__(self):
+		return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	def lookup(self, key):
+		"""
+		Returns the value stored for key or None, counting a hit or a miss.
+		"""
+
+		textKey = repr(key)
+		row = self.connection.execute("SELECT value FROM entries WHERE key = ?", (textKey,)).fetchone()
+
+		if row is None:
+			self.misses += 1
+			profiling.count('metric.cache_misses')
+			return None
+
+		self.hits += 1
+		profiling.count('metric.cache_hits')
+		self.key2Stamp[textKey] = self._tick()
+
+		return pickle.loads(bytes(row[0]))
+
+	def put(self, key, value):
+		"""
+		Store a value. It is written to the file with the next commit.
+		"""
+
+		textKey = repr(key)
+		self.key2Stamp.pop(textKey, None)
+		self.connection.execute("INSERT OR REPLACE INTO entries (key, value, stamp) VALUES (?, ?, ?)",
+								(textKey, sqlite3.Binary(pickle.dumps(value, 2)), self._tick()))
+
+		self.numPending += 1
+		if self.numPending >= self.commitInterval:
+			self.flush()
+
+	def invalidate(self, geometry):
+		"""
+		Drop all entries computed for a geometry. Returns the number of dropped entries.
+		"""
+
+		geometryKey = repr(fingerprint(geometry, self.quantum))
+		staleKeys = [(textKey,) for textKey, in self.connection.execute("SELECT key FROM entries")
+					 if geometryKey in textKey]
+
+		self.connection.executemany("DELETE FROM entries WHERE key = ?", staleKeys)
+		self.connection.commit()
+
+		return len(staleKeys)
+
+	def clear(self):
+		self.connection.execute("DELETE FROM entries")
+		self.connection.commit()
+		self.key2Stamp.clear()
+
+	def flush(self):
+		"""
+		Record the read stamps, evict entries beyond maxSize and commit.
+		"""
+
+		self.connection.executemany("UPDATE entries SET stamp = ? WHERE key = ?",
+									[(stamp, textKey) for textKey, stamp in self.key2Stamp.items()])
+		self.key2Stamp.clear()
+
+		if self.maxSize is not None:
+			numEvicted = len(self) - self.maxSize
+			if numEvicted > 0:
+				self.connection.execute("DELETE FROM entries WHERE key IN "
+										"(SELECT key FROM entries ORDER BY stamp LIMIT ?)", (numEvicted,))
+
+		self._set_meta('clock', str(self.clock))
+		self.connection.commit()
+		self.numPending = 0
+
+	def close(self):
+		self.flush()
+		self.connection.close()
+
+	def stats(self):
+		"""
+		Returns a dictionary with the size of the cache and the number of hits and misses.
+		"""
+
+		stats = MetricCache.stats(self)
+		stats['size'] = len(self)
+
+		return stats
+
+	def _tick(self):
+		self.clock += 1
+		return self.clock
+
+	def _meta(self, name):
+		row = self.connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+		return row[0] if row else None
+
+	def _set_meta(self, name, value):
+		self.connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
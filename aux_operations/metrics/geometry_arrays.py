@@ -0,0 +1,263 @@
+import struct
+
+import numpy as np
+
+
+def ring_arrays(polygons=[]):
+	"""
+	Flattens the rings of a list of polygons into arrays.
+
+	Params:
+		polygons: A list of shapely polygons.
+	Returns:
+		(coords, ringOffsets, ringOwners, ringIsHole): coords is an (n, 2) array of all ring
+		vertices, the vertices of ring i are coords[ringOffsets[i]:ringOffsets[i+1]]. Ring i
+		belongs to polygons[ringOwners[i]] and is an interior if ringIsHole[i]. Exteriors
+		come before the interiors of the same polygon.
+	"""
+
+	rings = []
+	ringOwners = []
+	ringIsHole = []
+	for polyIdx, polygon in enumerate(polygons):
+		if polygon.is_empty:
+			continue
+
+		# Reading the WKB is much faster than going through polygon.exterior.coords
+		data = polygon.wkb
+		byteOrder = '<' if data[0:1] == b'\x01' else '>'
+		geometryType, numRings = struct.unpack_from(byteOrder + 'II', data, 1)
+		numDims = 3 if geometryType & 0x80000000 else 2
+
+		offset = 9
+		for ringIdx in range(numRings):
+			numPoints, = struct.unpack_from(byteOrder + 'I', data, offset)
+			ring = np.frombuffer(data, byteOrder + 'f8', numDims*numPoints, offset + 4).reshape(numPoints, numDims)
+			offset += 4 + 8*numDims*numPoints
+
+			rings.append(ring[:, :2])
+			ringOwners.append(polyIdx)
+			ringIsHole.append(ringIdx > 0)
+
+	ringOffsets = np.zeros(len(rings) + 1, dtype=np.int64)
+	ringOffsets[1:] = np.cumsum([len(ring) for ring in rings])
+
+	if rings:
+		coords = np.concatenate(rings)
+	else:
+		coords = np.zeros((0, 2))
+
+	return coords, ringOffsets, np.array(ringOwners, dtype=np.int64), np.array(ringIsHole, dtype=bool)
+
+
+def polygon_areas(polygons=[], rings=None):
+	"""
+	Computes the areas of a list of polygons.
+
+	The arithmetic follows GEOS (shoelace relative to the first vertex of a ring, summed in
+	vertex order, holes subtracted one after the other), so the results are identical to
+	polygon.area.
+
+	Params:
+		polygons: A list of shapely polygons.
+		rings: Result of ring_arrays(polygons), if already computed.
+	Returns:
+		A numpy array of areas.
+	"""
+
+	if rings is None:
+		rings = ring_arrays(polygons)
+	coords, ringOffsets, ringOwners, ringIsHole = rings
+
+	areas = np.zeros(len(polygons))
+	if not len(ringOwners):
+		return areas
+
+	# Term of vertex i of a ring is (x[i] - x[0])*(y[i-1] - y[i+1]) for 0 < i < n-1.
+	# Terms are laid out in zero padded matrices, cumsum adds them up in order. Padding
+	# at most doubles the memory: rings of similar lengths share one matrix, otherwise
+	# they are grouped by the power of two their number of terms rounds up to, so a long
+	# ring does not inflate the whole batch.
+	numTerms = np.maximum(np.diff(ringOffsets) - 2, 0)
+	maxTerms = max(numTerms.max(), 1)
+	if len(numTerms)*maxTerms <= 2*numTerms.sum():
+		ringWidths = np.full(len(numTerms), maxTerms, dtype=np.int64)
+	else:
+		ringWidths = np.left_shift(1, np.ceil(np.log2(np.maximum(numTerms, 1))).astype(np.int64))
+	ringAreas = np.zeros(len(numTerms))
+
+	for width in np.unique(ringWidths):
+		groupRings = np.flatnonzero(ringWidths == width)
+		groupTerms = numTerms[groupRings]
+
+		rowIdx = np.repeat(np.arange(len(groupRings)), groupTerms)
+		colIdx = np.arange(rowIdx.size) - np.repeat(np.cumsum(groupTerms) - groupTerms, groupTerms)
+		vertexIdx = np.repeat(ringOffsets[groupRings], groupTerms) + colIdx + 1
+
+		terms = np.zeros((len(groupRings), width))
+		terms[rowIdx, colIdx] = ((coords[vertexIdx, 0] - coords[vertexIdx - colIdx - 1, 0])*
+								 (coords[vertexIdx - 1, 1] - coords[vertexIdx + 1, 1]))
+
+		ringAreas[groupRings] = np.abs(np.cumsum(terms, axis=1)[:, -1]/2.0)
+
+	shells = ~ringIsHole
+	areas[ringOwners[shells]] = ringAreas[shells]
+
+	# Subtract the first hole of every polygon, then the second and so on
+	firstRings = np.flatnonzero(np.r_[True, ringOwners[1:] != ringOwners[:-1]])
+	ringRanks = np.arange(len(ringOwners)) - np.repeat(firstRings, np.diff(np.r_[firstRings, len(ringOwners)]))
+	for rank in range(1, ringRanks.max() + 1):
+		holes = ringRanks == rank
+		areas[ringOwners[holes]] -= ringAreas[holes]
+
+	return areas
+
+
+def polygon_distances(polygons=[], points=[], rings=None):
+	"""
+	Computes the distance between every polygon and the point at the same index.
+
+	Points inside a polygon have distance 0, otherwise the distance is the minimum distance
+	to a segment of the boundary. Point to segment distances follow GEOS, so the results
+	are identical to polygon.distance(point).
+
+	Params:
+		polygons: A list of shapely polygons.
+		points: A list of shapely points of the same length.
+		rings: Result of ring_arrays(polygons), if already computed.
+	Returns:
+		A numpy array of distances.
+	"""
+
+	if rings is None:
+		rings = ring_arrays(polygons)
+	coords, ringOffsets, ringOwners, ringIsHole = rings
+
+	distances = np.zeros(len(polygons))
+	if not len(ringOwners):
+		return distances
+
+	# Every segment of every ring, with the point it is measured against
+	ringLengths = np.diff(ringOffsets)
+	segmentRings = np.repeat(np.arange(len(ringLengths)), ringLengths - 1)
+	startIdx = np.delete(np.arange(len(coords)), ringOffsets[1:] - 1)
+	segmentOwners = ringOwners[segmentRings]
+
+	# Batches usually share a few robot positions, read each of them once
+	id2Coords = {}
+	for point in points:
+		if id(point) not in id2Coords:
+			id2Coords[id(point)] = point.coords[0][:2]
+	pointCoords = np.array([id2Coords[id(point)] for point in points], dtype=np.float64)
+	px = pointCoords[segmentOwners, 0]
+	py = pointCoords[segmentOwners, 1]
+	ax = coords[startIdx, 0]
+	ay = coords[startIdx, 1]
+	bx = coords[startIdx + 1, 0]
+	by = coords[startIdx + 1, 1]
+
+	dxA = px - ax
+	dyA = py - ay
+	dxB = px - bx
+	dyB = py - by
+	distA = np.sqrt(dxA*dxA + dyA*dyA)
+	distB = np.sqrt(dxB*dxB + dyB*dyB)
+
+	ex = bx - ax
+	ey = by - ay
+	len2 = ex*ex + ey*ey
+	with np.errstate(divide='ignore', invalid='ignore'):
+		r = ((px - ax)*ex + (py - ay)*ey)/len2
+		s = ((ay - py)*ex - (ax - px)*ey)/len2
+		segmentDistances = np.where(r <= 0.0, distA, np.where(r >= 1.0, distB, np.abs(s)*np.sqrt(len2)))
+	segmentDistances = np.where(len2 == 0.0, distA, segmentDistances)
+
+	# Segments of a polygon are contiguous
+	segmentStarts = np.flatnonzero(np.r_[True, segmentOwners[1:] != segmentOwners[:-1]])
+	minDistances = np.full(len(polygons), np.inf)
+	minDistances[segmentOwners[segmentStarts]] = np.minimum.reduceat(segmentDistances, segmentStarts)
+
+	# Crossing number of a ray from the point towards +x decides containment
+	with np.errstate(divide='ignore', invalid='ignore'):
+		crossX = ax + (py - ay)*ex/ey
+		crosses = ((ay > py) != (by > py)) & (px < crossX)
+	numCrossings = np.bincount(segmentOwners, weights=crosses, minlength=len(polygons))
+	inside = numCrossings % 2 == 1
+
+	hasRings = np.isfinite(minDistances)
+	distances[hasRings] = np.where(inside[hasRings], 0.0, minDistances[hasRings])
+
+	return distances
+
+
+def polygon_perimeters(polygons=[], rings=None):
+	"""
+	Computes the total length of all rings of every polygon.
+
+	Params:
+		polygons: A list of shapely polygons.
+		rings: Result of ring_arrays(polygons), if already computed.
+	Returns:
+		A numpy array of perimeters.
+	"""
+
+	if rings is None:
+		rings = ring_arrays(polygons)
+	coords, ringOffsets, ringOwners, ringIsHole = rings
+
+	if not len(ringOwners):
+		return np.zeros(len(polygons))
+
+	ringLengths = np.diff(ringOffsets)
+	segmentOwners = ringOwners[np.repeat(np.arange(len(ringLengths)), ringLengths - 1)]
+	startIdx = np.delete(np.arange(len(coords)), ringOffsets[1:] - 1)
+
+	segments = coords[startIdx + 1] - coords[startIdx]
+	segmentLengths = np.sqrt((segments*segments).sum(axis=1))
+
+	return np.bincount(segmentOwners, weights=segmentLengths, minlength=len(polygons))
+
+
+def polygon_reflex_angles(polygons=[], rings=None):
+	"""
+	Computes the sum of (interior angle - pi) over the reflex vertices of every polygon,
+	with vertices of interiors measured from the side of the polygon.
+
+	Params:
+		polygons: A list of shapely polygons.
+		rings: Result of ring_arrays(polygons), if already computed.
+	Returns:
+		A numpy array of angle sums in radians.
+	"""
+
+	if rings is None:
+		rings = ring_arrays(polygons)
+	coords, ringOffsets, ringOwners, ringIsHole = rings
+
+	if not len(ringOwners):
+		return np.zeros(len(polygons))
+
+	# Rings are closed, the last vertex repeats the first one
+	numVertices = np.diff(ringOffsets) - 1
+	vertexRings = np.repeat(np.arange(len(numVertices)), numVertices)
+	local = np.arange(vertexRings.size) - np.repeat(np.cumsum(numVertices) - numVertices, numVertices)
+	ringStarts = ringOffsets[:-1][vertexRings]
+	ringSizes = numVertices[vertexRings]
+
+	current = coords[ringStarts + local]
+	previous = coords[ringStarts + (local - 1) % ringSizes]
+	following = coords[ringStarts + (local + 1) % ringSizes]
+
+	incoming = current - previous
+	outgoing = following - current
+	cross = incoming[:, 0]*outgoing[:, 1] - incoming[:, 1]*outgoing[:, 0]
+	dot = (incoming*outgoing).sum(axis=1)
+	turns = np.arctan2(cross, dot)
+
+	# Orient turns so that the polygon lies to the left of every ring
+	twiceSignedAreas = np.bincount(vertexRings, weights=current[:, 0]*following[:, 1] - following[:, 0]*current[:, 1],
+								   minlength=len(numVertices))
+	ringSigns = np.where(twiceSignedAreas >= 0, 1.0, -1.0)*np.where(ringIsHole, -1.0, 1.0)
+	turns = turns*ringSigns[vertexRings]
+
+	return np.bincount(ringOwners[vertexRings], weights=np.maximum(-turns, 0.0), minlength=len(polygons))
@@ -0,0 +1,186 @@
+import hashlib
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+from shapely.geometry import Polygon
+
+from instrumentation import profiling
+
+
+# Coordinates closer than QUANTUM are considered equal when fingerprinting geometries.
+QUANTUM = 1e-9
+
+
+def fingerprint(geometry, quantum=QUANTUM):
+	"""
+	Computes a hashable fingerprint of a shapely geometry.
+
+	Coordinates are quantised to multiples of quantum, so geometries whose vertices differ
+	by less than quantum share a fingerprint. The order of vertices and rings matters, the
+	same polygon starting at a different vertex gets a different fingerprint.
+
+	Params:
+		geometry: A shapely geometry.
+		quantum: Quantisation step for coordinates.
+	Returns:
+		A string digest.
+	"""
+
+	# Polygons are by far the most common, avoid asking GEOS for their type. Empty
+	# polygons report a different type.
+	if isinstance(geometry, Polygon) and not geometry.is_empty:
+		return _polygon_fingerprint(geometry, quantum)
+
+	digest = hashlib.sha1(geometry.geom_type.encode('ascii'))
+
+	if geometry.is_empty:
+		parts = []
+	elif hasattr(geometry, 'geoms'):
+		parts = []
+		for part in geometry.geoms:
+			digest.update(fingerprint(part, quantum))
+	else:
+		parts = [geometry]
+
+	for part in parts:
+		coords = np.rint(np.asarray(part.coords, dtype=np.float64)/quantum).astype(np.int64)
+		digest.update(struct.pack('<q', len(coords)))
+		digest.update(coords.tobytes())
+
+	return digest.digest()
+
+
+def _polygon_fingerprint(polygon, quantum):
+	"""
+	fingerprint() of a polygon, with the rings read from its WKB. This is much faster than
+	going through polygon.exterior and polygon.interiors and gives the same digest.
+	"""
+
+	digest = hashlib.sha1(b'Polygon')
+
+	data = polygon.wkb
+	byteOrder = '<' if data[0:1] == b'\x01' else '>'
+	geometryType, numRings = struct.unpack_from(byteOrder + 'II', data, 1)
+	numDims = 3 if geometryType & 0x80000000 else 2
+
+	offset = 9
+	for _ in range(numRings):
+		numPoints, = struct.unpack_from(byteOrder + 'I', data, offset)
+		ring = np.frombuffer(data, byteOrder + 'f8', numDims*numPoints, offset + 4).reshape(numPoints, numDims)
+		offset += 4 + 8*numDims*numPoints
+
+		digest.update(struct.pack('<q', numPoints))
+		digest.update(np.rint(ring/quantum).astype(np.int64).tobytes())
+
+	return digest.digest()
+
+
+class MetricCache:
+	"""
+	Bounded LRU cache of metric values.
+
+	Entries are keyed on the metric parameters and the fingerprints of the geometries
+	passed to compute(), so changing a parameter of the metric never returns stale values.
+	Values computed for a geometry are never updated, entries for a geometry have to be
+	dropped with invalidate() if the metric depends on anything outside of its arguments.
+
+	Hits and misses are counted on the cache and reported through instrumentation as
+	metric.cache_hits and metric.cache_misses.
+	"""
+
+	def __init__(self, maxSize=10000, quantum=QUANTUM):
+		self.maxSize = maxSize
+		self.quantum = quantum
+		self.key2Value = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self.key2Value)
+
+	def key(self, parameters=(), **kwargs):
+		"""
+		Builds the cache key for a call to compute() with the given keyword arguments.
+		Geometries are fingerprinted, other arguments are used as they are.
+		"""
+
+		arguments = []
+		for name in sorted(kwargs):
+			value = kwargs[name]
+			if hasattr(value, 'geom_type'):
+				value = fingerprint(value, self.quantum)
+			arguments.append((name, value))
+
+		return (tuple(parameters), tuple(arguments))
+
+	def get(self, key, compute):
+		"""
+		Returns the value stored for key, calling compute() to obtain it on a miss.
+		"""
+
+		value = self.lookup(key)
+		if value is None:
+			value = compute()
+			self.put(key, value)
+
+		return value
+
+	def lookup(self, key):
+		"""
+		Returns the value stored for key or None, counting a hit or a miss.
+		"""
+
+		value = self.key2Value.pop(key, None)
+
+		if value is None:
+			self.misses += 1
+			profiling.count('metric.cache_misses')
+		else:
+			self.hits += 1
+			profiling.count('metric.cache_hits')
+			self.key2Value[key] = value
+
+		return value
+
+	def put(self, key, value):
+		"""
+		Store a value, evicting the least recently used entry if the cache is full.
+		"""
+
+		self.key2Value.pop(key, None)
+		if self.maxSize is not None and len(self.key2Value) >= self.maxSize:
+			self.key2Value.popitem(last=False)
+
+		self.key2Value[key] = value
+
+	def invalidate(self, geometry):
+		"""
+		Drop all entries computed for a geometry. Returns the number of dropped entries.
+		"""
+
+		geometryKey = fingerprint(geometry, self.quantum)
+		staleKeys = [key for key in self.key2Value
+					 if any(value == geometryKey for _, value in key[1])]
+
+		for key in staleKeys:
+			del self.key2Value[key]
+
+		return len(staleKeys)
+
+	def clear(self):
+		self.key2Value.clear()
+
+	def stats(self):
+		"""
+		Returns a dictionary with the size of the cache and the number of hits and misses.
+		"""
+
+		lookups = self.hits + self.misses
+
+		return {'size': len(self.key2Value),
+				'maxSize': self.maxSize,
+				'hits': self.hits,
+				'misses': self.misses,
+				'hitRate': float(self.hits)/lookups if lookups else 0.0}
@@ -0,0 +1,154 @@
+from math import ceil
+
+import numpy as np
+
+
+def rasterise(polygon, pixelSize=0.1):
+	"""
+	Samples a polygon on a grid of square pixels covering its bounding box.
+
+	Params:
+		polygon: A shapely polygon.
+		pixelSize: Side of a pixel.
+	Returns:
+		(inside, distance): boolean mask of the pixels whose centres lie in the polygon and
+		the distance of every pixel centre to the boundary of the polygon.
+	"""
+
+	if polygon.is_empty:
+		return np.zeros((0, 0), dtype=bool), np.zeros((0, 0))
+
+	minX, minY, maxX, maxY = polygon.bounds
+	numCols = max(int(ceil((maxX - minX)/pixelSize)), 1)
+	numRows = max(int(ceil((maxY - minY)/pixelSize)), 1)
+
+	xs = minX + (np.arange(numCols) + 0.5)*pixelSize
+	ys = minY + (np.arange(numRows) + 0.5)*pixelSize
+	px, py = np.meshgrid(xs, ys)
+
+	inside = np.zeros(px.shape, dtype=bool)
+	distanceSq = np.full(px.shape, np.inf)
+
+	for ring in [polygon.exterior] + list(polygon.interiors):
+		coords = np.asarray(ring.coords, dtype=np.float64)
+
+		for (ax, ay), (bx, by) in zip(coords[:-1], coords[1:]):
+			ex = bx - ax
+			ey = by - ay
+			len2 = ex*ex + ey*ey
+
+			# Closest point of the segment to every pixel centre
+			if len2 > 0.0:
+				t = np.clip(((px - ax)*ex + (py - ay)*ey)/len2, 0.0, 1.0)
+			else:
+				t = 0.0
+			dx = px - (ax + t*ex)
+			dy = py - (ay + t*ey)
+			np.minimum(distanceSq, dx*dx + dy*dy, out=distanceSq)
+
+			# Crossing number of a ray towards +x
+			if ay != by:
+				spans = (ay > py) != (by > py)
+				crossX = ax + (py - ay)*ex/ey
+				inside ^= spans & (px < crossX)
+
+	return inside, np.sqrt(distanceSq)
+
+
+def count_components(mask):
+	"""
+	Number of 8-connected components of a boolean image.
+
+	Components are found with a vectorised union-find: every round hooks the root of the
+	larger label onto the smaller one across every edge, then compresses paths.
+	"""
+
+	numRows, numCols = mask.shape
+	flatMask = mask.ravel()
+	pixels = np.flatnonzero(flatMask)
+	if not len(pixels):
+		return 0
+
+	index = np.arange(mask.size).reshape(mask.shape)
+	horizontal = mask[:, :-1] & mask[:, 1:]
+	vertical = mask[:-1, :] & mask[1:, :]
+	diagonal = mask[:-1, :-1] & mask[1:, 1:]
+	antiDiagonal = mask[:-1, 1:] & mask[1:, :-1]
+	edgeStarts = np.concatenate([index[:, :-1][horizontal], index[:-1, :][vertical],
+								 index[:-1, :-1][diagonal], index[:-1, 1:][antiDiagonal]])
+	edgeEnds = np.concatenate([index[:, 1:][horizontal], index[1:, :][vertical],
+							   index[1:, 1:][diagonal], index[1:, :-1][antiDiagonal]])
+
+	parent = np.arange(mask.size)
+	while True:
+		rootStarts = parent[edgeStarts]
+		rootEnds = parent[edgeEnds]
+		apart = rootStarts != rootEnds
+		if not apart.any():
+			break
+
+		low = np.minimum(rootStarts, rootEnds)[apart]
+		high = np.maximum(rootStarts, rootEnds)[apart]
+
+		# Hook every root onto the smallest root it shares an edge with
+		order = np.lexsort((low, high))
+		low = low[order]
+		high = high[order]
+		first = np.r_[True, high[1:] != high[:-1]]
+		parent[high[first]] = low[first]
+
+		while True:
+			grandParent = parent[parent]
+			if (grandParent == parent).all():
+				break
+			parent = grandParent
+
+	return int((parent[pixels] == pixels).sum())
+
+
+def euler_number(mask):
+	"""
+	Euler number (components minus holes) of a boolean image with 8-connected foreground,
+	from counts of 2x2 pixel patterns.
+	"""
+
+	padded = np.zeros((mask.shape[0] + 2, mask.shape[1] + 2), dtype=np.int8)
+	padded[1:-1, 1:-1] = mask
+
+	topLeft = padded[:-1, :-1]
+	topRight = padded[:-1, 1:]
+	bottomLeft = padded[1:, :-1]
+	bottomRight = padded[1:, 1:]
+
+	numSet = topLeft + topRight + bottomLeft + bottomRight
+	numDiagonal = ((numSet == 2) & (topLeft == bottomRight)).sum()
+
+	return ((numSet == 1).sum() - (numSet == 3).sum() - 2*numDiagonal)//4
+
+
+def count_contours(inside, distance, radius=1):
+	"""
+	Number of contours of a rasterised polygon: the sum over levels k of the number of
+	components and holes of the pixels further than k*radius from the boundary.
+
+	Params:
+		inside: Mask of pixels in the polygon, as returned by rasterise().
+		distance: Distance of pixels to the boundary, as returned by rasterise().
+		radius: Radius of the coverage implement.
+	Returns:
+		Number of contours
+	"""
+
+	numContours = 0
+	level = 0
+	mask = inside
+	while mask.any():
+		numComponents = count_components(mask)
+
+		# Holes are the components that the Euler number is missing
+		numContours += 2*numComponents - euler_number(mask)
+
+		level += 1
+		mask = inside & (distance > level*radius)
+
+	return numContours
@@ -1,10 +1,29 @@
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy
+
 from shapely.geometry import Point
 from shapely.geometry import Polygon
 from shapely.geometry import LineString
 
+import chi
+import raster
 from chi import ChiMetric
+from chi import RasterChiMetric
+from disk_cache import DiskCache
+from disk_cache import source_version
+from metric_cache import MetricCache
+from metric_cache import fingerprint
+from geometry_arrays import polygon_areas
+from geometry_arrays import polygon_distances
+from geometry_arrays import polygon_perimeters
+from geometry_arrays import polygon_reflex_angles
+from raster import count_components
+from raster import euler_number
+from raster import rasterise
 
 # Test suite for chi metric function
 class computeNumContoursTest(unittest.TestCase):
@@ -45,6 +64,52 @@ class computeNumContoursTest(unittest.TestCase):
 		r = 0.1
 		self.assertEqual(chi._compute_num_contours(P, r), 11)
 
+	def test_computeContoursSliver(self):
+		# Eroding this polygon by 0.6 at once leaves a sliver, eroding it by 0.1 six times
+		# leaves nothing
+		P = Polygon([(0.75, 0.66), (0.09, 0.63), (-0.11, 0.52), (-0.51, -0.23), (0.93, -0.83)])
+		r = 0.1
+
+		numContours = 0
+		region = P
+		while not region.is_empty:
+			numContours += 1
+			region = region.buffer(-r)
+
+		for contourLevelStep in [1, 4]:
+			chi = ChiMetric(radius=r, linearPenalty=1.0, angularPenalty=1.0, contourLevelStep=contourLevelStep)
+			self.assertEqual(chi._compute_num_contours(P, r), numContours)
+
+	def test_approximateContours(self):
+		exact = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0)
+		approximate = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0, contourLevelStep=4)
+		r = 0.1
+
+		shapes = [Polygon([(0,0),(1,0),(1,1),(0,1)]),
+				  Polygon([(0, 0), (1, 0), (1, 0.95), (0, 0.95)]),
+				  Polygon([(0, 0), (1, 0), (1, 1), (2, 1), (2, 0), (3, 0), (3, 3), (2, 3), (2, 2), (1, 2), (1, 3), (0, 3)]),
+				  Polygon([(0, 0), (1, 0), (1, 1), (0, 1)], [[(0.2, 0.2), (0.8, 0.2), (0.8, 0.8), (0.2, 0.8)]]),
+				  Polygon([(0, 0), (1, 0), (1, 1.4), (2, 1.4), (2, 0), (3, 0), (3, 3), (2, 3), (2, 1.6), (1, 1.6), (1, 3), (0, 3)]),
+				  Polygon([(0, 0), (1, 0), (1, 1.45), (2, 1.45), (2, 0), (3, 0), (3, 3), (2, 3), (2, 1.55), (1, 1.55), (1, 3), (0, 3)])]
+
+		for P, numContours in zip(shapes, [5, 5, 9, 6, 11, 11]):
+			self.assertEqual(exact._compute_num_contours(P, r), numContours)
+			self.assertEqual(approximate._compute_num_contours(P, r), numContours)
+
+	def test_approximateContoursLevels(self):
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0, contourLevelStep=8)
+		P = Polygon([(0,0),(10,0),(10,10),(0,10)])
+
+		levels = []
+		countRings = chi._count_rings
+		def count_level(polygon):
+			levels.append(polygon)
+			return countRings(polygon)
+		chi._count_rings = count_level
+
+		self.assertEqual(chi._compute_num_contours(P, 0.1), 50)
+		self.assertLess(len(levels), 15)
+
 
 # Test suite for chi metric function
 class chiTest(unittest.TestCase):
@@ -55,6 +120,267 @@ class chiTest(unittest.TestCase):
 		c = Point((-1, 0))
 		self.assertEqual(chi.compute(polygon=P, initialPosition=c), 1812.0)
 
+	def test_computeAssignments(self):
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+		polygons = [Polygon([(0,0),(1,0),(1,1),(0,1)]), Polygon([(1,0),(3,0),(3,0.5),(1,1)])]
+		positions = [Point((-1, 0)), Point((5, 5)), Point((2, 0.2))]
+
+		numContourCalls = []
+		computeNumContours = chi._compute_num_contours
+		def count_contours(**kwargs):
+			numContourCalls.append(1)
+			return computeNumContours(**kwargs)
+		chi._compute_num_contours = count_contours
+
+		costs = chi.compute_assignments(polygons=polygons, positions=positions)
+		self.assertEqual(len(numContourCalls), 2)
+
+		for i, polygon in enumerate(polygons):
+			for j, position in enumerate(positions):
+				self.assertEqual(costs[i][j], chi.compute(polygon=polygon, initialPosition=position))
+				self.assertAlmostEqual(costs[i][j], chi.shape_cost(polygon) + chi.position_cost(polygon, position))
+
+	def test_computeMany(self):
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+		polygons = [Polygon([(0,0),(1,0),(1,1),(0,1)]),
+					Polygon([(1,0),(3,0),(3,0.5),(1,1)]),
+					Polygon([(0,0),(3,0),(3,3),(0,3)], [[(1,1),(2,1),(2,2),(1,2)]]),
+					Polygon([(0,0),(3,0),(3,3),(0,3)], [[(1,1),(2,1),(2,2),(1,2)]])]
+		positions = [Point((-1, 0)), Point((2, 0.2)), Point((1.5, 1.5)), Point((2.5, 2.5))]
+
+		costs = chi.compute_many(polygons=polygons, positions=positions)
+		self.assertEqual(list(costs), [chi._compute_metric(polygon, position) for polygon, position in zip(polygons, positions)])
+		self.assertEqual(list(chi.compute_many(polygons=[], positions=[])), [])
+		self.assertRaises(ValueError, chi.compute_many, polygons=polygons, positions=positions[:1])
+
+		cache = chi.enable_cache()
+		chi.compute(polygon=polygons[1], initialPosition=positions[1])
+		self.assertEqual(list(chi.compute_many(polygons=polygons, positions=positions)), list(costs))
+		self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+	def test_polygonArrays(self):
+		polygons = [Polygon([(0,0),(1,0),(1,1),(0,1)]),
+					Polygon(),
+					Polygon([(0,0),(3,0),(3,3),(0,3)], [[(1,1),(2,1),(2,2),(1,2)], [(0.2,0.2),(0.8,0.2),(0.8,0.8)]]),
+					Polygon([(0.1,0.3),(5.7,0.9),(4.3,4.1),(2.2,1.9),(0.3,3.3)])]
+		points = [Point((0.5, 3)), Point((0, 0)), Point((1.5, 1.5)), Point((2.2, 1.8))]
+
+		self.assertEqual(list(polygon_areas(polygons)), [polygon.area for polygon in polygons])
+		self.assertEqual(list(polygon_distances(polygons, points)), [polygon.distance(point) for polygon, point in zip(polygons, points)])
+
+		# A long ring among short ones is summed in its own group
+		polygons = polygons + [Point((3, 3)).buffer(2, 500)]
+		self.assertEqual(list(polygon_areas(polygons)), [polygon.area for polygon in polygons])
+
+	def test_perimetersAndReflexAngles(self):
+		polygons = [Polygon([(0,0),(3,0),(3,3),(2,3),(2,1),(1,1),(1,3),(0,3)]),
+					Polygon([(0,0),(3,0),(3,3),(0,3)], [[(1,1),(1,2),(2,2),(2,1)]]),
+					Polygon([(0,0),(1,0),(0,1)]),
+					Polygon()]
+
+		self.assertEqual(list(polygon_perimeters(polygons)), [polygon.length for polygon in polygons])
+		numpy.testing.assert_allclose(polygon_reflex_angles(polygons), [numpy.pi, 2*numpy.pi, 0, 0])
+
+	def test_lowerBounds(self):
+		polygons = [Polygon([(0,0),(10,0),(10,1),(0,1)]),
+					Polygon([(0,0),(10,0),(10,10),(0,10)], [[(2,2),(8,2),(8,8),(2,8)]]),
+					Polygon([(0,0),(8,0),(8,8),(0,8)]),
+					Polygon([(0,0),(8,0),(8,8),(6,8),(6,2),(2,2),(2,8),(0,8)]),
+					Polygon([(0.1,0.3),(5.7,0.9),(4.3,4.1),(2.2,1.9),(0.3,3.3)])]
+		positions = [Point((0, 0)), Point((20, 3))]
+
+		for metric in [ChiMetric(radius=0.5, linearPenalty=1, angularPenalty=1),
+					   ChiMetric(radius=0.5, linearPenalty=1, angularPenalty=1, contourLevelStep=4)]:
+			bounds = metric.compute_lower_bounds(polygons=polygons, positions=positions)
+			for i, polygon in enumerate(polygons):
+				for j, position in enumerate(positions):
+					self.assertLessEqual(bounds[i, j], metric.compute(polygon, position))
+
+		# Area minus perimeter times depth stays positive for the first 4 levels of the square
+		metric = ChiMetric(radius=0.5, linearPenalty=1, angularPenalty=1)
+		self.assertAlmostEqual(metric.compute_lower_bounds(polygons=polygons[2:3], positions=positions[:1])[0, 0],
+							   64/0.5 + 360*4, places=3)
+
+	def test_measureBounds(self):
+		polygons = [Polygon([(0,0),(10,0),(10,1),(0,1)]),
+					Polygon([(0,0),(8,0),(8,8),(6,8),(6,2),(2,2),(2,8),(0,8)])]
+		positions = [Point((0, 0)), Point((4, 5))]
+		metric = ChiMetric(radius=0.5, linearPenalty=1, angularPenalty=1)
+
+		# With the exact measures only F1 differs, it uses the distance to the box
+		bounds = metric.compute_measure_bounds(areas=[10, 40], perimeters=[22, 44], reflexAngles=[0, numpy.pi],
+											   numRings=[1, 1], boxes=[polygon.bounds for polygon in polygons],
+											   positions=positions)
+		exactBounds = metric.compute_lower_bounds(polygons=polygons, positions=positions)
+		self.assertTrue((bounds <= exactBounds + 1e-9).all())
+		self.assertAlmostEqual(bounds[0, 0], exactBounds[0, 0], places=6)
+		self.assertAlmostEqual(exactBounds[1, 1] - bounds[1, 1], 2*2.0, places=6)
+
+		raster = RasterChiMetric(radius=0.5, linearPenalty=1, angularPenalty=1)
+		bounds = raster.compute_measure_bounds(areas=[10], perimeters=[22], reflexAngles=[0], numRings=[1],
+											   boxes=[polygons[0].bounds], positions=positions)
+		self.assertTrue(numpy.isneginf(bounds).all())
+
+	def test_computeAssignmentsCached(self):
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0)
+		cache = chi.enable_cache()
+		P = Polygon([(0,0),(1,0),(1,1),(0,1)])
+
+		chi.compute(polygon=P, initialPosition=Point((-1, 0)))
+		costs = chi.compute_assignments(polygons=[P], positions=[Point((-1, 0)), Point((0, 0))])
+		self.assertEqual(costs, [[1812.0, 1810.0]])
+		self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+# Test suite for the metric cache
+class metricCacheTest(unittest.TestCase):
+
+	def test_fingerprint(self):
+		P = Polygon([(0,0),(1,0),(1,1),(0,1)])
+		self.assertEqual(fingerprint(P), fingerprint(Polygon([(0,0),(1,0),(1,1+1e-12),(0,1)])))
+		self.assertNotEqual(fingerprint(P), fingerprint(Polygon([(0,0),(1,0),(1,1.001),(0,1)])))
+		self.assertNotEqual(fingerprint(P), fingerprint(Polygon([(0,0),(1,0),(1,1),(0,1)], [[(0.2,0.2),(0.8,0.2),(0.8,0.8)]])))
+		self.assertNotEqual(fingerprint(Point((0,0))), fingerprint(Polygon()))
+
+	def test_cachedCompute(self):
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0)
+		cache = chi.enable_cache(maxSize=2)
+		P = Polygon([(0,0),(1,0),(1,1),(0,1)])
+		c = Point((-1, 0))
+
+		self.assertEqual(chi.compute(polygon=P, initialPosition=c), 1812.0)
+		self.assertEqual(chi.compute(polygon=Polygon(P.exterior), initialPosition=Point((-1, 0))), 1812.0)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+		# Different position and parameters are different entries
+		chi.compute(polygon=P, initialPosition=Point((0, 0)))
+		chi.angularPenalty = 2.0
+		self.assertEqual(chi.compute(polygon=P, initialPosition=c), 1812.0 + 5*360.0)
+		self.assertEqual((cache.hits, cache.misses), (1, 3))
+		self.assertEqual(len(cache), 2)
+
+		self.assertEqual(cache.invalidate(P), 2)
+		self.assertEqual(len(cache), 0)
+		self.assertEqual(cache.stats()['hitRate'], 0.25)
+
+		chi.disable_cache()
+		chi.compute(polygon=P, initialPosition=c)
+		self.assertEqual(cache.misses, 3)
+
+	def test_sharedTerms(self):
+		P = Polygon([(0,0),(3,0),(3,3),(2,3),(2,1),(1,1),(1,3),(0,3)])
+		c = Point((-1, 0))
+		cache = MetricCache()
+
+		for linearPenalty, angularPenalty in [(1.0, 1.0), (2.0, 0.5)]:
+			chi = ChiMetric(radius=0.1, linearPenalty=linearPenalty, angularPenalty=angularPenalty)
+			expected = chi.compute(polygon=P, initialPosition=c)
+			expectedAssignments = chi.compute_assignments(polygons=[P], positions=[c, Point((5, 5))])
+
+			chi.enable_terms_cache(cache=cache)
+			self.assertEqual(chi.compute(polygon=P, initialPosition=c), expected)
+			self.assertEqual(chi.compute_assignments(polygons=[P], positions=[c, Point((5, 5))]), expectedAssignments)
+
+		# Terms were computed once, for the first metric
+		self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+		# Terms depend on the radius
+		chi = ChiMetric(radius=0.2, linearPenalty=1.0, angularPenalty=1.0)
+		chi.enable_terms_cache(cache=cache)
+		chi.compute(polygon=P, initialPosition=c)
+		self.assertEqual(len(cache), 2)
+
+	def test_lruEviction(self):
+		cache = MetricCache(maxSize=2)
+		cache.get('a', lambda: 1)
+		cache.get('b', lambda: 2)
+		cache.get('a', lambda: 3)
+		cache.get('c', lambda: 4)
+		self.assertEqual(sorted(cache.key2Value.keys()), ['a', 'c'])
+		self.assertEqual(cache.get('a', lambda: 5), 1)
+
+
+# Test suite for the persistent metric cache
+class diskCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'metric.db')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_persistence(self):
+		P = Polygon([(0,0),(3,0),(3,3),(2,3),(2,1),(1,1),(1,3),(0,3)])
+		c = Point((-1, 0))
+
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0)
+		expected = chi.compute(polygon=P, initialPosition=c)
+
+		with DiskCache(self.path) as cache:
+			chi.enable_cache(cache=cache)
+			self.assertEqual(chi.compute(polygon=P, initialPosition=c), expected)
+			self.assertEqual(cache.misses, 1)
+
+		with DiskCache(self.path) as cache:
+			chi.enable_cache(cache=cache)
+			self.assertEqual(chi.compute(polygon=Polygon(P.exterior), initialPosition=c), expected)
+			self.assertEqual((cache.hits, cache.misses), (1, 0))
+			self.assertEqual(cache.invalidate(P), 1)
+
+	def test_version(self):
+		with DiskCache(self.path, version='a') as cache:
+			cache.put('key', [1, 2])
+		with DiskCache(self.path, version='a') as cache:
+			self.assertEqual(cache.lookup('key'), [1, 2])
+		with DiskCache(self.path, version='b') as cache:
+			self.assertEqual(len(cache), 0)
+
+		self.assertNotEqual(source_version([chi]), source_version([chi, raster]))
+
+	def test_eviction(self):
+		with DiskCache(self.path, maxSize=2, version='a') as cache:
+			cache.put('a', 1)
+			cache.put('b', 2)
+			cache.lookup('a')
+			cache.put('c', 3)
+		with DiskCache(self.path, maxSize=2, version='a') as cache:
+			self.assertEqual([cache.lookup(key) for key in ['a', 'b', 'c']], [1, None, 3])
+
+
+# Test suite for the rasterised chi metric
+class rasterTest(unittest.TestCase):
+
+	def test_components(self):
+		ring = numpy.zeros((5, 5), dtype=bool)
+		ring[1:4, 1:4] = True
+		ring[2, 2] = False
+		self.assertEqual((count_components(ring), euler_number(ring)), (1, 0))
+
+		diagonal = numpy.zeros((3, 4), dtype=bool)
+		diagonal[0, 0] = diagonal[1, 1] = diagonal[0, 3] = True
+		self.assertEqual((count_components(diagonal), euler_number(diagonal)), (2, 2))
+		self.assertEqual(count_components(numpy.zeros((2, 2), dtype=bool)), 0)
+
+	def test_rasterise(self):
+		P = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)], [[(0.2, 0.2), (0.8, 0.2), (0.8, 0.8), (0.2, 0.8)]])
+		inside, distance = rasterise(P, 0.1)
+		self.assertEqual(inside.shape, (10, 10))
+		self.assertEqual(inside.sum(), 64)
+		self.assertAlmostEqual(distance[0, 0], 0.05)
+		self.assertAlmostEqual(distance[1, 5], 0.05)
+
+	def test_rasterContours(self):
+		raster = RasterChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0)
+		chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=1.0)
+		P = Polygon([(0,0),(1,0),(1,1),(0,1)])
+		H = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)], [[(0.2, 0.2), (0.8, 0.2), (0.8, 0.8), (0.2, 0.8)]])
+		c = Point((-1, 0))
+
+		self.assertEqual(raster.compute(polygon=P, initialPosition=c), chi.compute(polygon=P, initialPosition=c))
+		self.assertEqual(raster._shape_terms(H)[1], chi._shape_terms(H)[1])
+		self.assertAlmostEqual(raster._shape_terms(H)[0], chi._shape_terms(H)[0])
+
+
 def suite():
     """
         Gather all the tests from this module in a test suite.
@@ -62,6 +388,9 @@ def suite():
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(computeNumContoursTest))
     test_suite.addTest(unittest.makeSuite(chiTest))
+    test_suite.addTest(unittest.makeSuite(metricCacheTest))
+    test_suite.addTest(unittest.makeSuite(diskCacheTest))
+    test_suite.addTest(unittest.makeSuite(rasterTest))
     return test_suite
 
 mySuit = suite()
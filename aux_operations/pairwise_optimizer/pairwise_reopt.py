@@ -5,11 +5,15 @@ from shapely.geometry import Point
 from shapely.geometry import LineString
 from shapely.ops import snap
 
+import numpy as np
 from numpy import linspace
-from itertools import product
+from itertools import compress
 
 from metrics.chi import ChiMetric
-from polygon_split.polygon_split import polygon_split
+from polygon_split.polygon_split import polygon_split_many
+from polygon_split.polygon_split import visible_chords
+from polygon_split.arc_polygon import ArcPolygon
+from instrumentation import profiling
 
 
 SNAP_TOLLERANCE = 1e-06
@@ -32,12 +36,16 @@ streamHandler.setFormatter(formatter)
 logger.setLevel(logging.DEBUG)
 
 
+@profiling.timed('pairwise.compute_pairwise_optimal')
 def compute_pairwise_optimal(polygonA=[],
 							 polygonB=[],
 							 robotAInitPos=[],
 							 robotBInitPos=[],
 							 metric=[],
 							 nrOfSamples=100,
+							 screeningMetric=None,
+							 numRescored=10,
+							 candidateCache=None,
 ):
 	"""
 	Takes two adjacent polygons and attempts to modify the shared edge such that
@@ -53,6 +61,12 @@ def compute_pairwise_optimal(polygonA=[],
 		robotBInitPos: Location of robot B as Shapely Point.
 		metric: An instance of metric that will be used to comptue cost of cuts.
 		nrOfSamples: Samppling density to be used in the search for optimal cut.
+		screeningMetric: Optional cheaper metric, e.g. RasterChiMetric. If given, all
+			cuts are scored with it first and only the numRescored best are scored with
+			metric. The result may differ from the exhaustive search, see screening_report().
+		numRescored: Number of cuts that pass the screening.
+		candidateCache: Optional MetricCache for the cuts of a pair of polygons. They do
+			not depend on the metric, so runs with different metrics can share them.
 
 	Returns:
 		Returns the cut that minimizes the maximum chi metrix. Or [] if no such
@@ -90,8 +104,10 @@ def compute_pairwise_optimal(polygonA=[],
 	# Initializae the search space as well original cost
 	polyExterior = polygonUnion.exterior
 
+	sampleDistances = linspace(0, polyExterior.length, nrOfSamples)
+
 	searchSpace = []
-	for distance in linspace(0, polyExterior.length, nrOfSamples):
+	for distance in sampleDistances:
 		solutionCandidate = polyExterior.interpolate(distance)
 		searchSpace.append((solutionCandidate.x, solutionCandidate.y))
 
@@ -103,39 +119,98 @@ def compute_pairwise_optimal(polygonA=[],
 
 	minMaxChiFinal = 10e10
 	minCandidate = []
-
-	# This search is over any two pairs of samples points on the exterior
-	# It is a very costly search.
-	for cutEdge in product(searchSpace, repeat=2):
-
-		result = polygon_split(polygonUnion, LineString(cutEdge))
-
-		if result:
-			# Resolve cell-robot assignments here.
-			# This is to avoid the issue of cell assignments that
-			# don't make any sense after polygon cut.
-			chiAP1 = metric.compute(polygon = result[0], initialPosition = robotAInitPos)
-			chiAP2 = metric.compute(polygon = result[1], initialPosition = robotAInitPos)
-			chiBP1 = metric.compute(polygon = result[0], initialPosition = robotBInitPos)
-			chiBP2 = metric.compute(polygon = result[1], initialPosition = robotBInitPos)
-
-			maxChiCases = [max(chiAP1, chiBP2),
-					  	   max(chiAP2, chiBP1)]
-
-			minMaxChi = min(maxChiCases)
-			if minMaxChi <= minMaxChiFinal:
-				minCandidate = cutEdge
-				minMaxChiFinal = minMaxChi
-
-	logger.debug("Original min max chi as: %4.2f"%initMaxChi)
-	logger.debug("Computed min max chi as: %4.2f"%minMaxChiFinal)
-	logger.debug("Cut: %s"%(minCandidate, ))
+	numUnbuilt = [0]
+
+	def split_candidates(pruneArcs=False):
+		# This search is over any two pairs of samples points on the exterior
+		# It is a very costly search.
+		# Only chords that can split the union are tried, each pair of samples once. Of the
+		# mirrored cuts the later one in the search order is kept, both give the same
+		# polygons, so ties are resolved as before.
+		visible, direct = visible_chords(polygonUnion, searchSpace)
+		rows, cols = np.nonzero(visible)
+		profiling.count('pairwise.candidates_filtered', nrOfSamples*nrOfSamples - len(rows))
+
+		# Chords inside the union split it into two arcs of its exterior. Cuts whose bound
+		# from the measures of the arcs is not below the original cost can not be chosen,
+		# they are not built.
+		if pruneArcs:
+			arcBounds = arc_lower_bounds(ArcPolygon(polygonUnion, SNAP_TOLLERANCE), sampleDistances[rows],
+										 sampleDistances[cols], metric, [robotAInitPos, robotBInitPos])
+			keep = ~direct[rows, cols] | (arcBounds < initMaxChi)
+			numUnbuilt[0] = len(rows) - keep.sum()
+			rows, cols = rows[keep], cols[keep]
+
+		cutEdges = [(searchSpace[i], searchSpace[j]) for i, j in zip(rows, cols)]
+		valid, results = polygon_split_many(polygonUnion, cutEdges)
+
+		return zip(compress(cutEdges, valid), results)
+
+	# Cached candidates do not depend on the metric and screening ranks all of them, so
+	# only the exact search skips the cuts that can not be chosen.
+	if candidateCache is None:
+		candidates = split_candidates(pruneArcs=not screeningMetric)
+	else:
+		key = candidateCache.key(('pairwise.candidates', nrOfSamples), polygonA=polygonA, polygonB=polygonB)
+		candidates = candidateCache.get(key, split_candidates)
+
+	numCandidates = nrOfSamples*nrOfSamples
+	numRejected = numCandidates - len(candidates) - numUnbuilt[0]
+
+	if screeningMetric:
+		candidates = screen_candidates(candidates, robotAInitPos, robotBInitPos, screeningMetric, numRescored)
+
+	# Lower bounds on the min max chi of every cut. A cut can only be chosen if its cost
+	# is at most the incumbent and below the original cost, so cuts whose bound fails
+	# either test are skipped without changing the result. Cuts are tried in the order of
+	# their bounds, a good incumbent is found early and prunes most of the others.
+	lowerBounds = metric.compute_lower_bounds(polygons=[polygon for _, result in candidates for polygon in result],
+											  positions=[robotAInitPos, robotBInitPos])
+	minMaxBounds = min_max_costs(lowerBounds.reshape(len(candidates), 2, 2))
+	order = np.argsort(minMaxBounds, kind='mergesort')
+	minIdx = -1
+	numPruned = 0
+
+	for rank, idx in enumerate(order):
+		minMaxBound = minMaxBounds[idx]
+		if minMaxBound > minMaxChiFinal or minMaxBound >= initMaxChi:
+			numPruned = len(order) - rank
+			break
+
+		cutEdge, result = candidates[idx]
+
+		# Resolve cell-robot assignments here.
+		# This is to avoid the issue of cell assignments that
+		# don't make any sense after polygon cut.
+		costs = metric.compute_assignments(polygons = result, positions = [robotAInitPos, robotBInitPos])
+		(chiAP1, chiBP1), (chiAP2, chiBP2) = costs
+
+		maxChiCases = [max(chiAP1, chiBP2),
+				  	   max(chiAP2, chiBP1)]
+
+		# Of cuts with the same cost the last one in the search order is chosen
+		minMaxChi = min(maxChiCases)
+		if minMaxChi < minMaxChiFinal or (minMaxChi == minMaxChiFinal and idx > minIdx):
+			minCandidate = cutEdge
+			minResult = result
+			minMaxChiFinal = minMaxChi
+			minIdx = idx
+
+	profiling.count('pairwise.candidates_tried', numCandidates)
+	profiling.count('pairwise.candidates_rejected', numRejected)
+	profiling.count('pairwise.candidates_pruned', numPruned + numUnbuilt[0])
+	profiling.count('pairwise.candidates_unbuilt', numUnbuilt[0])
+
+	logger.debug("Original min max chi as: %4.2f", initMaxChi)
+	logger.debug("Computed min max chi as: %4.2f", minMaxChiFinal)
+	logger.debug("Cut: %s", minCandidate)
+	logger.debug("Pruned %d of %d cuts", numPruned, len(candidates))
 
 	if initMaxChi <= minMaxChiFinal:
 		logger.debug("No cut results in minimum altitude")
 		return []
 
-	newPolygons = polygon_split(polygonUnion, LineString(minCandidate))
+	newPolygons = minResult
 
 	# Snap the new polygons to the boundary of old union.
 	# This is to preserve the boundary.
@@ -145,6 +220,144 @@ def compute_pairwise_optimal(polygonA=[],
 	return processedPolygon1, processedPolygon2
 
 
+def min_max_costs(costs=[]):
+	"""
+	Min max cost of cuts, from the costs of covering their polygons by either robot or from
+	lower bounds on them.
+
+	Args:
+		costs: An (n, 2, 2) array, costs[i, j, k] is the cost of polygon j of cut i covered
+			by robot k.
+	Returns:
+		A numpy array with the cost of the better assignment of the robots to the polygons
+		of every cut.
+	"""
+
+	return np.minimum(np.maximum(costs[:, 0, 0], costs[:, 1, 1]),
+					  np.maximum(costs[:, 1, 0], costs[:, 0, 1]))
+
+
+def arc_lower_bounds(arcPolygon=[],
+					 startDistances=[],
+					 endDistances=[],
+					 metric=[],
+					 positions=[]):
+	"""
+	Lower bounds on the min max cost of the cuts along chords inside a polygon, from the
+	measures of their sides without building them.
+
+	Args:
+		arcPolygon: ArcPolygon of the polygon.
+		startDistances: Distances of the first ends of the chords along the exterior.
+		endDistances: Distances of the second ends along the exterior.
+		metric: An instance of metric that will be used to comptue cost of cuts.
+		positions: Locations of both robots as Shapely Points.
+	Returns:
+		A numpy array with the bound of every cut.
+	"""
+
+	if not len(startDistances):
+		return np.zeros(0)
+
+	areas, perimeters, reflexAngles, boxes = arcPolygon.sides(startDistances, endDistances)
+	bounds = metric.compute_measure_bounds(areas=areas.ravel(), perimeters=perimeters.ravel(),
+										   reflexAngles=reflexAngles.ravel(), numRings=np.ones(areas.size),
+										   boxes=boxes.reshape(-1, 4), positions=positions)
+
+	return min_max_costs(bounds.reshape(len(startDistances), 2, 2))
+
+
+def screen_candidates(candidates=[],
+					  robotAInitPos=[],
+					  robotBInitPos=[],
+					  screeningMetric=[],
+					  numRescored=10):
+	"""
+	Keeps the cuts with the lowest min max cost according to a cheap metric.
+
+	Args:
+		candidates: A list of (cutEdge, (polygon1, polygon2)) tuples.
+		robotAInitPos: Location of robot A as Shapely Point.
+		robotBInitPos: Location of robot B as Shapely Point.
+		screeningMetric: An instance of metric used to rank the cuts.
+		numRescored: Number of cuts to keep.
+	Returns:
+		The numRescored best candidates, in their original order so that ties are
+		resolved the same way as in the exhaustive search.
+	"""
+
+	if len(candidates) <= numRescored:
+		return candidates
+
+	with profiling.timer('pairwise.screen_candidates'):
+		polygons = [polygon for _, result in candidates for polygon in result]
+		costs = np.array(screeningMetric.compute_assignments(polygons=polygons,
+															 positions=[robotAInitPos, robotBInitPos]))
+
+		# costs[i, j, k]: cost of polygon j of cut i covered by robot k
+		costs = costs.reshape(len(candidates), 2, 2)
+		minMaxChi = min_max_costs(costs)
+
+		keep = np.sort(np.argsort(minMaxChi, kind='mergesort')[:numRescored])
+
+	profiling.count('pairwise.candidates_screened_out', len(candidates) - numRescored)
+
+	return [candidates[idx] for idx in keep]
+
+
+def screening_report(cases=[],
+					 metric=[],
+					 screeningMetric=[],
+					 numRescored=10,
+					 nrOfSamples=100):
+	"""
+	Measures how often screening changes the cut chosen by compute_pairwise_optimal.
+
+	Args:
+		cases: A list of (polygonA, polygonB, robotAInitPos, robotBInitPos) tuples.
+		metric: An instance of metric used for the exact search.
+		screeningMetric: An instance of metric used for screening.
+		numRescored: Number of cuts that pass the screening.
+		nrOfSamples: Samppling density to be used in the search for optimal cut.
+	Returns:
+		A dictionary with the number of cases, the number of cases where both searches
+		chose the same cut, found a different cut and where only the exhaustive search
+		found an improving cut. maxChiIncrease is the largest increase of the min max
+		cost of the chosen cut, measured with metric.
+	"""
+
+	report = {'cases': 0, 'sameCut': 0, 'differentCut': 0, 'missedCut': 0, 'maxChiIncrease': 0.0}
+
+	def min_max_chi(result, robotAInitPos, robotBInitPos):
+		(chiAP1, chiBP1), (chiAP2, chiBP2) = metric.compute_assignments(polygons=result,
+																		positions=[robotAInitPos, robotBInitPos])
+		return min(max(chiAP1, chiBP2), max(chiAP2, chiBP1))
+
+	for polygonA, polygonB, robotAInitPos, robotBInitPos in cases:
+		exact = compute_pairwise_optimal(polygonA, polygonB, robotAInitPos, robotBInitPos,
+										 metric=metric, nrOfSamples=nrOfSamples)
+		screened = compute_pairwise_optimal(polygonA, polygonB, robotAInitPos, robotBInitPos,
+											metric=metric, nrOfSamples=nrOfSamples,
+											screeningMetric=screeningMetric, numRescored=numRescored)
+
+		report['cases'] += 1
+
+		if not exact and not screened:
+			report['sameCut'] += 1
+		elif not screened:
+			report['missedCut'] += 1
+		elif [polygon.wkb for polygon in exact] == [polygon.wkb for polygon in screened]:
+			report['sameCut'] += 1
+		else:
+			report['differentCut'] += 1
+
+			increase = (min_max_chi(screened, robotAInitPos, robotBInitPos) -
+						min_max_chi(exact, robotAInitPos, robotBInitPos))
+			report['maxChiIncrease'] = max(report['maxChiIncrease'], increase)
+
+	return report
+
+
 if __name__ == '__main__':
 
 	chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
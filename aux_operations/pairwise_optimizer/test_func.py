@@ -1,5 +1,7 @@
 import unittest
 
+import numpy
+
 from shapely.geometry import Point
 from shapely.geometry import Polygon
 from shapely.geometry import LineString
@@ -7,8 +9,16 @@ from shapely.geometry import LineString
 from matplotlib import pyplot
 from descartes.patch import PolygonPatch
 
+from pairwise_reopt import arc_lower_bounds
 from pairwise_reopt import compute_pairwise_optimal
+from pairwise_reopt import min_max_costs
+from pairwise_reopt import screen_candidates
+from pairwise_reopt import screening_report
 from metrics.chi import ChiMetric
+from metrics.chi import RasterChiMetric
+from polygon_split.arc_polygon import ArcPolygon
+from polygon_split.polygon_split import polygon_split_many
+from polygon_split.polygon_split import visible_chords
 
 def plot_coords(ax, ob):
     x, y = ob.xy
@@ -202,12 +212,70 @@ class pairwiseOptimalTest(unittest.TestCase):
 		pyplot.show()
 
 
+class screeningTest(unittest.TestCase):
+	def setUp(self):
+		self.chi = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+		self.raster = RasterChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+
+		self.P1 = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)], [])
+		self.P2 = Polygon([(1, 0), (2, 0), (2, 1), (1, 1)], [])
+		self.initA = Point((-10, 0))
+		self.initB = Point((2, 1))
+
+	def test_screenCandidates(self):
+		P = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+		candidates = [(i, (P, Polygon([(0, 0), (i, 0), (i, 1), (0, 1)]))) for i in [3, 1, 2, 1]]
+		kept = screen_candidates(candidates, Point((0, 0)), Point((0, 0)), self.chi, numRescored=2)
+		self.assertEqual([cutEdge for cutEdge, _ in kept], [1, 1])
+		self.assertEqual(screen_candidates(candidates, Point((0, 0)), Point((0, 0)), self.chi, numRescored=4), candidates)
+
+	def test_screenedSearch(self):
+		exact = compute_pairwise_optimal(self.P1, self.P2, self.initA, self.initB, self.chi, nrOfSamples=20)
+		screened = compute_pairwise_optimal(self.P1, self.P2, self.initA, self.initB, self.chi, nrOfSamples=20,
+											screeningMetric=self.raster, numRescored=400)
+		self.assertTrue(exact)
+		self.assertEqual([polygon.wkb for polygon in exact], [polygon.wkb for polygon in screened])
+
+	def test_prunedSearch(self):
+		unbounded = ChiMetric(radius=0.1, linearPenalty=1.0, angularPenalty=10*1.0/360)
+		unbounded._lower_bounds = lambda polygons, positions: numpy.full((len(polygons), len(positions)), -numpy.inf)
+		unbounded._measure_bounds = lambda areas, perimeters, reflexAngles, numRings, boxes, positions: \
+			numpy.full((len(areas), len(positions)), -numpy.inf)
+
+		pruned = compute_pairwise_optimal(self.P1, self.P2, self.initA, self.initB, self.chi, nrOfSamples=20)
+		exhaustive = compute_pairwise_optimal(self.P1, self.P2, self.initA, self.initB, unbounded, nrOfSamples=20)
+		self.assertTrue(pruned)
+		self.assertEqual([polygon.wkb for polygon in pruned], [polygon.wkb for polygon in exhaustive])
+
+	def test_arcLowerBounds(self):
+		P = Polygon([(0, 0), (2, 0), (2, 1), (1.2, 1), (1, 0.6), (0.8, 1), (0, 1)])
+		distances = numpy.linspace(0, P.exterior.length, 20)
+		searchSpace = [(P.exterior.interpolate(distance).x, P.exterior.interpolate(distance).y) for distance in distances]
+
+		visible, direct = visible_chords(P, searchSpace)
+		rows, cols = numpy.nonzero(direct)
+		positions = [self.initA, self.initB]
+		bounds = arc_lower_bounds(ArcPolygon(P), distances[rows], distances[cols], self.chi, positions)
+
+		valid, results = polygon_split_many(P, [(searchSpace[i], searchSpace[j]) for i, j in zip(rows, cols)])
+		self.assertTrue(valid.all())
+		costs = numpy.array([self.chi.compute_assignments(polygons=result, positions=positions) for result in results])
+		self.assertTrue((bounds <= min_max_costs(costs)).all())
+
+	def test_screeningReport(self):
+		report = screening_report([(self.P1, self.P2, self.initA, self.initB)], self.chi, self.raster,
+								  numRescored=5, nrOfSamples=20)
+		self.assertEqual(report['cases'], 1)
+		self.assertEqual(report['sameCut'] + report['differentCut'] + report['missedCut'], 1)
+
+
 def suite():
     """
         Gather all the tests from this module in a test suite.
     """
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(pairwiseOptimalTest))
+    test_suite.addTest(unittest.makeSuite(screeningTest))
     return test_suite
 
 mySuit = suite()
@@ -0,0 +1,217 @@
+import numpy as np
+
+from canonical import canonical_rings
+
+
+class ArcPolygon:
+	"""
+	Exterior of a polygon parameterised by the distance along it from its first vertex, as
+	used by exterior.interpolate().
+
+	Prefix sums of the shoelace terms, edge lengths and reflex angles along the exterior and
+	sparse tables of the vertex coordinates are computed once. A chord between two points
+	of the exterior that lies inside the polygon splits it into the two arcs between its
+	ends, each closed by the chord. The area, perimeter, reflex angles and bounding box of
+	both sides of any such chord then take a constant number of operations and no polygon
+	has to be built.
+	"""
+
+	def __init__(self, polygon, tolerance=1e-6):
+		"""
+		Params:
+			polygon: A valid shapely polygon or CanonicalPolygon, distances are measured along
+				its exterior as it is stored.
+			tolerance: Distance within which points are snapped to vertices, as in
+				polygon_split().
+		"""
+
+		rings = canonical_rings(polygon)
+		exterior = rings[0]
+		numVertices = len(exterior)
+
+		# Coordinates relative to the first vertex keep the shoelace terms small
+		self.origin = exterior[0]
+		self.tolerance = tolerance
+		self.numVertices = numVertices
+
+		vertices = exterior - self.origin
+		nextVertices = np.roll(vertices, -1, axis=0)
+		edges = nextVertices - vertices
+		edgeLengths = np.sqrt((edges*edges).sum(axis=1))
+		crossTerms = vertices[:, 0]*nextVertices[:, 1] - nextVertices[:, 0]*vertices[:, 1]
+
+		self.orientation = 1.0 if crossTerms.sum() >= 0 else -1.0
+		self.area = abs(crossTerms.sum())/2.0
+		self.length = edgeLengths.sum()
+
+		# Arcs may run past the first vertex, the exterior is repeated three times
+		self.vertices = np.tile(vertices, (3, 1))
+		self.edges = np.tile(edges, (3, 1))
+		self.edgeLengths = np.tile(edgeLengths, 3)
+		self.cumLengths = np.r_[0.0, np.cumsum(self.edgeLengths)]
+		self.cumCrossTerms = np.r_[0.0, np.cumsum(np.tile(crossTerms, 3))]
+		self.cumReflexAngles = np.r_[0.0, np.cumsum(np.tile(_reflex_angles(exterior, False), 3))]
+
+		self.minTable = self._sparse_table(np.minimum)
+		self.maxTable = self._sparse_table(np.maximum)
+
+		holes = rings[1:]
+		self.holeArea = sum(abs(_signed_area(hole)) for hole in holes)
+		self.holePerimeter = sum(_perimeter(hole) for hole in holes)
+		self.holeReflexAngles = sum(_reflex_angles(hole, True).sum() for hole in holes)
+
+	def sides(self, startDistances=[], endDistances=[]):
+		"""
+		Measures both sides of the chords between the points at startDistances[i] and
+		endDistances[i] along the exterior.
+
+		The first side is the arc from the start forward to the end, the second one the
+		rest of the exterior. The measures bound those of the pieces polygon_split() returns
+		for the chords that lie inside the polygon, whose ends may be snapped to vertices
+		within tolerance: areas from below, perimeters and reflex angles from above and the
+		boxes contain the pieces. Holes are not assigned to a side, the area of all holes is
+		taken from both sides and their perimeters and angles are added to both.
+
+		Params:
+			startDistances: Distances of the first ends of the chords along the exterior.
+			endDistances: Distances of the second ends along the exterior.
+		Returns:
+			(areas, perimeters, reflexAngles, boxes): (n, 2) arrays, one column per side, and
+			an (n, 2, 4) array of (minX, minY, maxX, maxY) boxes.
+		"""
+
+		startIdx, startOffsets, startPoints = self._locate(np.asarray(startDistances, dtype=np.float64))
+		endIdx, endOffsets, endPoints = self._locate(np.asarray(endDistances, dtype=np.float64))
+
+		# Walk forward from the start, the end may lie behind the first vertex
+		behind = (endIdx < startIdx) | ((endIdx == startIdx) & (endOffsets < startOffsets))
+		endIdx = endIdx + self.numVertices*behind
+
+		chords = endPoints - startPoints
+		chordLengths = np.sqrt((chords*chords).sum(axis=1))
+
+		# Shoelace sum of the first side: start, vertices startIdx + 1 to endIdx, end
+		firstVertices = self.vertices[startIdx + 1]
+		lastVertices = self.vertices[endIdx]
+		twiceSignedAreas = (_cross(startPoints, firstVertices) +
+							self.cumCrossTerms[endIdx] - self.cumCrossTerms[startIdx + 1] +
+							_cross(lastVertices, endPoints) +
+							_cross(endPoints, startPoints))
+		firstAreas = np.clip(self.orientation*twiceSignedAreas/2.0, 0.0, self.area)
+		areas = np.column_stack([firstAreas, self.area - firstAreas])
+
+		firstArcs = self.cumLengths[endIdx] + endOffsets - self.cumLengths[startIdx] - startOffsets
+		arcs = np.column_stack([firstArcs, self.length - firstArcs])
+		perimeters = arcs + chordLengths[:, np.newaxis]
+
+		# Vertices at the ends of the chord keep at most their reflex angle in either side
+		firstReflexAngles = self.cumReflexAngles[endIdx + 2] - self.cumReflexAngles[startIdx]
+		secondReflexAngles = self.cumReflexAngles[startIdx + self.numVertices + 2] - self.cumReflexAngles[endIdx]
+		reflexAngles = np.column_stack([firstReflexAngles, secondReflexAngles])
+
+		endPointBoxes = np.column_stack([np.minimum(startPoints, endPoints), np.maximum(startPoints, endPoints)])
+		boxes = np.stack([self._merge_boxes(endPointBoxes, startIdx + 1, endIdx),
+						  self._merge_boxes(endPointBoxes, endIdx + 1, startIdx + self.numVertices)], axis=1)
+
+		# Snapped ends move by at most tolerance along the boundary
+		slack = self.tolerance*(chordLengths + self.tolerance)
+		areas = areas - slack[:, np.newaxis] - self.holeArea
+		perimeters = perimeters + 4*self.tolerance + self.holePerimeter
+		reflexAngles = reflexAngles + self.holeReflexAngles
+		boxes = boxes + np.array([-1.0, -1.0, 1.0, 1.0])*self.tolerance
+		boxes[:, :, :2] += self.origin
+		boxes[:, :, 2:] += self.origin
+
+		return areas, perimeters, reflexAngles, boxes
+
+	def _locate(self, distances):
+		"""
+		Edges, offsets along them and points at the given distances along the exterior,
+		relative to the first vertex. Points within tolerance of a vertex are snapped to it.
+		"""
+
+		distances = np.clip(distances, 0.0, self.length)
+		distances = np.where(distances >= self.length - self.tolerance, 0.0, distances)
+
+		idx = np.clip(np.searchsorted(self.cumLengths[:self.numVertices + 1], distances, side='right') - 1,
+					  0, self.numVertices - 1)
+		offsets = distances - self.cumLengths[idx]
+
+		toNext = self.edgeLengths[idx] - offsets <= self.tolerance
+		idx = np.where(toNext, (idx + 1) % self.numVertices, idx)
+		offsets = np.where(toNext | (offsets <= self.tolerance), 0.0, offsets)
+
+		points = self.vertices[idx] + self.edges[idx]*(offsets/self.edgeLengths[idx])[:, np.newaxis]
+
+		return idx, offsets, points
+
+	def _sparse_table(self, function):
+		"""
+		Rows k hold function over vertices [i, i + 2**k) of the repeated exterior.
+		"""
+
+		table = [self.vertices]
+		span = 1
+		while 2*span <= len(self.vertices):
+			previous = table[-1]
+			table.append(function(previous[:-span], previous[span:]))
+			span *= 2
+
+		return table
+
+	def _merge_boxes(self, boxes, firstIdx, lastIdx):
+		"""
+		Extends boxes by the vertices firstIdx to lastIdx, inclusive, where there are any.
+		"""
+
+		hasVertices = lastIdx >= firstIdx
+		lastIdx = np.maximum(lastIdx, firstIdx)
+		levels = np.floor(np.log2(lastIdx - firstIdx + 1)).astype(np.int64)
+
+		mins = np.empty((len(firstIdx), 2))
+		maxs = np.empty((len(firstIdx), 2))
+		for level in np.unique(levels):
+			rows = np.flatnonzero(levels == level)
+			minTable = self.minTable[level]
+			maxTable = self.maxTable[level]
+			secondIdx = lastIdx[rows] - 2**level + 1
+			mins[rows] = np.minimum(minTable[firstIdx[rows]], minTable[secondIdx])
+			maxs[rows] = np.maximum(maxTable[firstIdx[rows]], maxTable[secondIdx])
+
+		merged = boxes.copy()
+		merged[hasVertices, :2] = np.minimum(boxes[hasVertices, :2], mins[hasVertices])
+		merged[hasVertices, 2:] = np.maximum(boxes[hasVertices, 2:], maxs[hasVertices])
+
+		return merged
+
+
+def _cross(first, second):
+	return first[:, 0]*second[:, 1] - second[:, 0]*first[:, 1]
+
+
+def _signed_area(ring):
+	nextRing = np.roll(ring, -1, axis=0)
+	return (ring[:, 0]*nextRing[:, 1] - nextRing[:, 0]*ring[:, 1]).sum()/2.0
+
+
+def _perimeter(ring):
+	edges = np.roll(ring, -1, axis=0) - ring
+	return np.sqrt((edges*edges).sum(axis=1)).sum()
+
+
+def _reflex_angles(ring, isHole):
+	"""
+	Interior angle - pi at the reflex vertices of a ring, 0 at the others, measured from
+	the side of the polygon.
+	"""
+
+	incoming = ring - np.roll(ring, 1, axis=0)
+	outgoing = np.roll(ring, -1, axis=0) - ring
+	turns = np.arctan2(incoming[:, 0]*outgoing[:, 1] - incoming[:, 1]*outgoing[:, 0], (incoming*outgoing).sum(axis=1))
+
+	# Orient turns so that the polygon lies to the left of the ring
+	ringSign = 1.0 if _signed_area(ring) >= 0 else -1.0
+	if isHole:
+		ringSign = -ringSign
+
+	return np.maximum(-turns*ringSign, 0.0)
@@ -0,0 +1,155 @@
+import numpy as np
+
+from shapely.geometry import Polygon
+
+from chord_split import polygon_rings
+from chord_split import ring_edges
+
+
+class CanonicalPolygon:
+	"""
+	Polygon in canonical form backed by arrays.
+
+	The exterior is counter-clockwise and the holes are clockwise, orientations are decided
+	by the signed area. Rings are read-only (n, 2) float64 arrays without the closing
+	vertex, reorienting or slicing them gives views and polygons can share them.
+
+	Indexing follows the list form used elsewhere, P[0] is the exterior and P[1] the list
+	of holes. A polygon read from shapely keeps the shapely object and to_shapely() returns
+	it, other polygons build theirs once. Objects with a __geo_interface__, e.g. the
+	descartes patches, accept it as they accept shapely polygons.
+	"""
+
+	def __init__(self, exterior=[], holes=[], polygon=None):
+		"""
+		Params:
+			exterior: Vertices of the exterior in either orientation, closed or not.
+			holes: A list of the vertices of the holes.
+			polygon: Shapely polygon with the same rings, if there is one already.
+		"""
+
+		self.exterior = _oriented_ring(exterior, True)
+		self.holes = [_oriented_ring(hole, False) for hole in holes]
+		self._polygon = polygon
+		self._edges = None
+
+	@classmethod
+	def from_shapely(cls, polygon):
+		"""
+		Reads the rings of a shapely polygon from its WKB, see chord_split.polygon_rings().
+		"""
+
+		rings = polygon_rings(polygon)
+		if not rings:
+			return cls(polygon=polygon)
+
+		return cls(rings[0], rings[1:], polygon)
+
+	def to_shapely(self):
+		if self._polygon is None:
+			if len(self.exterior):
+				self._polygon = Polygon(self.exterior, self.holes)
+			else:
+				self._polygon = Polygon()
+
+		return self._polygon
+
+	@property
+	def rings(self):
+		"""
+		List of the rings, exterior first, as returned by chord_split.polygon_rings().
+		"""
+
+		return [self.exterior] + self.holes
+
+	@property
+	def edges(self):
+		"""
+		Edges of all rings, see chord_split.ring_edges(). Computed once.
+		"""
+
+		if self._edges is None:
+			self._edges = ring_edges(self.rings)
+
+		return self._edges
+
+	@property
+	def is_empty(self):
+		return not len(self.exterior)
+
+	@property
+	def is_valid(self):
+		return self.to_shapely().is_valid
+
+	@property
+	def area(self):
+		return sum([_signed_area(ring) for ring in self.rings]) if len(self.exterior) else 0.0
+
+	@property
+	def bounds(self):
+		if not len(self.exterior):
+			return ()
+
+		minX, minY = self.exterior.min(axis=0)
+		maxX, maxY = self.exterior.max(axis=0)
+
+		return (minX, minY, maxX, maxY)
+
+	@property
+	def __geo_interface__(self):
+		if not len(self.exterior):
+			return {'type': 'Polygon', 'coordinates': ()}
+
+		return {'type': 'Polygon',
+				'coordinates': tuple([np.concatenate([ring, ring[:1]]).tolist() for ring in self.rings])}
+
+	def __nonzero__(self):
+		return not self.is_empty
+
+	__bool__ = __nonzero__
+
+	def __len__(self):
+		return 2
+
+	def __getitem__(self, idx):
+		return (self.exterior, self.holes)[idx]
+
+	def __iter__(self):
+		return iter((self.exterior, self.holes))
+
+
+def canonical_rings(polygon):
+	"""
+	Rings of a shapely or canonical polygon, exterior first. Rings of a shapely polygon keep
+	their orientation, see chord_split.polygon_rings().
+	"""
+
+	if isinstance(polygon, CanonicalPolygon):
+		return polygon.rings
+
+	return polygon_rings(polygon)
+
+
+def _signed_area(ring):
+	"""
+	Shoelace area relative to the first vertex, positive for counter-clockwise rings.
+	"""
+
+	relative = ring - ring[0]
+	nextRelative = np.roll(relative, -1, axis=0)
+
+	return (relative[:, 0]*nextRelative[:, 1] - nextRelative[:, 0]*relative[:, 1]).sum()/2.0
+
+
+def _oriented_ring(ring, counterClockwise):
+	ring = np.asarray(ring, dtype=np.float64).reshape(-1, 2).view()
+
+	if len(ring) > 1 and (ring[0] == ring[-1]).all():
+		ring = ring[:-1]
+
+	if len(ring) > 2 and (_signed_area(ring) > 0) != counterClockwise:
+		ring = ring[::-1]
+
+	ring.flags.writeable = False
+
+	return ring
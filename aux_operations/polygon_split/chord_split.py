@@ -0,0 +1,460 @@
+import struct
+
+import numpy as np
+
+# How split_rings() handles a chord, _DIRECT chords split the polygon without crossing
+# its boundary, they lie inside it
+_FALLBACK = 0
+_REJECTED = 1
+_SPLIT = 2
+_DIRECT = 3
+
+
+def polygon_rings(polygon):
+	"""
+	Reads the rings of a polygon from its WKB.
+
+	Params:
+		polygon: Shapely polygon object.
+
+	Returns:
+		A list of (n, 2) arrays, exterior first. The closing vertex and repeated vertices of
+		a ring are dropped.
+	"""
+
+	data = polygon.wkb
+	byteOrder = '<' if data[0:1] == b'\x01' else '>'
+	geometryType, numRings = struct.unpack_from(byteOrder + 'II', data, 1)
+	numDims = 3 if geometryType & 0x80000000 else 2
+
+	rings = []
+	offset = 9
+	for _ in range(numRings):
+		numPoints, = struct.unpack_from(byteOrder + 'I', data, offset)
+		ring = np.frombuffer(data, byteOrder + 'f8', numDims*numPoints, offset + 4).reshape(numPoints, numDims)
+		offset += 4 + 8*numDims*numPoints
+
+		ring = ring[:, :2].astype(np.float64)
+		rings.append(ring[:-1][(ring[1:] != ring[:-1]).any(axis=1)])
+
+	return rings
+
+
+def ring_edges(rings=[]):
+	"""
+	Edges of all rings of a polygon.
+
+	Returns:
+		(starts, ends): (m, 2) arrays. Edge i of the exterior goes from its vertex i to vertex
+		i+1, edges of the interiors follow.
+	"""
+
+	starts = np.concatenate(rings)
+	ends = np.concatenate([np.concatenate([ring[1:], ring[:1]]) for ring in rings])
+
+	return starts, ends
+
+
+def split_rings(rings=[], start=[], end=[], tolerance=1e-6, edges=None):
+	"""
+	Splits a polygon along the chord from start to end.
+
+	Handles the common case: both ends of the chord lie on the exterior, each on a single
+	edge or vertex within tolerance, the chord crosses the exterior cleanly everywhere else
+	and stays clear of the interiors. The parts of the chord inside the polygon then run
+	between consecutive boundary points. A single such part splits the polygon in two,
+	none or several do not split it into exactly two polygons.
+
+	Params:
+		rings: Rings of the polygon as returned by polygon_rings().
+		start: First end of the chord.
+		end: Second end of the chord.
+		tolerance: Distance within which points are considered to be on the boundary.
+		edges: Result of ring_edges(rings), if already computed.
+
+	Returns:
+		(rings1, rings2): The rings of both parts, exterior first, if the chord splits the
+		polygon in two. [] if it does not. None if the chord touches the boundary in any
+		other way, these chords need the general overlay.
+	"""
+
+	return split_rings_many(rings, [start], [end], tolerance, edges)[0]
+
+
+def split_rings_many(rings=[], chordStarts=[], chordEnds=[], tolerance=1e-6, edges=None):
+	"""
+	Splits a polygon along many chords, see split_rings().
+
+	The ends of the chords are located once per distinct point and the tests that decide
+	how a chord is handled are evaluated for all chords at once. Only the chords that split
+	the polygon are walked one by one.
+
+	Params:
+		rings: Rings of the polygon as returned by polygon_rings().
+		chordStarts: A list of first ends of the chords.
+		chordEnds: A list of second ends of the chords.
+		tolerance: Distance within which points are considered to be on the boundary.
+		edges: Result of ring_edges(rings), if already computed.
+
+	Returns:
+		A list with the result of split_rings() for every chord.
+	"""
+
+	if not len(chordStarts):
+		return []
+
+	if edges is None:
+		edges = ring_edges(rings)
+	starts, ends = edges
+
+	a = np.array([point[:2] for point in chordStarts], dtype=np.float64)
+	b = np.array([point[:2] for point in chordEnds], dtype=np.float64)
+	status, splitChords = _test_chords(rings[0], starts, ends, a, b, tolerance, withCrossings=True)
+
+	results = [None]*len(status)
+	for idx in np.flatnonzero(status == _REJECTED):
+		results[idx] = []
+	for idx, splitChord in zip(np.flatnonzero(status >= _SPLIT), splitChords):
+		results[idx] = _split_chord(rings, starts, ends, *splitChord)
+
+	return results
+
+
+def chord_visibility(rings=[], points=[], tolerance=1e-6, edges=None):
+	"""
+	Tests the chords between all pairs of points on the exterior at once, e.g. the samples
+	tried as cuts.
+
+	Every pair of distinct points is tested once, as the chord from points[i] to points[j]
+	with i > j. Of identical points only the last one is used.
+
+	Params:
+		rings: Rings of the polygon as returned by polygon_rings().
+		points: A list of n points on the exterior.
+		tolerance: Distance within which points are considered to be on the boundary.
+		edges: Result of ring_edges(rings), if already computed.
+
+	Returns:
+		(visible, direct): (n, n) boolean arrays. visible is True at [i, j] with i > j if the
+		chord can split the polygon in two. It is False for the pairs split_rings() rejects:
+		the ends share an edge or the chord does not have exactly one part inside the
+		polygon, e.g. it leaves a non-convex polygon or runs along the boundary. Chords
+		through holes and other degenerate chords stay True, they are left to the overlay.
+		direct is True for the visible chords that lie inside the polygon, they split it
+		into the two arcs of the exterior between their ends.
+	"""
+
+	numPoints = len(points)
+	visible = np.zeros((numPoints, numPoints), dtype=bool)
+	direct = np.zeros((numPoints, numPoints), dtype=bool)
+	if numPoints < 2:
+		return visible, direct
+
+	if edges is None:
+		edges = ring_edges(rings)
+	starts, ends = edges
+
+	points = np.array([point[:2] for point in points], dtype=np.float64)
+
+	point2Idx = {}
+	for idx, point in enumerate(map(tuple, points)):
+		point2Idx[point] = idx
+	isLast = np.zeros(numPoints, dtype=bool)
+	isLast[point2Idx.values()] = True
+
+	rows, cols = np.tril_indices(numPoints, -1)
+	keep = isLast[rows] & isLast[cols]
+	rows, cols = rows[keep], cols[keep]
+
+	status, _ = _test_chords(rings[0], starts, ends, points[rows], points[cols], tolerance)
+	visible[rows, cols] = status != _REJECTED
+	direct[rows, cols] = status == _DIRECT
+
+	return visible, direct
+
+
+def _test_chords(exterior, starts, ends, a, b, tolerance, withCrossings=False):
+	"""
+	Decides how split_rings() handles the chords from a[i] to b[i].
+
+	Returns:
+		(status, splitChords): status holds _FALLBACK, _REJECTED, _SPLIT or _DIRECT for every
+		chord. With withCrossings, splitChords holds the arguments of _split_chord() after
+		the rings and edges for every chord that splits the polygon, otherwise it is None.
+	"""
+
+	numChords = len(a)
+	numVertices = len(exterior)
+	status = np.full(numChords, _FALLBACK, dtype=np.int8)
+
+	# Chords usually share their ends, locate every point once
+	point2Idx = {}
+	pointIdx = np.array([point2Idx.setdefault(point, len(point2Idx)) for point in map(tuple, np.concatenate([a, b]))])
+	points = np.empty((len(point2Idx), 2))
+	points[point2Idx.values()] = point2Idx.keys()
+	locations = _locate(exterior, starts[:numVertices], ends[:numVertices], points, tolerance)
+
+	located = np.array([location is not None for location in locations])
+	vertexIdx = np.array([location[0] if location else 0 for location in locations])
+	isVertex = np.array([bool(location and location[1]) for location in locations])
+	active = np.flatnonzero(located[pointIdx[:numChords]] & located[pointIdx[numChords:]])
+
+	startIdx = vertexIdx[pointIdx[active]]
+	endIdx = vertexIdx[pointIdx[numChords + active]]
+	startIsVertex = isVertex[pointIdx[active]]
+	endIsVertex = isVertex[pointIdx[numChords + active]]
+
+	# Edges the ends of the chord were located on, two for a vertex
+	startEdges = np.stack([np.where(startIsVertex, (startIdx - 1) % numVertices, startIdx), startIdx], axis=1)
+	endEdges = np.stack([np.where(endIsVertex, (endIdx - 1) % numVertices, endIdx), endIdx], axis=1)
+
+	# Both ends on the same edge, the chord runs along the boundary
+	sharesEdge = (startEdges[:, :, np.newaxis] == endEdges[:, np.newaxis, :]).any(axis=(1, 2))
+
+	# Snapped ends sit exactly on the vertex
+	a = np.where(startIsVertex[:, np.newaxis], exterior[startIdx], a[active])
+	b = np.where(endIsVertex[:, np.newaxis], exterior[endIdx], b[active])
+
+	chord = b - a
+	chordLengths = np.sqrt((chord*chord).sum(axis=1))
+
+	status[active[sharesEdge | (chordLengths == 0.0)]] = _REJECTED
+
+	keep = ~sharesEdge & (chordLengths != 0.0)
+	active, a, b, chord, chordLengths = active[keep], a[keep], b[keep], chord[keep], chordLengths[keep]
+	startEdges, endEdges = startEdges[keep], endEdges[keep]
+	if not len(active):
+		return status, [] if withCrossings else None
+
+	direction = ends - starts
+	edgeLengths = np.sqrt((direction*direction).sum(axis=1))
+
+	# Signed distances of the edge ends from the chord lines and of the chord ends from the
+	# edge lines, one row per chord and one column per edge
+	ax = a[:, 0:1]
+	ay = a[:, 1:2]
+	bx = b[:, 0:1]
+	by = b[:, 1:2]
+	chordX = chord[:, 0:1]
+	chordY = chord[:, 1:2]
+	lengths = chordLengths[:, np.newaxis]
+
+	edgeStartSides = (chordX*(starts[:, 1] - ay) - chordY*(starts[:, 0] - ax))/lengths
+	edgeEndSides = (chordX*(ends[:, 1] - ay) - chordY*(ends[:, 0] - ax))/lengths
+	startSides = (direction[:, 0]*(ay - starts[:, 1]) - direction[:, 1]*(ax - starts[:, 0]))/edgeLengths
+	endSides = (direction[:, 0]*(by - starts[:, 1]) - direction[:, 1]*(bx - starts[:, 0]))/edgeLengths
+
+	crosses = (edgeStartSides*edgeEndSides < 0) & (startSides*endSides < 0)
+	closest = np.minimum(np.minimum(np.abs(edgeStartSides), np.abs(edgeEndSides)),
+						 np.minimum(np.abs(startSides), np.abs(endSides)))
+
+	# The ends of the chord are on the edges they were located on
+	rows = np.arange(len(active))[:, np.newaxis]
+	checked = np.ones(crosses.shape, dtype=bool)
+	checked[rows, startEdges] = False
+	checked[rows, endEdges] = False
+
+	crosses &= checked
+	isClose = checked & (closest <= tolerance)
+
+	# Crossings close to a vertex or an end of the chord are degenerate
+	degenerate = (crosses & isClose).any(axis=1)
+
+	# Other edges may only come close to the chord if they are close to its line
+	nearRows, nearCols = np.nonzero(~crosses & isClose)
+	nearDistances = _segment_distances(starts[nearCols], ends[nearCols], a[nearRows], b[nearRows])
+	degenerate[nearRows[nearDistances <= tolerance]] = True
+
+	# Chords crossing the interiors
+	degenerate |= crosses[:, numVertices:].any(axis=1)
+
+	# Boundary points along the chord, the chord alternates between inside and outside
+	with np.errstate(divide='ignore', invalid='ignore'):
+		crossingParams = ((starts[:, 0] - ax)*direction[:, 1] - (starts[:, 1] - ay)*direction[:, 0])/\
+						 (chordX*direction[:, 1] - chordY*direction[:, 0])
+	crossingParams = np.where(crosses, crossingParams, np.inf)
+
+	numCrossings = crosses.sum(axis=1)
+	firstParams = np.where(numCrossings > 0, crossingParams.min(axis=1), 1.0)
+	firstInside = _contains(starts, ends, a + chord*(firstParams/2.0)[:, np.newaxis])
+
+	# Exactly one part of the chord inside
+	splits = np.where(firstInside, numCrossings <= 1, (numCrossings >= 1) & (numCrossings <= 2))
+
+	status[active[~degenerate & ~splits]] = _REJECTED
+	status[active[~degenerate & splits]] = np.where(numCrossings[~degenerate & splits] == 0, _DIRECT, _SPLIT)
+	if not withCrossings:
+		return status, None
+
+	splitChords = []
+	for row in np.flatnonzero(~degenerate & splits):
+		idx = active[row]
+		crossingIdx = np.flatnonzero(crosses[row])
+		crossingIdx = crossingIdx[np.argsort(crossingParams[row, crossingIdx])]
+		splitChords.append((a[row], b[row], locations[pointIdx[idx]], locations[pointIdx[numChords + idx]],
+							crossingIdx, firstInside[row]))
+
+	return status, splitChords
+
+
+def _split_chord(rings, starts, ends, a, b, startLocation, endLocation, crossingIdx, firstInside):
+	"""
+	Rings of both parts of a polygon split by the only inside part of a chord.
+	"""
+
+	exterior = rings[0]
+	numVertices = len(exterior)
+
+	locations = [startLocation] + [(int(idx), False) for idx in crossingIdx] + [endLocation]
+	part = 0 if firstInside else 1
+
+	fromLocation = locations[part]
+	toLocation = locations[part + 1]
+	fromPoint = a if part == 0 else _intersection(a, b, starts[fromLocation[0]], ends[fromLocation[0]])
+	toPoint = b if part + 1 == len(locations) - 1 else _intersection(a, b, starts[toLocation[0]], ends[toLocation[0]])
+
+	exterior1 = _walk(exterior, fromLocation, fromPoint, toLocation, toPoint)
+	exterior2 = _walk(exterior, toLocation, toPoint, fromLocation, fromPoint)
+	if len(exterior1) < 3 or len(exterior2) < 3:
+		return None
+
+	rings1 = [exterior1]
+	rings2 = [exterior2]
+	if len(rings) > 1:
+		starts1, ends1 = ring_edges([exterior1])
+		holeInside = _contains(starts1, ends1, np.array([hole[0] for hole in rings[1:]]))
+		for hole, isInside in zip(rings[1:], holeInside):
+			if isInside:
+				rings1.append(hole)
+			else:
+				rings2.append(hole)
+
+	# The part that continues from the first vertex of the polygon comes first
+	if _leaves_first_vertex(toLocation, fromLocation, numVertices):
+		return rings2, rings1
+
+	return rings1, rings2
+
+
+def _locate(ring, starts, ends, points, tolerance):
+	"""
+	Finds the vertex or the edge of the ring each of the points lies on.
+
+	Returns:
+		A list with (idx, True) for vertex idx or (idx, False) for the edge from vertex idx to
+		the next one per point. None for points that are not on the ring or are close to more
+		than one vertex or edge.
+	"""
+
+	delta = ring[np.newaxis] - points[:, np.newaxis]
+	nearVertices = (delta*delta).sum(axis=2) <= tolerance*tolerance
+	nearEdges = _point_segment_distances(points[:, np.newaxis], starts, ends) <= tolerance
+
+	locations = []
+	for vertexRow, edgeRow in zip(nearVertices, nearEdges):
+		vertexIdx = np.flatnonzero(vertexRow)
+		edgeIdx = np.flatnonzero(edgeRow)
+		if len(vertexIdx) == 1:
+			locations.append((int(vertexIdx[0]), True))
+		elif len(vertexIdx) == 0 and len(edgeIdx) == 1:
+			locations.append((int(edgeIdx[0]), False))
+		else:
+			locations.append(None)
+
+	return locations
+
+
+def _point_segment_distances(points, starts, ends):
+	"""
+	Distances between points and segments of non-zero length, either may be a single one.
+	"""
+
+	direction = ends - starts
+	t = np.clip(((points - starts)*direction).sum(axis=-1)/(direction*direction).sum(axis=-1), 0.0, 1.0)
+
+	delta = points - (starts + t[..., np.newaxis]*direction)
+	return np.sqrt((delta*delta).sum(axis=-1))
+
+
+def _segment_distances(starts, ends, a, b):
+	"""
+	Distances between segments that do not cross and the segment from a to b.
+	"""
+
+	return np.minimum(np.minimum(_point_segment_distances(starts, a, b), _point_segment_distances(ends, a, b)),
+					  np.minimum(_point_segment_distances(a, starts, ends), _point_segment_distances(b, starts, ends)))
+
+
+def _contains(starts, ends, points):
+	"""
+	Crossing number test of points against the edges of all rings.
+	"""
+
+	px = points[:, 0:1]
+	py = points[:, 1:2]
+
+	spans = (starts[:, 1] > py) != (ends[:, 1] > py)
+	ascending = ends[:, 1] > starts[:, 1]
+
+	# A spanning edge crosses the ray towards +x if the point lies left of it going up
+	sides = (px - starts[:, 0])*(ends[:, 1] - starts[:, 1]) - (py - starts[:, 1])*(ends[:, 0] - starts[:, 0])
+	crossings = spans & ((sides < 0) == ascending)
+
+	return crossings.sum(axis=1) % 2 == 1
+
+
+def _intersection(p1, p2, q1, q2):
+	"""
+	Intersection point of two crossing segments, computed like GEOS does: in homogeneous
+	coordinates, relative to the centre of the overlap of their envelopes.
+	"""
+
+	low = np.maximum(np.minimum(p1, p2), np.minimum(q1, q2))
+	high = np.minimum(np.maximum(p1, p2), np.maximum(q1, q2))
+	centre = (low + high)/2.0
+
+	p1 = p1 - centre
+	p2 = p2 - centre
+	q1 = q1 - centre
+	q2 = q2 - centre
+
+	px = p1[1] - p2[1]
+	py = p2[0] - p1[0]
+	pw = p1[0]*p2[1] - p2[0]*p1[1]
+	qx = q1[1] - q2[1]
+	qy = q2[0] - q1[0]
+	qw = q1[0]*q2[1] - q2[0]*q1[1]
+
+	w = px*qy - qx*py
+	return np.array([(py*qw - qy*pw)/w, (qx*pw - px*qw)/w]) + centre
+
+
+def _walk(ring, fromLocation, fromPoint, toLocation, toPoint):
+	"""
+	Vertices of the ring from one end of a cut forward to the other one, both ends included.
+	"""
+
+	numVertices = len(ring)
+	first = (fromLocation[0] + 1) % numVertices
+	last = toLocation[0] - 1 if toLocation[1] else toLocation[0]
+
+	numBetween = (last - first + 1) % numVertices
+	between = ring[(first + np.arange(numBetween)) % numVertices]
+
+	return np.concatenate([fromPoint[np.newaxis], between, toPoint[np.newaxis]])
+
+
+def _leaves_first_vertex(fromLocation, toLocation, numVertices):
+	"""
+	True if the walk from fromLocation to toLocation leaves vertex 0 along the exterior.
+	"""
+
+	if fromLocation == (0, True):
+		return True
+	if toLocation == (0, True):
+		return False
+
+	first = (fromLocation[0] + 1) % numVertices
+	last = toLocation[0] - 1 if toLocation[1] else toLocation[0]
+
+	return (-first) % numVertices < (last - first + 1) % numVertices
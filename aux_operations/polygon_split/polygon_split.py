@@ -5,10 +5,18 @@ from shapely.geometry import MultiPoint
 from shapely.geometry import Polygon
 from shapely.geometry import LineString
 from shapely.geometry import MultiLineString
-from shapely.geometry import LinearRing
 from shapely.ops import split
 from shapely.ops import snap
 
+import numpy as np
+
+from instrumentation import profiling
+from chord_split import chord_visibility
+from chord_split import polygon_rings
+from chord_split import split_rings
+from chord_split import split_rings_many
+from canonical import CanonicalPolygon
+
 SNAP_TOLLERANCE = 1e-06
 
 # Configure logging properties for this module
@@ -58,41 +66,33 @@ def convert_to_canonical(P=[]):
 	"""Convertion function to convert from shapely object to canonical form.
 
 	Args:
-		P: Shapely object representing a polygon.
+		P: Shapely object representing a polygon or a polygon in canonical form.
 
 	Returns:
-		poly: A polygon represented in canonical form. [] otherwise.
+		poly: A CanonicalPolygon, see canonical.py. [] otherwise.
 	"""
 
+	if isinstance(P, CanonicalPolygon):
+		return P
+
 	if type(P) is not Polygon:
 		logger.warn("Polygon conversion requested but wrong input specified.")
 		return []
 
-	poly = [[], []]
-
-	if not LinearRing(P.exterior.coords).is_ccw:
-		poly[0] = list(P.exterior.coords)[::-1][:-1]
-	else:
-		poly[0] = list(P.exterior.coords)[:-1]
-
-	for hole in P.interiors:
-
-		if LinearRing(hole.coords).is_ccw:
-			poly[1].append(list(hole.coords)[::-1][:-1])
-		else:
-			poly[1].append(list(hole.coords)[:-1])
-
-	return poly
+	return CanonicalPolygon.from_shapely(P)
 
 
+@profiling.timed('polygon_split')
 def polygon_split(polygon=[], splitLine=[]):
-	"""Split a polygon into two other polygons along splitLine. This is a wrapper for
-	    Shapely split function.
+	"""Split a polygon into two other polygons along splitLine.
 
-	Attempts to split a polygon into two other polygons.
+	Attempts to split a polygon into two other polygons. Chords with both ends on the
+	exterior, within SNAP_TOLLERANCE, that do not touch the boundary anywhere else are
+	split by walking the rings, see chord_split.split_rings(). Other chords go through
+	Shapely split function.
 
 	Args:
-		polygon: Shapely polygon object.
+		polygon: Shapely polygon object or CanonicalPolygon.
 		splitLine: Shapely LineString object.
 
 	Returns:
@@ -104,6 +104,114 @@ def polygon_split(polygon=[], splitLine=[]):
 	if not splitLine or not polygon or not polygon.is_valid or len(splitLine.coords) != 2:
 		return []
 
+	polygon, rings, edges = _read_polygon(polygon)
+	start, end = splitLine.coords
+	result = split_rings(rings, start, end, SNAP_TOLLERANCE, edges)
+
+	if result is None:
+		profiling.count('polygon_split.fallback')
+		return _overlay_split(polygon, splitLine)
+
+	if not result:
+		profiling.count('polygon_split.rejected')
+		return []
+
+	return tuple(Polygon(rings[0], rings[1:]) for rings in result)
+
+
+@profiling.timed('polygon_split_many')
+def polygon_split_many(polygon=[], chords=[]):
+	"""Split a polygon along each of many chords.
+
+	Gives the same results as calling polygon_split() for every chord. The polygon is
+	checked and read once and the chords are tested together, see
+	chord_split.split_rings_many().
+
+	Args:
+		polygon: Shapely polygon object or CanonicalPolygon.
+		chords: A list of (start, end) pairs of points.
+
+	Returns:
+		(valid, results): valid is a boolean numpy array, True for the chords that split the
+		polygon into two polygons. results is a list with the pair of polygons of every
+		valid chord, in the order of the chords.
+	"""
+
+	valid = np.zeros(len(chords), dtype=bool)
+	results = []
+
+	if not len(chords) or not polygon or not polygon.is_valid:
+		return valid, results
+
+	polygon, rings, edges = _read_polygon(polygon)
+	splits = split_rings_many(rings, [start for start, _ in chords], [end for _, end in chords],
+							  SNAP_TOLLERANCE, edges)
+
+	numFallbacks = 0
+	numRejected = 0
+	for idx, (chord, rings) in enumerate(zip(chords, splits)):
+		if rings is None:
+			numFallbacks += 1
+			result = _overlay_split(polygon, LineString(chord))
+		elif not rings:
+			numRejected += 1
+			result = []
+		else:
+			result = tuple(Polygon(pieceRings[0], pieceRings[1:]) for pieceRings in rings)
+
+		if result:
+			valid[idx] = True
+			results.append(result)
+
+	profiling.count('polygon_split.fallback', numFallbacks)
+	profiling.count('polygon_split.rejected', numRejected)
+
+	return valid, results
+
+
+@profiling.timed('visible_chords')
+def visible_chords(polygon=[], points=[]):
+	"""Find the pairs of points on the exterior whose chord can split the polygon.
+
+	Cheap prefilter for polygon_split_many(). The chords between all pairs of points are
+	tested at once without splitting the polygon, see chord_split.chord_visibility().
+
+	Args:
+		polygon: Shapely polygon object or CanonicalPolygon.
+		points: A list of n points on the exterior of the polygon.
+
+	Returns:
+		(visible, direct): (n, n) boolean numpy arrays. visible is True at [i, j] with i > j
+		if the chord from points[i] to points[j] can split the polygon, each pair of distinct
+		points is listed once. direct is True for the visible chords that lie inside the
+		polygon, see arc_polygon.ArcPolygon for their sides.
+	"""
+
+	if not len(points) or not polygon or not polygon.is_valid:
+		return np.zeros((len(points), len(points)), dtype=bool), np.zeros((len(points), len(points)), dtype=bool)
+
+	_, rings, edges = _read_polygon(polygon)
+
+	return chord_visibility(rings, points, SNAP_TOLLERANCE, edges)
+
+
+def _read_polygon(polygon):
+	"""
+	Shapely polygon, rings and edges of a shapely polygon or CanonicalPolygon. Edges are
+	only kept by canonical polygons, they are None for shapely ones.
+	"""
+
+	if isinstance(polygon, CanonicalPolygon):
+		return polygon.to_shapely(), polygon.rings, polygon.edges
+
+	return polygon, polygon_rings(polygon), None
+
+
+def _overlay_split(polygon, splitLine):
+	"""
+	Splits the polygon with the general Shapely overlay.
+	"""
+
 	# There is a bazilion ways that the inputs can cause a failure of this method. Rather then
 	# spending all of this effort in checking the inputs, I decided to avoid inputs checking and
 	# wrap the core algorithm in a try-catch block and only check the validity of the output.
@@ -113,12 +221,14 @@ def polygon_split(polygon=[], splitLine=[]):
 		result = split(polygon, snapped)
 
 		# Only allow cuts that generate 2 polygons. TODO: Check types of resulting geometries.
-		if len(result) == 2:
-			return result
+		if len(result.geoms) == 2:
+			return tuple(result.geoms)
 		else:
+			profiling.count('polygon_split.rejected')
 			return []
 
-	except:
+	except Exception:
+		profiling.count('polygon_split.failed')
 		logger.debug("Split was not succseful. Check the validity of the inputs.")
 		return []
 
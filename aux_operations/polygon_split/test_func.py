@@ -4,6 +4,12 @@ from shapely.geometry import Polygon
 from shapely.geometry import LineString
 
 from polygon_split import polygon_split
+from polygon_split import polygon_split_many
+from polygon_split import visible_chords
+from arc_polygon import ArcPolygon
+from canonical import CanonicalPolygon
+from polygon_split import convert_to_canonical
+from polygon_split import _overlay_split
 
 # Test suite for polygon split function
 class polygonSplitTest(unittest.TestCase):
@@ -126,6 +132,188 @@ class polygonSplitTest(unittest.TestCase):
 
 	 	self.assertTrue(P1.equals(testPolygon1) and P2.equals(testPolygon2))
 
+	def test_polygonSplit_interpolatedEnds(self):
+		P = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)], [])
+		start = P.exterior.interpolate(0.3)
+		end = P.exterior.interpolate(2.9)
+		result = polygon_split(P, LineString([(start.x, start.y), (end.x, end.y)]))
+		self.assertTrue(result)
+		P1, P2 = result
+
+		testPolygon1 = Polygon([(0.1, 1.0), (0.0, 1.0), (0.0, 0.0), (0.3, 0.0)])
+		testPolygon2 = Polygon([(0.3, 0.0), (1.0, 0.0), (1.0, 1.0), (0.1, 1.0)])
+
+		self.assertAlmostEqual(P1.symmetric_difference(testPolygon1).area, 0.0)
+		self.assertAlmostEqual(P2.symmetric_difference(testPolygon2).area, 0.0)
+
+	def test_polygonSplit_matchesOverlay(self):
+		P = Polygon([(0, 0), (3, 1), (3, 0), (4, 1), (5, 0), (5, 1), (7, 1), (5, 2), (7, 3),
+					 (0, 4), (0, 2.5), (1, 2), (0, 1.5), (1, 1), (0, 0.5)], [[(3, 2), (3, 3), (4, 3), (4, 2)]])
+
+		from numpy import linspace
+		from itertools import product
+		searchSpace = [(P.exterior.coords[idx][0], P.exterior.coords[idx][1]) for idx in range(15)]
+		for distance in linspace(0, P.exterior.length, 20):
+			solutionCandidate = P.exterior.interpolate(distance)
+			searchSpace.append((solutionCandidate.x, solutionCandidate.y))
+
+		numCompared = 0
+		for cutEdge in product(searchSpace, repeat=2):
+			result = polygon_split(P, LineString(cutEdge))
+			expected = _overlay_split(P, LineString(cutEdge))
+			if not result or not expected:
+				continue
+
+			numCompared += 1
+			for piece, expectedPiece in zip(result, expected):
+				self.assertAlmostEqual(piece.symmetric_difference(expectedPiece).area, 0.0, places=9)
+
+		self.assertTrue(numCompared > 100)
+
+	def test_polygonSplitMany(self):
+		P = Polygon([(0, 0), (3, 1), (3, 0), (4, 1), (5, 0), (5, 1), (7, 1), (5, 2), (7, 3),
+					 (0, 4), (0, 2.5), (1, 2), (0, 1.5), (1, 1), (0, 0.5)], [[(3, 2), (3, 3), (4, 3), (4, 2)]])
+
+		from numpy import linspace
+		from itertools import product
+		searchSpace = [(P.exterior.coords[idx][0], P.exterior.coords[idx][1]) for idx in range(15)]
+		for distance in linspace(0, P.exterior.length, 20):
+			solutionCandidate = P.exterior.interpolate(distance)
+			searchSpace.append((solutionCandidate.x, solutionCandidate.y))
+
+		chords = list(product(searchSpace, repeat=2))
+		valid, results = polygon_split_many(P, chords)
+		self.assertEqual(len(valid), len(chords))
+		self.assertEqual(len(results), valid.sum())
+
+		results = iter(results)
+		for chord, isValid in zip(chords, valid):
+			expected = polygon_split(P, LineString(chord))
+			self.assertEqual(bool(expected), isValid)
+			if isValid:
+				self.assertEqual([piece.wkb for piece in next(results)], [piece.wkb for piece in expected])
+
+	def test_polygonSplitMany_invalidPolygon(self):
+		P = Polygon([(0, 0), (1, 1), (1, 0), (0, 1)], [])
+		valid, results = polygon_split_many(P, [((0.5, 0), (0.5, 1))])
+		self.assertFalse(valid.any())
+		self.assertEqual(results, [])
+
+	def test_visibleChords(self):
+		P = Polygon([(0, 0), (3, 1), (3, 0), (4, 1), (5, 0), (5, 1), (7, 1), (5, 2), (7, 3),
+					 (0, 4), (0, 2.5), (1, 2), (0, 1.5), (1, 1), (0, 0.5)], [[(3, 2), (3, 3), (4, 3), (4, 2)]])
+
+		from numpy import linspace
+		from numpy import triu
+		searchSpace = []
+		for distance in linspace(0, P.exterior.length, 30):
+			solutionCandidate = P.exterior.interpolate(distance)
+			searchSpace.append((solutionCandidate.x, solutionCandidate.y))
+
+		visible, direct = visible_chords(P, searchSpace)
+		self.assertEqual(visible.shape, (30, 30))
+		self.assertFalse(triu(visible).any())
+
+		# The first and the last sample are the same point
+		self.assertFalse(visible[:, 0].any())
+
+		numVisible = 0
+		for i in range(1, 30):
+			for j in range(1, i):
+				result = polygon_split(P, LineString([searchSpace[i], searchSpace[j]]))
+				if not visible[i, j]:
+					self.assertEqual(result, [])
+					continue
+
+				numVisible += 1
+				mirrored = polygon_split(P, LineString([searchSpace[j], searchSpace[i]]))
+				self.assertEqual(bool(result), bool(mirrored))
+
+		self.assertTrue(0 < numVisible < 30*29/2)
+
+	def test_visibleChords_mirroredCut(self):
+		P = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)], [[(0.1, 0.1), (0.1, 0.2), (0.2, 0.1)]])
+		result = polygon_split(P, LineString([(0.5, 0), (0, 0.6)]))
+		mirrored = polygon_split(P, LineString([(0, 0.6), (0.5, 0)]))
+		self.assertEqual([piece.wkb for piece in result], [piece.wkb for piece in mirrored])
+
+		visible, direct = visible_chords(P, [(0.5, 0), (0, 0.6), (0, 0.8), (0.5, 0)])
+		self.assertTrue(visible[3, 1])
+		self.assertFalse(visible[2, 1])
+		self.assertFalse(visible[1, 0])
+
+	def test_arcPolygon(self):
+		P = Polygon([(1, 1), (3, 1), (3, 2), (1, 2)], [])
+		arcPolygon = ArcPolygon(P, 0.0)
+
+		# From (2, 1) forward to (2.5, 2), and from (1.5, 2) forward past the first vertex to (1.5, 1)
+		areas, perimeters, reflexAngles, boxes = arcPolygon.sides([1, 4.5], [3.5, 0.5])
+		for i, expected in enumerate([[0.75, 1.25], [0.5, 1.5]]):
+			self.assertAlmostEqual(areas[i, 0], expected[0])
+			self.assertAlmostEqual(areas[i, 1], expected[1])
+		self.assertAlmostEqual(perimeters[0, 0], 2.5 + 1.25**0.5)
+		self.assertAlmostEqual(perimeters[1, 1], 5)
+		self.assertEqual(reflexAngles.tolist(), [[0, 0], [0, 0]])
+		self.assertEqual(boxes[0].tolist(), [[2, 1, 3, 2], [1, 1, 2.5, 2]])
+		self.assertEqual(boxes[1].tolist(), [[1, 1, 1.5, 2], [1.5, 1, 3, 2]])
+
+	def test_arcPolygon_boundsPieces(self):
+		P = Polygon([(0, 0), (3, 1), (3, 0), (4, 1), (5, 0), (5, 1), (7, 1), (5, 2), (7, 3),
+					 (0, 4), (0, 2.5), (1, 2), (0, 1.5), (1, 1), (0, 0.5)], [[(3, 2), (3, 3), (4, 3), (4, 2)]])
+
+		from numpy import linspace
+		from numpy import nonzero
+		distances = linspace(0, P.exterior.length, 30)
+		searchSpace = []
+		for distance in distances:
+			solutionCandidate = P.exterior.interpolate(distance)
+			searchSpace.append((solutionCandidate.x, solutionCandidate.y))
+
+		visible, direct = visible_chords(P, searchSpace)
+		rows, cols = nonzero(direct)
+		self.assertTrue(len(rows) > 100)
+		self.assertFalse((direct & ~visible).any())
+
+		areas, perimeters, reflexAngles, boxes = ArcPolygon(P).sides(distances[rows], distances[cols])
+		for k, (i, j) in enumerate(zip(rows, cols)):
+			pieces = polygon_split(P, LineString([searchSpace[i], searchSpace[j]]))
+			self.assertTrue(pieces)
+
+			# Either piece may hold the hole, the sides are measured against both
+			for piece in pieces:
+				minX, minY, maxX, maxY = piece.bounds
+				fits = [areas[k, side] <= piece.area and perimeters[k, side] >= piece.length and
+						boxes[k, side, 0] <= minX and boxes[k, side, 1] <= minY and
+						boxes[k, side, 2] >= maxX and boxes[k, side, 3] >= maxY for side in range(2)]
+				self.assertTrue(any(fits))
+
+	def test_canonicalPolygon(self):
+		# Clockwise exterior and counter-clockwise hole
+		P = Polygon([(0, 0), (0, 4), (4, 4), (4, 0)], [[(1, 1), (2, 1), (2, 2), (1, 2)]])
+		canonical = convert_to_canonical(P)
+
+		self.assertEqual(canonical[0].tolist(), [[4, 0], [4, 4], [0, 4], [0, 0]])
+		self.assertEqual([hole.tolist() for hole in canonical[1]], [[[1, 2], [2, 2], [2, 1], [1, 1]]])
+		self.assertEqual(canonical.area, P.area)
+		self.assertEqual(canonical.bounds, P.bounds)
+		self.assertFalse(canonical.exterior.flags.writeable)
+
+		# Converting back to shapely is free, a new polygon is built once
+		self.assertIs(canonical.to_shapely(), P)
+		self.assertIs(convert_to_canonical(canonical), canonical)
+		rebuilt = CanonicalPolygon(*canonical)
+		self.assertTrue(rebuilt.to_shapely().equals(P))
+		self.assertIs(rebuilt.to_shapely(), rebuilt.to_shapely())
+		self.assertEqual(convert_to_canonical(LineString([(0, 0), (1, 1)])), [])
+
+		# Canonical polygons are split like the shapely ones
+		P = Polygon([(0, 0), (4, 0), (4, 2), (2, 1), (0, 2)])
+		canonical = CanonicalPolygon([(0, 2), (2, 1), (4, 2), (4, 0), (0, 0), (0, 2)])
+		P1, P2 = polygon_split(canonical, LineString([(1, 0), (1, 1.5)]))
+		self.assertEqual(sorted([P1.area, P2.area]), sorted([piece.area for piece in polygon_split(P, LineString([(1, 0), (1, 1.5)]))]))
+		self.assertEqual(visible_chords(canonical, [(1, 0), (1, 1.5), (3, 1.5)])[0].tolist(),
+						 visible_chords(P, [(1, 0), (1, 1.5), (3, 1.5)])[0].tolist())
+
 	def test_stability(self):
 	 	P = Polygon([(0, 0),
 	 		  (3, 1),
@@ -52,7 +52,7 @@ def plot_polygon_outline(ax, polygon, fcIdx = 0):
 	Function will plot the ouline of polygon. No decomposition.
 	Adjust the axis as well.
 	:param ax: Axis object for redundancy
-	:param polygon: Possibly with holes
+	:param polygon: Possibly with holes, shapely or CanonicalPolygon
 	:return: None
 	"""
 
@@ -140,7 +140,7 @@ def plot_main_polygon(ax, P):
 	Function will plot the ouline of cleaning area. No decomposition.
 	Adjust the axis as well.
 	:param ax: Axis object for redundancy
-	:param polygon: Possibly with holes
+	:param polygon: Possibly with holes, shapely or CanonicalPolygon
 	:return: None
 	"""
 